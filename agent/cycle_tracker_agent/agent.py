@@ -5,8 +5,8 @@
 
 import json
 from enum import Enum
-from typing import Dict, List, Any, Optional
-from datetime import datetime, date, timedelta
+from typing import Dict, Any, Optional
+from datetime import date
 
 # LangGraph imports
 from langchain_core.runnables import RunnableConfig
@@ -15,13 +15,22 @@ from langgraph.types import Command
 
 # CopilotKit imports
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state
 
 # OpenAI imports
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, ToolMessage
+from langchain_core.messages import ToolMessage
 from copilotkit.langgraph import copilotkit_exit
 
+from shared.history import window_history
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import CONTEXT_NOTE, build_prompt_context, get_last_user_message
+from shared.prompt_layout import context_block, layout_messages
+from shared.response_cache import CacheScope
+from shared.scores import ScoreProvider
+from shared.state_emitter import emit_state
+from shared.streaming import StreamTarget, customize_config, invoke_model
+from shared.summaries import SUMMARY_FIELD, SUMMARY_RECENT_EVENTS, SummaryProvider, event
+from cycle_tracker_agent.cycle_stats import refresh_cycle_data
+
 class FlowIntensity(str, Enum):
     """月经流量强度级别"""
     LIGHT = "Light"
@@ -48,6 +57,7 @@ CYCLE_TRACKER_TOOL = {
                                 "cycle_length": {"type": ["number", "null"], "description": "周期长度（天数）"},
                                 "period_days": {
                                     "type": "array",
+                                    "description": "本次新增或修改的经期日期，无需重复提交已记录的日期",
                                     "items": {
                                         "type": "object",
                                         "properties": {
@@ -64,6 +74,7 @@ CYCLE_TRACKER_TOOL = {
                         },
                         "cycle_history": {
                             "type": "array",
+                            "description": "仅用于补录没有逐日记录的历史周期开始日期，周期长度由系统计算",
                             "items": {
                                 "type": "object",
                                 "properties": {
@@ -92,27 +103,106 @@ CYCLE_TRACKER_TOOL = {
     }
 }
 
+# 会随时间增长的记录列表，提示词中只展示计数、最近和相关条目
+CYCLE_TRACKER_COLLECTIONS = ("cycle_history", "period_log")
+
+# 只供周期统计引擎使用的字段，不放进提示词
+CYCLE_ENGINE_FIELDS = ("recorded_starts", "cycle_cache")
+
+# 周期健康评分：各规律性对应的分数（周期数不足时为70），正常平均周期长度范围
+CYCLE_REGULARITY_SCORES = {"规律": 90, "基本规律": 75, "不规律": 55}
+NORMAL_CYCLE_RANGE = (21, 35)
+
+def build_cycle_summary(cycle_data: Dict[str, Any]) -> Dict[str, Any]:
+    """周期摘要：当前周期、周期统计、预测和最近几个已结束的周期"""
+    statistics = cycle_data.get("cycle_statistics") or {}
+    predictions = cycle_data.get("predictions") or {}
+    history = cycle_data.get("cycle_history") or []
+    return {
+        "current_cycle_start": (cycle_data.get("current_cycle") or {}).get("start_date"),
+        "mean_cycle_length": statistics.get("mean_cycle_length"),
+        "cycle_length_std_dev": statistics.get("cycle_length_std_dev"),
+        "cycles_used": statistics.get("cycles_used", 0),
+        "regularity": predictions.get("cycle_regularity"),
+        "next_period_date": predictions.get("next_period_date"),
+        "next_ovulation_date": predictions.get("next_ovulation_date"),
+        "counts": {name: len(cycle_data.get(name) or []) for name in CYCLE_TRACKER_COLLECTIONS},
+        "recent_cycles": [
+            event(cycle.get("start_date"), f"{cycle['cycle_length']}天" if cycle.get("cycle_length") else None)
+            for cycle in history[-SUMMARY_RECENT_EVENTS:]
+        ],
+    }
+
+def score_cycle_summary(summary: Dict[str, Any]) -> Optional[float]:
+    """周期健康评分：按规律性评分，平均周期长度不在21-35天时扣分；还没有已结束的周期时为None"""
+    mean_length = summary.get("mean_cycle_length")
+    if mean_length is None:
+        return None
+    score = CYCLE_REGULARITY_SCORES.get(summary.get("regularity"), 70)
+    if not NORMAL_CYCLE_RANGE[0] <= mean_length <= NORMAL_CYCLE_RANGE[1]:
+        score -= 15
+    return score
+
+# 供健康洞察读取的周期摘要；引擎字段由经期记录决定，不参与版本计算
+SUMMARY_PROVIDER = SummaryProvider(CYCLE_TRACKER_COLLECTIONS, build_cycle_summary, ignored=CYCLE_ENGINE_FIELDS)
+SCORE_PROVIDER = ScoreProvider("cycle", "月经周期", score_cycle_summary)
+
 class CycleTrackerState(CopilotKitState):
     """经期追踪状态"""
     cycle_data: Optional[Dict[str, Any]] = None
 
-def calculate_average_cycle(cycle_history: List[Dict]) -> float:
-    """计算平均周期长度"""
-    if not cycle_history:
-        return 28.0  # 默认28天
-    
-    lengths = [cycle.get("cycle_length", 28) for cycle in cycle_history if cycle.get("cycle_length")]
-    return sum(lengths) / len(lengths) if lengths else 28.0
+# 生成中的经期记录按日期并入已有数据并重新推导周期，作为预览推送给前端；
+# 每个分片的中间结果不写入预测缓存，以免挤掉真实记录的预测、拉低命中率
+CYCLE_TRACKER_STREAM = StreamTarget(
+    "cycle_data",
+    "update_cycle_data",
+    "cycle_data",
+    lambda state, partial: refresh_cycle_data(state.get("cycle_data") or {}, partial, cache=False)[0],
+)
 
-def predict_next_period(current_cycle: Dict, cycle_history: List[Dict]) -> str:
-    """预测下次月经日期"""
-    if not current_cycle.get("start_date"):
-        return None
-    
-    avg_cycle = calculate_average_cycle(cycle_history)
-    start_date = datetime.strptime(current_cycle["start_date"], "%Y-%m-%d")
-    next_period = start_date + timedelta(days=int(avg_cycle))
-    return next_period.strftime("%Y-%m-%d")
+# 固定指令：每次调用逐字节相同，数据和日期放在对话末尾的当前上下文中
+CYCLE_TRACKER_INSTRUCTIONS = """你是专业的经期追踪助手，专门负责月经周期的记录和基础分析。
+
+你的核心功能：
+1. 📅 记录月经开始和结束日期
+2. 🩸 跟踪每日流量强度（轻微/中等/大量/点滴）
+3. 📊 计算周期长度和规律性
+4. 🔮 预测下次月经日期
+5. 📈 分析周期趋势
+
+流量强度选项：Light(轻微), Medium(中等), Heavy(大量), Spotting(点滴)
+
+中文翻译：
+- 轻微/轻 → Light
+- 中等/中 → Medium  
+- 大量/重 → Heavy
+- 点滴/少量 → Spotting
+
+重要指导原则：
+- 专注于经期基础数据记录，不涉及症状、运动、营养等其他方面
+- 支持中英文输入，准确理解用户描述
+- 当用户提供经期信息时，必须调用update_cycle_data工具
+- 只需提交本次新增的经期日期和流量（current_cycle.period_days）；周期历史、周期长度和预测由系统根据经期日期自动计算，不要重复提交
+- 日期格式始终使用YYYY-MM-DD
+- 今日日期见对话末尾的当前数据
+
+使用示例：
+用户说："今天月经来了，流量中等" → 记录今日为经期开始，流量Medium
+用户说："月经第3天，流量还是很大" → 记录对应日期流量Heavy
+"""
+
+def build_cycle_context(state: Dict[str, Any]) -> str:
+    """经期追踪提示词中每轮变化的部分：当前数据摘要和今日日期"""
+    try:
+        cycle_json = build_prompt_context(
+            {key: value for key, value in state["cycle_data"].items() if key not in CYCLE_ENGINE_FIELDS},
+            CYCLE_TRACKER_COLLECTIONS,
+            get_last_user_message(state.get("messages", [])),
+        )
+    except Exception as e:
+        cycle_json = f"数据序列化错误: {str(e)}"
+
+    return context_block(f"当前经期数据: {cycle_json}\n{CONTEXT_NOTE}")
 
 async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     """经期追踪流程入口点"""
@@ -133,7 +223,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
                 "cycle_regularity": "需要更多数据进行评估"
             }
         }
-        await copilotkit_emit_state(config, state)
+        await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
@@ -163,68 +253,24 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             }
         }
 
-    try:
-        cycle_json = json.dumps(state["cycle_data"], indent=2)
-    except Exception as e:
-        cycle_json = f"数据序列化错误: {str(e)}"
-    
-    system_prompt = f"""你是专业的经期追踪助手，专门负责月经周期的记录和基础分析。
-
-当前经期数据: {cycle_json}
-
-你的核心功能：
-1. 📅 记录月经开始和结束日期
-2. 🩸 跟踪每日流量强度（轻微/中等/大量/点滴）
-3. 📊 计算周期长度和规律性
-4. 🔮 预测下次月经日期
-5. 📈 分析周期趋势
-
-流量强度选项：Light(轻微), Medium(中等), Heavy(大量), Spotting(点滴)
-
-中文翻译：
-- 轻微/轻 → Light
-- 中等/中 → Medium  
-- 大量/重 → Heavy
-- 点滴/少量 → Spotting
-
-重要指导原则：
-- 专注于经期基础数据记录，不涉及症状、运动、营养等其他方面
-- 支持中英文输入，准确理解用户描述
-- 当用户提供经期信息时，必须调用update_cycle_data工具
-- 日期格式始终使用YYYY-MM-DD
-- 今日日期：{date.today().isoformat()}
-
-使用示例：
-用户说："今天月经来了，流量中等" → 记录今日为经期开始，流量Medium
-用户说："月经第3天，流量还是很大" → 记录对应日期流量Heavy
-"""
-
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "cycle_data",
-            "tool": "update_cycle_data",
-            "tool_argument": "cycle_data"
-        }],
-    )
+    config = customize_config(config, CYCLE_TRACKER_STREAM)
 
-    model_with_tools = model.bind_tools(
-        [
-            *state.get("copilotkit", {}).get("actions", []),
-            CYCLE_TRACKER_TOOL
-        ],
+    model_with_tools = get_model_with_tools(
+        [CYCLE_TRACKER_TOOL],
+        actions=state.get("copilotkit", {}).get("actions", []),
+        response_cache=CacheScope("cycle_tracker", SUMMARY_PROVIDER.version(state["cycle_data"])),
         parallel_tool_calls=False,
     )
 
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+    response = await invoke_model(model_with_tools, layout_messages(
+        "cycle_tracker",
+        CYCLE_TRACKER_INSTRUCTIONS,
+        build_cycle_context(state),
+        window_history(state.get("messages", []), config),
+    ), config, state, CYCLE_TRACKER_STREAM)
 
     messages = state.get("messages", []) + [response]
     
@@ -244,43 +290,19 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             new_cycle_data = tool_call_args["cycle_data"]
             existing_data = state.get("cycle_data", {})
             
-            # 更新经期数据
-            cycle_data = {
-                "current_cycle": existing_data.get("current_cycle", {}),
-                "cycle_history": existing_data.get("cycle_history", []),
-                "predictions": existing_data.get("predictions", {})
-            }
-            
-            # 更新当前周期
-            if "current_cycle" in new_cycle_data:
-                cycle_data["current_cycle"].update(new_cycle_data["current_cycle"])
-            
-            # 更新历史记录
-            if "cycle_history" in new_cycle_data:
-                cycle_data["cycle_history"] = new_cycle_data["cycle_history"]
-            
-            # 重新计算预测信息
-            if cycle_data["current_cycle"]:
-                cycle_data["predictions"]["next_period_date"] = predict_next_period(
-                    cycle_data["current_cycle"], 
-                    cycle_data["cycle_history"]
-                )
-                
-                # 计算排卵预测（通常在下次月经前14天）
-                if cycle_data["predictions"]["next_period_date"]:
-                    next_period = datetime.strptime(cycle_data["predictions"]["next_period_date"], "%Y-%m-%d")
-                    ovulation_date = next_period - timedelta(days=14)
-                    cycle_data["predictions"]["next_ovulation_date"] = ovulation_date.strftime("%Y-%m-%d")
+            # 经期记录按日期合并，周期、统计和预测由经期日期推导
+            cycle_data, merge_summary = refresh_cycle_data(existing_data, new_cycle_data)
+            cycle_data[SUMMARY_FIELD] = SUMMARY_PROVIDER.publish(cycle_data)
         
             tool_response = ToolMessage(
-                content="经期数据更新成功",
+                content=f"经期数据更新成功（{merge_summary.describe()}）",
                 tool_call_id=tool_call_id
             )
             
             messages = messages + [tool_response]
             
             updated_state = {**state, "cycle_data": cycle_data, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
+            await emit_state(config, updated_state, final=True)
             
             return Command(
                 goto=END,
@@ -0,0 +1,398 @@
+"""
+周期统计引擎 - 由经期记录推导周期，不再采用模型给出的周期长度
+单一职责：把每天的经期记录（period_log）分成出血段，得到每次月经的开始日期和周期长度，
+计算最近几个周期的均值/中位数/方差和规律性，预测下次月经和排卵的区间；
+已结束的周期保存在cycle_history中，新增当前周期的经期记录时只重算最后一个周期；
+统计和预测按 (当前周期开始日期, 最近周期长度) 缓存，周期没有变化的轮次直接复用
+"""
+
+import math
+import os
+import statistics
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from shared.dates import date_ordinal
+from shared.merge import LAST_WRITE_WINS, MergeSummary, collection, merge_collection_results, summarize
+from shared.versioning import REVISION_FIELD, next_revision
+
+ROLLING_CYCLES = 6             # 统计最近6个周期
+DEFAULT_CYCLE_LENGTH = 28
+DEFAULT_CYCLE_STD_DEV = 3.0    # 周期少于3个时预测区间使用的标准差
+MIN_MARGIN_DAYS = 1            # 预测区间至少前后各1天
+LUTEAL_PHASE_DAYS = 14         # 排卵日 = 下次月经前14天
+FERTILE_DAYS_BEFORE = 5        # 易孕期：排卵前5天到排卵后1天
+FERTILE_DAYS_AFTER = 1
+EPISODE_GAP_DAYS = 3           # 经期记录相隔不超过3天视为同一次出血
+MIN_CYCLE_LENGTH = 15          # 两次开始相隔更短时视为同一次经期
+MAX_CYCLE_LENGTH = 60          # 更长的周期多半有漏记，不计入统计
+CONFIDENCE_Z = 1.96            # 95%预测区间
+SPOTTING = "Spotting"          # 只有点滴出血不算月经开始
+
+# 缓存结构变化时加1，旧缓存会被整体重建
+CYCLE_STATS_SCHEMA_VERSION = 1
+
+# 经期记录按日期合并，同一天以最新的流量为准
+CYCLE_MERGE_SPECS = {
+    "period_log": collection("date", policy=LAST_WRITE_WINS),
+}
+
+NOT_ENOUGH_DATA = "需要更多数据进行评估"
+
+# 预测缓存条数（按当前周期开始日期和最近周期长度缓存，进程内所有用户共享）
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+
+_predictions: "OrderedDict[Tuple[int, Tuple[int, ...]], Tuple[Dict[str, Any], Optional[_Forecast]]]" = OrderedDict()
+_prediction_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _iso(day: int) -> str:
+    return date.fromordinal(day).isoformat()
+
+
+def _day(raw_date: Any) -> int:
+    """ISO日期转序数，无效时为0"""
+    return date_ordinal(raw_date) if isinstance(raw_date, str) else 0
+
+
+def _date_key(record: Dict[str, Any]) -> str:
+    raw_date = record.get("date")
+    return raw_date if isinstance(raw_date, str) else ""
+
+
+class _Episode:
+    """一次连续出血：last为最后一次记录的日期，start为第一次非点滴出血的日期"""
+
+    __slots__ = ("last", "start", "flows")
+
+    def __init__(self, day: int):
+        self.last = day
+        self.start: Optional[int] = None
+        self.flows: List[str] = []
+
+
+def _episodes(entries: Sequence[Tuple[int, Any]]) -> List[_Episode]:
+    episodes: List[_Episode] = []
+    for day, flow in entries:
+        if episodes and day - episodes[-1].last <= EPISODE_GAP_DAYS:
+            episode = episodes[-1]
+            episode.last = day
+        else:
+            episode = _Episode(day)
+            episodes.append(episode)
+        if episode.start is None and flow != SPOTTING:
+            episode.start = day
+        if episode.start is not None and isinstance(flow, str):
+            episode.flows.append(flow)
+    return episodes
+
+
+def _starts(episodes: Sequence[_Episode], recorded: Sequence[int]) -> List[Tuple[int, Optional[_Episode]]]:
+    """
+    月经开始日期：出血段的开始优先；补录的开始日期与出血段相隔不足MIN_CYCLE_LENGTH天时视为同一次经期。
+    """
+    kept: List[Tuple[int, Optional[_Episode]]] = []
+    for episode in episodes:
+        if episode.start is not None and (not kept or episode.start - kept[-1][0] >= MIN_CYCLE_LENGTH):
+            kept.append((episode.start, episode))
+
+    days = [day for day, _ in kept]
+    for day in recorded:
+        position = bisect_left(days, day)
+        near_before = position > 0 and day - days[position - 1] < MIN_CYCLE_LENGTH
+        near_after = position < len(days) and days[position] - day < MIN_CYCLE_LENGTH
+        if not near_before and not near_after:
+            days.insert(position, day)
+            kept.insert(position, (day, None))
+    return kept
+
+
+def _cycle(start: int, episode: Optional[_Episode], next_start: Optional[int]) -> Dict[str, Any]:
+    flows = [flow for flow in episode.flows if flow != SPOTTING] if episode else []
+    return {
+        "start_date": _iso(start),
+        "end_date": _iso(next_start - 1) if next_start is not None else None,
+        "cycle_length": next_start - start if next_start is not None else None,
+        "period_length": episode.last - start + 1 if episode else None,
+        "average_flow": Counter(flows).most_common(1)[0][0] if flows else None,
+        "source": "period_log" if episode else "recorded",
+    }
+
+
+def derive_cycles(
+    period_log: Sequence[Dict[str, Any]],
+    recorded_starts: Sequence[str] = (),
+    since: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    由按日期排序的经期记录和补录的开始日期推导周期，最后一个周期尚未结束（end_date为None）。
+
+    since不为空时只推导从该日期（必须是已知的月经开始日期）开始的周期。
+    """
+    begin = bisect_left(period_log, since, key=_date_key) if since else 0
+    lower = _day(since) if since else 0
+    entries = []
+    for record in period_log[begin:]:
+        day = _day(record.get("date"))
+        if day:
+            entries.append((day, record.get("flow_intensity")))
+    recorded = sorted({day for day in map(_day, recorded_starts) if day and day >= lower})
+
+    starts = _starts(_episodes(entries), recorded)
+    return [
+        _cycle(start, episode, starts[index + 1][0] if index + 1 < len(starts) else None)
+        for index, (start, episode) in enumerate(starts)
+    ]
+
+
+def _rolling_lengths(cycle_history: Sequence[Dict[str, Any]]) -> Tuple[int, ...]:
+    """最近ROLLING_CYCLES个已结束周期的长度（过长或过短的周期不计入）"""
+    lengths: List[int] = []
+    for cycle in reversed(cycle_history):
+        length = cycle.get("cycle_length")
+        if isinstance(length, int) and MIN_CYCLE_LENGTH <= length <= MAX_CYCLE_LENGTH:
+            lengths.append(length)
+            if len(lengths) == ROLLING_CYCLES:
+                break
+    lengths.reverse()
+    return tuple(lengths)
+
+
+def _statistics(lengths: Sequence[int]) -> Dict[str, Any]:
+    variance = statistics.variance(lengths) if len(lengths) >= 2 else None
+    if len(lengths) < 3:
+        regularity = NOT_ENOUGH_DATA
+    else:
+        # 周期长度的波动在7天以内为规律，8-9天为基本规律
+        spread = max(lengths) - min(lengths)
+        regularity = "规律" if spread <= 7 else "基本规律" if spread <= 9 else "不规律"
+    return {
+        "cycles_used": len(lengths),
+        "mean_cycle_length": round(statistics.fmean(lengths), 1) if lengths else None,
+        "median_cycle_length": statistics.median(lengths) if lengths else None,
+        "cycle_length_variance": round(variance, 2) if variance is not None else None,
+        "cycle_length_std_dev": round(math.sqrt(variance), 2) if variance is not None else None,
+        "cycle_length_range": max(lengths) - min(lengths) if lengths else None,
+        "regularity": regularity,
+    }
+
+
+def cycle_statistics(cycle_history: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """最近ROLLING_CYCLES个已结束周期的长度统计"""
+    return _statistics(_rolling_lengths(cycle_history))
+
+
+class _Forecast(NamedTuple):
+    """预测结果，日期保持为date对象，输出时再格式化"""
+    next_period: date
+    next_period_window: Tuple[date, date]
+    ovulation: date
+    fertile_window: Tuple[date, date]
+
+
+def _forecast(current_start: date, stats: Mapping[str, Any]) -> _Forecast:
+    mean = stats["mean_cycle_length"] or DEFAULT_CYCLE_LENGTH
+    std_dev = stats["cycle_length_std_dev"] if stats["cycles_used"] >= 3 else DEFAULT_CYCLE_STD_DEV
+    margin = timedelta(days=max(math.ceil(CONFIDENCE_Z * std_dev), MIN_MARGIN_DAYS))
+    next_period = current_start + timedelta(days=round(mean))
+    ovulation = next_period - timedelta(days=LUTEAL_PHASE_DAYS)
+    return _Forecast(
+        next_period,
+        (next_period - margin, next_period + margin),
+        ovulation,
+        (ovulation - margin - timedelta(days=FERTILE_DAYS_BEFORE), ovulation + margin + timedelta(days=FERTILE_DAYS_AFTER)),
+    )
+
+
+def _window(bounds: Tuple[date, date]) -> Dict[str, str]:
+    return {"start": bounds[0].isoformat(), "end": bounds[1].isoformat()}
+
+
+def _format_predictions(forecast: Optional[_Forecast], regularity: str) -> Dict[str, Any]:
+    if forecast is None:
+        return {
+            "next_period_date": None,
+            "next_period_window": None,
+            "next_ovulation_date": None,
+            "fertile_window": None,
+            "cycle_regularity": regularity,
+        }
+    return {
+        "next_period_date": forecast.next_period.isoformat(),
+        "next_period_window": _window(forecast.next_period_window),
+        "next_ovulation_date": forecast.ovulation.isoformat(),
+        "fertile_window": _window(forecast.fertile_window),
+        "cycle_regularity": regularity,
+    }
+
+
+def predict(current_start: Optional[str], stats: Mapping[str, Any]) -> Dict[str, Any]:
+    """由当前周期的开始日期和周期统计预测下次月经、排卵日和易孕期（95%区间）"""
+    day = _day(current_start)
+    forecast = _forecast(date.fromordinal(day), stats) if day else None
+    return _format_predictions(forecast, stats["regularity"])
+
+
+def prediction_fingerprint(current_start: Optional[str], cycle_history: Sequence[Dict[str, Any]]) -> Tuple[int, Tuple[int, ...]]:
+    """预测只取决于当前周期的开始日期和最近几个周期的长度，两者相同时预测必然相同"""
+    return _day(current_start), _rolling_lengths(cycle_history)
+
+
+def _compute(key: Tuple[int, Tuple[int, ...]]) -> Tuple[Dict[str, Any], Optional[_Forecast]]:
+    day, lengths = key
+    stats = _statistics(lengths)
+    return stats, _forecast(date.fromordinal(day), stats) if day else None
+
+
+def forecast_cycle(
+    current_start: Optional[str],
+    cycle_history: Sequence[Dict[str, Any]],
+    cache: bool = True,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    返回 (周期统计, 预测)，按 prediction_fingerprint 缓存。
+
+    只记录经期天数、没有新周期结束的轮次命中缓存，不再重算统计和日期。
+    cache为False时直接计算，不读写缓存也不计入命中统计（流式预览的中间结果用）。
+    返回的字典每次新建，调用方可以修改。
+    """
+    key = prediction_fingerprint(current_start, cycle_history)
+    if not cache:
+        stats, forecast = _compute(key)
+        return stats, _format_predictions(forecast, stats["regularity"])
+    cached = _predictions.get(key)
+    if cached is not None:
+        _prediction_stats["hits"] += 1
+        _predictions.move_to_end(key)
+    else:
+        _prediction_stats["misses"] += 1
+        cached = _compute(key)
+        _predictions[key] = cached
+        if len(_predictions) > PREDICTION_CACHE_SIZE:
+            _predictions.popitem(last=False)
+            _prediction_stats["evictions"] += 1
+    stats, forecast = cached
+    return dict(stats), _format_predictions(forecast, stats["regularity"])
+
+
+def prediction_cache_stats() -> Dict[str, Any]:
+    """返回预测缓存的命中统计"""
+    lookups = _prediction_stats["hits"] + _prediction_stats["misses"]
+    return {
+        **_prediction_stats,
+        "size": len(_predictions),
+        "hit_rate": _prediction_stats["hits"] / lookups if lookups else 0.0,
+    }
+
+
+def _cache(cycle_data: Mapping[str, Any]) -> Dict[str, Any]:
+    log = cycle_data["period_log"]
+    return {
+        "schema_version": CYCLE_STATS_SCHEMA_VERSION,
+        "log_count": len(log),
+        "log_tail": _date_key(log[-1]) if log else None,
+        "history_count": len(cycle_data["cycle_history"]),
+        "recorded_count": len(cycle_data["recorded_starts"]),
+    }
+
+
+def _cache_current(cycle_data: Mapping[str, Any]) -> bool:
+    """缓存是否为当前版本且与经期记录、周期历史对应"""
+    if not all(key in cycle_data for key in ("period_log", "recorded_starts", "cycle_history")):
+        return False
+    return cycle_data.get("cycle_cache") == _cache(cycle_data)
+
+
+def _incoming_starts(existing_data: Mapping[str, Any], new_cycle_data: Mapping[str, Any]) -> List[str]:
+    """
+    模型补录的月经开始日期：cycle_history中的开始日期和本次给出的当前周期开始日期。
+
+    与已有数据相同的日期是模型照抄的上下文（包括初始化时填入的今天），不算补录。
+    """
+    known = {cycle.get("start_date") for cycle in existing_data.get("cycle_history") or []}
+    known.add((existing_data.get("current_cycle") or {}).get("start_date"))
+    starts = [cycle.get("start_date") for cycle in new_cycle_data.get("cycle_history") or []]
+    starts.append((new_cycle_data.get("current_cycle") or {}).get("start_date"))
+    return [start for start in starts if _day(start) and start not in known]
+
+
+def refresh_cycle_data(
+    existing_data: Mapping[str, Any],
+    new_cycle_data: Mapping[str, Any],
+    cache: bool = True,
+) -> Tuple[Dict[str, Any], MergeSummary]:
+    """
+    合并本次的经期记录并重新推导周期、统计和预测，返回新的经期数据和合并统计。
+
+    新记录都不早于当前周期的开始日期、也没有补录开始日期时，已结束的周期直接沿用，只重算当前周期；
+    其余情况（缓存缺失或过期、补录更早的日期）由全部经期记录重建。
+    cache传给forecast_cycle：流式预览每个分片都会调用，不应占用预测缓存。
+    没有period_log的旧数据把原有的周期历史当作补录的开始日期，当前周期的经期记录并入period_log。
+    """
+    current_cycle = dict(existing_data.get("current_cycle") or {})
+    if "period_log" in existing_data:
+        period_log = existing_data.get("period_log") or []
+        recorded_starts = list(existing_data.get("recorded_starts") or [])
+    else:
+        period_log = sorted(current_cycle.get("period_days") or [], key=_date_key)
+        recorded_starts = sorted({cycle.get("start_date") for cycle in existing_data.get("cycle_history") or [] if _day(cycle.get("start_date"))})
+
+    incoming_days = (new_cycle_data.get("current_cycle") or {}).get("period_days") or []
+    results = merge_collection_results({"period_log": period_log}, {"period_log": incoming_days}, CYCLE_MERGE_SPECS)
+    result = results["period_log"]
+    log = result.records
+    # 新记录追加在末尾；只有补录了更早的日期时才需要重新排序
+    inserted_keys = [_date_key(record) for record in result.inserted_records]
+    if inserted_keys and (inserted_keys != sorted(inserted_keys) or (period_log and inserted_keys[0] < _date_key(period_log[-1]))):
+        log = sorted(log, key=_date_key)
+
+    new_starts = sorted(set(_incoming_starts(existing_data, new_cycle_data)) - set(recorded_starts))
+    history = existing_data.get("cycle_history") or []
+    previous_start = current_cycle.get("start_date")
+    changed_days = inserted_keys + [_date_key(new) for _, new in result.updated_records]
+    # 改动了当前周期的第一天时开始日期可能后移，前一个周期的长度随之变化，需要重建
+    incremental = (
+        _cache_current(existing_data)
+        and not new_starts
+        and current_cycle.get("source") == "period_log"
+        and all(day > previous_start for day in changed_days)
+    )
+
+    recorded_starts = sorted(set(recorded_starts) | set(new_starts))
+    if incremental:
+        cycles = list(history) + derive_cycles(log, recorded_starts, since=previous_start)
+    else:
+        cycles = derive_cycles(log, recorded_starts)
+
+    current_start = None
+    if cycles:
+        current = cycles.pop()
+        current_start = current["start_date"]
+        begin = bisect_left(log, current["start_date"], key=_date_key)
+        current_cycle = {
+            **current_cycle,
+            **(new_cycle_data.get("current_cycle") or {}),
+            "start_date": current["start_date"],
+            "end_date": None,
+            "cycle_length": None,
+            "period_days": log[begin:],
+            "source": current["source"],
+        }
+    else:
+        current_cycle = {**current_cycle, **(new_cycle_data.get("current_cycle") or {}), "period_days": []}
+
+    stats, predictions = forecast_cycle(current_start, cycles, cache)
+    summary = summarize(results)
+    cycle_data = {
+        REVISION_FIELD: next_revision(existing_data, summary.changed),
+        "current_cycle": current_cycle,
+        "cycle_history": cycles,
+        "period_log": log,
+        "recorded_starts": recorded_starts,
+        "cycle_statistics": stats,
+        "predictions": predictions,
+    }
+    cycle_data["cycle_cache"] = _cache(cycle_data)
+    return cycle_data, summary
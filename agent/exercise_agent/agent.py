@@ -6,7 +6,6 @@
 import json
 from enum import Enum
 from typing import Dict, List, Any, Optional
-from datetime import date
 
 # LangGraph imports
 from langchain_core.runnables import RunnableConfig
@@ -15,11 +14,22 @@ from langgraph.types import Command
 
 # CopilotKit imports
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state, copilotkit_exit
+from copilotkit.langgraph import copilotkit_exit
 
 # OpenAI imports
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, ToolMessage
+from langchain_core.messages import ToolMessage
+
+from shared.history import window_history
+from shared.merge import LAST_WRITE_WINS, collection, merge_collections
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import CONTEXT_NOTE, build_prompt_context, get_last_user_message
+from shared.prompt_layout import context_block, layout_messages
+from shared.response_cache import CacheScope
+from shared.scores import ScoreProvider, field_score
+from shared.state_emitter import emit_state
+from shared.streaming import StreamTarget, customize_config, invoke_model, merge_preview
+from shared.summaries import SUMMARY_FIELD, SUMMARY_RECENT_EVENTS, SummaryProvider, event
+from shared.versioning import REVISION_FIELD, next_revision
 
 class ExerciseType(str, Enum):
     """运动类型"""
@@ -55,7 +65,7 @@ EXERCISE_TOOL = {
                                         "type": "string",
                                         "enum": [e.value for e in ExerciseType]
                                     },
-                                    "duration_minutes": {"type": "number"},
+                                    "duration_minutes": {"type": "number", "description": "当天该类运动的总时长(分钟)，会覆盖已有记录"},
                                     "intensity": {
                                         "type": "string",
                                         "enum": [i.value for i in ExerciseIntensity]
@@ -72,10 +82,83 @@ EXERCISE_TOOL = {
     }
 }
 
+# 会随时间增长的记录列表，提示词中只展示计数、最近和相关条目
+EXERCISE_COLLECTIONS = ("daily_activities",)
+
+# 各记录列表的自然键和冲突策略：模型提交的是同一天同类运动的总时长，覆盖已有记录
+EXERCISE_MERGE_SPECS = {
+    "daily_activities": collection("date", "exercise_type", policy=LAST_WRITE_WINS),
+}
+
+def build_exercise_summary(exercise_data: Dict) -> Dict[str, Any]:
+    """运动摘要：活动评分和最近几次运动"""
+    activities = exercise_data.get("daily_activities") or []
+    return {
+        "activity_score": exercise_data.get("activity_score"),
+        "counts": {"daily_activities": len(activities)},
+        "recent_activities": [
+            event(
+                activity.get("date"),
+                activity.get("exercise_type"),
+                f"{activity['duration_minutes']}分钟" if activity.get("duration_minutes") is not None else None,
+                activity.get("intensity"),
+            )
+            for activity in activities[-SUMMARY_RECENT_EVENTS:]
+        ],
+    }
+
+# 供健康洞察读取的运动摘要
+SUMMARY_PROVIDER = SummaryProvider(EXERCISE_COLLECTIONS, build_exercise_summary)
+SCORE_PROVIDER = ScoreProvider("exercise", "运动活动", field_score("activity_score"))
+
 class ExerciseState(CopilotKitState):
     """运动健康追踪状态"""
     exercise_data: Optional[Dict[str, Any]] = None
 
+# 生成中的运动记录按合并规则并入已有数据后推送给前端
+EXERCISE_STREAM = StreamTarget(
+    "exercise_data",
+    "update_exercise_data",
+    "exercise_data",
+    merge_preview("exercise_data", EXERCISE_MERGE_SPECS),
+)
+
+# 固定指令：每次调用逐字节相同，数据和日期放在对话末尾的当前上下文中
+EXERCISE_INSTRUCTIONS = """你是专业的运动健康指导师。
+
+运动类型：Cardio(有氧), Strength Training(力量), Yoga(瑜伽), Walking(步行)
+运动强度：Low Intensity(低强度), Moderate Intensity(中等强度), High Intensity(高强度)
+
+中文翻译：
+- 跑步/有氧 → Cardio
+- 力量训练 → Strength Training
+- 瑜伽 → Yoga
+- 步行/散步 → Walking
+
+指导原则：
+- 专注于运动健康指导
+- 当用户提供运动信息时，调用update_exercise_data工具
+- duration_minutes填写当天该类运动的总时长（已有记录加上本次时长），会覆盖当天已有数值
+- 今日日期见对话末尾的当前数据
+
+示例：
+"今天跑步30分钟" → 记录Cardio 30分钟
+"做了瑜伽" → 记录Yoga
+"""
+
+def build_exercise_context(state: Dict[str, Any]) -> str:
+    """运动健康指导提示词中每轮变化的部分：当前数据摘要和今日日期"""
+    try:
+        exercise_json = build_prompt_context(
+            state["exercise_data"],
+            EXERCISE_COLLECTIONS,
+            get_last_user_message(state.get("messages", [])),
+        )
+    except Exception as e:
+        exercise_json = f"数据序列化错误: {str(e)}"
+
+    return context_block(f"当前运动数据: {exercise_json}\n{CONTEXT_NOTE}")
+
 async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     """运动健康追踪流程入口点"""
     
@@ -84,7 +167,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
             "daily_activities": [],
             "activity_score": 40
         }
-        await copilotkit_emit_state(config, state)
+        await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
@@ -100,57 +183,24 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
     if "exercise_data" not in state or state["exercise_data"] is None:
         state["exercise_data"] = {"daily_activities": [], "activity_score": 40}
 
-    try:
-        exercise_json = json.dumps(state["exercise_data"], indent=2)
-    except Exception as e:
-        exercise_json = f"数据序列化错误: {str(e)}"
-    
-    system_prompt = f"""你是专业的运动健康指导师。
-
-当前运动数据: {exercise_json}
-
-运动类型：Cardio(有氧), Strength Training(力量), Yoga(瑜伽), Walking(步行)
-运动强度：Low Intensity(低强度), Moderate Intensity(中等强度), High Intensity(高强度)
-
-中文翻译：
-- 跑步/有氧 → Cardio
-- 力量训练 → Strength Training
-- 瑜伽 → Yoga
-- 步行/散步 → Walking
-
-指导原则：
-- 专注于运动健康指导
-- 当用户提供运动信息时，调用update_exercise_data工具
-- 今日日期：{date.today().isoformat()}
-
-示例：
-"今天跑步30分钟" → 记录Cardio 30分钟
-"做了瑜伽" → 记录Yoga
-"""
-
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "exercise_data",
-            "tool": "update_exercise_data",
-            "tool_argument": "exercise_data"
-        }],
-    )
+    config = customize_config(config, EXERCISE_STREAM)
 
-    model_with_tools = model.bind_tools(
-        [*state.get("copilotkit", {}).get("actions", []), EXERCISE_TOOL],
+    model_with_tools = get_model_with_tools(
+        [EXERCISE_TOOL],
+        actions=state.get("copilotkit", {}).get("actions", []),
+        response_cache=CacheScope("exercise", SUMMARY_PROVIDER.version(state["exercise_data"])),
         parallel_tool_calls=False,
     )
 
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+    response = await invoke_model(model_with_tools, layout_messages(
+        "exercise",
+        EXERCISE_INSTRUCTIONS,
+        build_exercise_context(state),
+        window_history(state.get("messages", []), config),
+    ), config, state, EXERCISE_STREAM)
 
     messages = state.get("messages", []) + [response]
     
@@ -170,24 +220,23 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             new_exercise_data = tool_call_args["exercise_data"]
             existing_data = state.get("exercise_data", {})
             
+            merged_collections, merge_summary = merge_collections(existing_data, new_exercise_data, EXERCISE_MERGE_SPECS)
             exercise_data = {
-                "daily_activities": existing_data.get("daily_activities", []).copy(),
-                "activity_score": existing_data.get("activity_score", 40)
+                **merged_collections,
+                "activity_score": existing_data.get("activity_score", 40),
+                REVISION_FIELD: next_revision(existing_data, merge_summary.changed)
             }
-            
-            if "daily_activities" in new_exercise_data:
-                for new_activity in new_exercise_data["daily_activities"]:
-                    exercise_data["daily_activities"].append(new_activity)
+            exercise_data[SUMMARY_FIELD] = SUMMARY_PROVIDER.publish(exercise_data)
             
             tool_response = ToolMessage(
-                content="运动数据更新成功",
+                content=f"运动数据更新成功（{merge_summary.describe()}）",
                 tool_call_id=tool_call_id
             )
             
             messages = messages + [tool_response]
             
             updated_state = {**state, "exercise_data": exercise_data, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
+            await emit_state(config, updated_state, final=True)
             
             return Command(
                 goto=END,
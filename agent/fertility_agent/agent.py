@@ -5,8 +5,8 @@
 
 import json
 from enum import Enum
-from typing import Dict, List, Any, Optional
-from datetime import date, datetime, timedelta
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
 
 # LangGraph imports
 from langchain_core.runnables import RunnableConfig
@@ -15,13 +15,25 @@ from langgraph.types import Command
 
 # CopilotKit imports
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state
 
 # OpenAI imports
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, ToolMessage
+from langchain_core.messages import ToolMessage
 from copilotkit.langgraph import copilotkit_exit
 
+from shared.history import window_history
+from shared.merge import LAST_WRITE_WINS, collection, merge_collection_results, summarize
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import CONTEXT_NOTE, build_prompt_context, get_last_user_message
+from shared.prompt_layout import context_block, layout_messages
+from shared.response_cache import CacheScope
+from shared.scores import ScoreProvider, field_score
+from shared.state_emitter import emit_state
+from shared.streaming import StreamTarget, customize_config, invoke_model, merge_preview
+from shared.summaries import SUMMARY_FIELD, SUMMARY_RECENT_EVENTS, SummaryProvider, event
+from shared.timeseries import Records
+from shared.versioning import REVISION_FIELD, next_revision
+from fertility_agent.bbt import analyze_bbt, update_detector_state
+
 class FertilityGoal(str, Enum):
     """生育目标类型"""
     TRYING_TO_CONCEIVE = "Trying to Conceive"
@@ -125,32 +137,23 @@ FERTILITY_TOOL = {
     }
 }
 
+# 会随时间增长的记录列表，提示词中只展示计数、最近和相关条目
+FERTILITY_COLLECTIONS = ("basal_body_temperature", "cervical_mucus", "ovulation_tests")
+
+# 各记录列表的自然键和冲突策略：每天一条观测，同日重新记录以最新为准
+FERTILITY_MERGE_SPECS = {
+    "basal_body_temperature": collection("date", policy=LAST_WRITE_WINS),
+    "cervical_mucus": collection("date", policy=LAST_WRITE_WINS),
+    "ovulation_tests": collection("date", policy=LAST_WRITE_WINS),
+}
+
 class FertilityState(CopilotKitState):
     """生育健康追踪状态"""
     fertility_data: Optional[Dict[str, Any]] = None
 
-def analyze_bbt_pattern(bbt_data: List[Dict]) -> Dict[str, Any]:
-    """分析基础体温模式"""
-    if len(bbt_data) < 7:
-        return {"pattern": "数据不足", "ovulation_detected": False}
-    
-    temperatures = [entry.get("temperature", 36.5) for entry in bbt_data[-14:]]
-    
-    if len(temperatures) < 7:
-        return {"pattern": "数据不足", "ovulation_detected": False}
-    
-    mid_point = len(temperatures) // 2
-    pre_ovulation_avg = sum(temperatures[:mid_point]) / mid_point
-    post_ovulation_avg = sum(temperatures[mid_point:]) / (len(temperatures) - mid_point)
-    
-    temp_rise = post_ovulation_avg - pre_ovulation_avg
-    ovulation_detected = temp_rise >= 0.2
-    
-    return {
-        "pattern": "双相型体温" if ovulation_detected else "单相型体温",
-        "ovulation_detected": ovulation_detected,
-        "temperature_rise": round(temp_rise, 2)
-    }
+def analyze_bbt_pattern(bbt_data: Records, detector: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """分析基础体温模式（三高于六规则）；detector为与记录对应的检测器状态时不再遍历记录"""
+    return analyze_bbt(bbt_data, detector)
 
 def calculate_fertility_score(fertility_data: Dict) -> int:
     """计算生育健康评分"""
@@ -185,61 +188,63 @@ def calculate_fertility_score(fertility_data: Dict) -> int:
     
     return min(score, 100)
 
-async def start_flow(state: Dict[str, Any], config: RunnableConfig):
-    """生育健康追踪流程入口点"""
+def build_fertility_insights(fertility_data: Dict) -> Dict[str, Any]:
+    """根据体温、宫颈粘液和排卵试纸记录重新计算生育洞察"""
+    bbt_data = fertility_data.get("basal_body_temperature") or []
+    bbt_analysis = analyze_bbt_pattern(bbt_data, fertility_data.get("bbt_detector"))
+    fertility_score = calculate_fertility_score(fertility_data)
     
-    if "fertility_data" not in state or state["fertility_data"] is None:
-        state["fertility_data"] = {
-            "goal": FertilityGoal.GENERAL_HEALTH.value,
-            "basal_body_temperature": [],
-            "cervical_mucus": [],
-            "ovulation_tests": [],
-            "fertility_insights": {
-                "cycle_regularity": "需要更多数据评估",
-                "ovulation_patterns": "正在收集数据",
-                "fertility_score": 50,
-                "recommendations": [
-                    "开始记录基础体温",
-                    "观察宫颈粘液变化",
-                    "考虑使用排卵试纸"
-                ]
-            }
-        }
-        await copilotkit_emit_state(config, state)
+    recommendations = []
+    if len(bbt_data) < 10:
+        recommendations.append("建议持续记录基础体温，至少记录一个完整周期")
+    if len(fertility_data.get("cervical_mucus") or []) < 5:
+        recommendations.append("建议每日观察宫颈粘液变化，这是排卵的重要指标")
+    if fertility_data.get("goal", FertilityGoal.GENERAL_HEALTH.value) == FertilityGoal.TRYING_TO_CONCEIVE.value:
+        recommendations.append("在受孕窗口期增加同房频率，隔日一次较为理想")
+    if bbt_analysis["ovulation_detected"]:
+        recommendations.append("检测到排卵迹象，继续保持记录以验证模式")
     
-    return Command(
-        goto="chat_node",
-        update={
-            "messages": state["messages"],
-            "fertility_data": state["fertility_data"]
-        }
-    )
+    return {
+        "cycle_regularity": bbt_analysis.get("pattern", "需要更多数据"),
+        "ovulation_patterns": f"体温分析：{'检测到排卵' if bbt_analysis.get('ovulation_detected') else '未检测到明显排卵'}",
+        "fertility_score": fertility_score,
+        "recommendations": recommendations
+    }
 
-async def chat_node(state: Dict[str, Any], config: RunnableConfig):
-    """生育健康追踪聊天节点"""
-    
-    if "fertility_data" not in state or state["fertility_data"] is None:
-        state["fertility_data"] = {
-            "goal": FertilityGoal.GENERAL_HEALTH.value,
-            "basal_body_temperature": [],
-            "cervical_mucus": [],
-            "ovulation_tests": [],
-            "fertility_insights": {
-                "cycle_regularity": "需要更多数据评估",
-                "ovulation_patterns": "正在收集数据",
-                "fertility_score": 50,
-                "recommendations": []
-            }
-        }
+def build_fertility_summary(fertility_data: Dict) -> Dict[str, Any]:
+    """生育摘要：目标、评分、体温模式和最近几次体温与排卵试纸结果"""
+    insights = fertility_data.get("fertility_insights") or {}
+    bbt_data = fertility_data.get("basal_body_temperature") or []
+    tests = fertility_data.get("ovulation_tests") or []
+    return {
+        "goal": fertility_data.get("goal"),
+        "fertility_score": insights.get("fertility_score"),
+        "bbt_pattern": insights.get("cycle_regularity"),
+        "ovulation_patterns": insights.get("ovulation_patterns"),
+        "counts": {name: len(fertility_data.get(name) or []) for name in FERTILITY_COLLECTIONS},
+        "recent_bbt": [
+            event(reading.get("date"), f"{reading['temperature']}℃" if reading.get("temperature") is not None else None)
+            for reading in bbt_data[-SUMMARY_RECENT_EVENTS:]
+        ],
+        "recent_ovulation_tests": [
+            event(test.get("date"), test.get("result")) for test in tests[-SUMMARY_RECENT_EVENTS:]
+        ],
+    }
 
-    try:
-        fertility_json = json.dumps(state["fertility_data"], indent=2)
-    except Exception as e:
-        fertility_json = f"数据序列化错误: {str(e)}"
-    
-    system_prompt = f"""你是专业的生育健康追踪助手，专门负责排卵预测、受孕指导和生育规划。
+# 供健康洞察读取的生育摘要；检测器状态由体温记录决定，不参与版本计算
+SUMMARY_PROVIDER = SummaryProvider(FERTILITY_COLLECTIONS, build_fertility_summary, ignored=("bbt_detector",))
+SCORE_PROVIDER = ScoreProvider("fertility", "生育健康", field_score("fertility_score"))
+
+# 生成中的体温/宫颈黏液/排卵测试记录按合并规则并入已有数据后推送给前端
+FERTILITY_STREAM = StreamTarget(
+    "fertility_data",
+    "update_fertility_data",
+    "fertility_data",
+    merge_preview("fertility_data", FERTILITY_MERGE_SPECS),
+)
 
-当前生育数据: {fertility_json}
+# 固定指令：每次调用逐字节相同，数据和日期放在对话末尾的当前上下文中
+FERTILITY_INSTRUCTIONS = """你是专业的生育健康追踪助手，专门负责排卵预测、受孕指导和生育规划。
 
 你的核心功能：
 1. 🌡️ 基础体温(BBT)记录和分析
@@ -273,7 +278,7 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
 - 当用户提供生育相关信息时，必须调用update_fertility_data工具
 - 提供专业但易懂的生育知识
 - 日期格式使用YYYY-MM-DD
-- 今日日期：{date.today().isoformat()}
+- 今日日期见对话末尾的当前数据
 
 使用示例：
 用户说："今天基础体温36.8度" → 记录今日BBT数据
@@ -281,32 +286,89 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
 用户说："白带像蛋清一样透明" → 记录Egg White宫颈粘液
 """
 
-    model = ChatOpenAI(model="gpt-4o-mini")
+def build_fertility_context(state: Dict[str, Any]) -> str:
+    """生育健康追踪提示词中每轮变化的部分：当前数据摘要和今日日期"""
+    try:
+        # 检测器状态只供体温分析使用，不放进提示词
+        fertility_json = build_prompt_context(
+            {key: value for key, value in state["fertility_data"].items() if key != "bbt_detector"},
+            FERTILITY_COLLECTIONS,
+            get_last_user_message(state.get("messages", [])),
+            aggregates={"bbt_analysis": analyze_bbt_pattern(
+                state["fertility_data"].get("basal_body_temperature", []),
+                state["fertility_data"].get("bbt_detector"),
+            )},
+        )
+    except Exception as e:
+        fertility_json = f"数据序列化错误: {str(e)}"
+
+    return context_block(f"当前生育数据: {fertility_json}\n{CONTEXT_NOTE}")
+
+async def start_flow(state: Dict[str, Any], config: RunnableConfig):
+    """生育健康追踪流程入口点"""
     
+    if "fertility_data" not in state or state["fertility_data"] is None:
+        state["fertility_data"] = {
+            "goal": FertilityGoal.GENERAL_HEALTH.value,
+            "basal_body_temperature": [],
+            "cervical_mucus": [],
+            "ovulation_tests": [],
+            "fertility_insights": {
+                "cycle_regularity": "需要更多数据评估",
+                "ovulation_patterns": "正在收集数据",
+                "fertility_score": 50,
+                "recommendations": [
+                    "开始记录基础体温",
+                    "观察宫颈粘液变化",
+                    "考虑使用排卵试纸"
+                ]
+            }
+        }
+        await emit_state(config, state, final=True)
+    
+    return Command(
+        goto="chat_node",
+        update={
+            "messages": state["messages"],
+            "fertility_data": state["fertility_data"]
+        }
+    )
+
+async def chat_node(state: Dict[str, Any], config: RunnableConfig):
+    """生育健康追踪聊天节点"""
+    
+    if "fertility_data" not in state or state["fertility_data"] is None:
+        state["fertility_data"] = {
+            "goal": FertilityGoal.GENERAL_HEALTH.value,
+            "basal_body_temperature": [],
+            "cervical_mucus": [],
+            "ovulation_tests": [],
+            "fertility_insights": {
+                "cycle_regularity": "需要更多数据评估",
+                "ovulation_patterns": "正在收集数据",
+                "fertility_score": 50,
+                "recommendations": []
+            }
+        }
+
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "fertility_data",
-            "tool": "update_fertility_data",
-            "tool_argument": "fertility_data"
-        }],
-    )
+    config = customize_config(config, FERTILITY_STREAM)
 
-    model_with_tools = model.bind_tools(
-        [
-            *state.get("copilotkit", {}).get("actions", []),
-            FERTILITY_TOOL
-        ],
+    model_with_tools = get_model_with_tools(
+        [FERTILITY_TOOL],
+        actions=state.get("copilotkit", {}).get("actions", []),
+        response_cache=CacheScope("fertility", SUMMARY_PROVIDER.version(state["fertility_data"])),
         parallel_tool_calls=False,
     )
 
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+    response = await invoke_model(model_with_tools, layout_messages(
+        "fertility",
+        FERTILITY_INSTRUCTIONS,
+        build_fertility_context(state),
+        window_history(state.get("messages", []), config),
+    ), config, state, FERTILITY_STREAM)
 
     messages = state.get("messages", []) + [response]
     
@@ -326,73 +388,33 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             new_fertility_data = tool_call_args["fertility_data"]
             existing_data = state.get("fertility_data", {})
             
+            merge_results = merge_collection_results(existing_data, new_fertility_data, FERTILITY_MERGE_SPECS)
+            merge_summary = summarize(merge_results)
             fertility_data = {
-                "goal": existing_data.get("goal", FertilityGoal.GENERAL_HEALTH.value),
-                "basal_body_temperature": existing_data.get("basal_body_temperature", []).copy(),
-                "cervical_mucus": existing_data.get("cervical_mucus", []).copy(),
-                "ovulation_tests": existing_data.get("ovulation_tests", []).copy(),
-                "fertility_insights": existing_data.get("fertility_insights", {})
+                "goal": new_fertility_data.get("goal", existing_data.get("goal", FertilityGoal.GENERAL_HEALTH.value)),
+                **{name: result.records for name, result in merge_results.items()},
+                "fertility_insights": existing_data.get("fertility_insights", {}),
+                # 新体温按日期追加时增量读入检测器
+                "bbt_detector": update_detector_state(
+                    existing_data.get("bbt_detector"),
+                    existing_data.get("basal_body_temperature") or [],
+                    merge_results["basal_body_temperature"],
+                ),
+                REVISION_FIELD: next_revision(existing_data, merge_summary.changed)
             }
             
-            if "goal" in new_fertility_data:
-                fertility_data["goal"] = new_fertility_data["goal"]
-            
-            if "basal_body_temperature" in new_fertility_data:
-                for new_bbt in new_fertility_data["basal_body_temperature"]:
-                    is_duplicate = any(
-                        b.get("date") == new_bbt.get("date")
-                        for b in fertility_data["basal_body_temperature"]
-                    )
-                    if not is_duplicate:
-                        fertility_data["basal_body_temperature"].append(new_bbt)
-            
-            if "cervical_mucus" in new_fertility_data:
-                for new_mucus in new_fertility_data["cervical_mucus"]:
-                    is_duplicate = any(
-                        m.get("date") == new_mucus.get("date")
-                        for m in fertility_data["cervical_mucus"]
-                    )
-                    if not is_duplicate:
-                        fertility_data["cervical_mucus"].append(new_mucus)
-            
-            if "ovulation_tests" in new_fertility_data:
-                for new_test in new_fertility_data["ovulation_tests"]:
-                    is_duplicate = any(
-                        t.get("date") == new_test.get("date")
-                        for t in fertility_data["ovulation_tests"]
-                    )
-                    if not is_duplicate:
-                        fertility_data["ovulation_tests"].append(new_test)
-            
-            bbt_analysis = analyze_bbt_pattern(fertility_data["basal_body_temperature"])
-            fertility_score = calculate_fertility_score(fertility_data)
-            
-            recommendations = []
-            if len(fertility_data["basal_body_temperature"]) < 10:
-                recommendations.append("建议持续记录基础体温，至少记录一个完整周期")
-            if len(fertility_data["cervical_mucus"]) < 5:
-                recommendations.append("建议每日观察宫颈粘液变化，这是排卵的重要指标")
-            if fertility_data["goal"] == FertilityGoal.TRYING_TO_CONCEIVE.value:
-                recommendations.append("在受孕窗口期增加同房频率，隔日一次较为理想")
-            if bbt_analysis["ovulation_detected"]:
-                recommendations.append("检测到排卵迹象，继续保持记录以验证模式")
-            
-            fertility_data["fertility_insights"] = {
-                "cycle_regularity": bbt_analysis.get("pattern", "需要更多数据"),
-                "ovulation_patterns": f"体温分析：{'检测到排卵' if bbt_analysis.get('ovulation_detected') else '未检测到明显排卵'}",
-                "fertility_score": fertility_score,
-                "recommendations": recommendations
-            }
+            fertility_data["fertility_insights"] = build_fertility_insights(fertility_data)
+            fertility_data[SUMMARY_FIELD] = SUMMARY_PROVIDER.publish(fertility_data)
         
             tool_response = ToolMessage(
-                content="生育健康数据更新成功",
+                content=f"生育健康数据更新成功（{merge_summary.describe()}）",
                 tool_call_id=tool_call_id
             )
             
             messages = messages + [tool_response]
             
             updated_state = {**state, "fertility_data": fertility_data, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
+            await emit_state(config, updated_state, final=True)
             
             return Command(
                 goto=END,
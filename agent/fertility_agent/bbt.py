@@ -0,0 +1,248 @@
+"""
+基础体温双相检测 - 用"三高于六"规则找出排卵后的体温升高
+单一职责：按日期顺序一次遍历体温记录，用单调队列维护前6次体温的滑动最大值作为基线，
+返回升温日、升温幅度和置信度；新体温按日期追加时增量更新，不重新扫描历史
+"""
+
+from collections import deque
+from datetime import date
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from shared.dates import date_ordinal
+from shared.merge import MergeResult
+from shared.timeseries import Records
+
+BASELINE_READINGS = 6          # 基线：升温前的6次体温
+HIGH_READINGS = 3              # 连续3次高于覆盖线才算升温
+COVERLINE_OFFSET = 0.05        # 覆盖线 = 基线最高值 + 0.05℃（约0.1℉）
+THIRD_READING_RISE = 0.2       # 第3次高温至少比基线最高值高0.2℃
+MAX_GAP_DAYS = 3               # 相邻两次记录相隔超过3天时重新开始计数
+MIN_SHIFT_SPACING_DAYS = 20    # 同一黄体期内不重复检测：两次升温至少相隔20天
+FOLLOW_READINGS = 7            # 升温后再观察7次体温，评估升温是否持续
+VALID_TEMPERATURE_RANGE = (34.0, 40.0)
+
+# 检测器状态结构变化时加1，旧状态会被整体重建
+DETECTOR_SCHEMA_VERSION = 1
+
+Reading = Tuple[int, float]  # (date.toordinal(), 体温)
+
+
+def _valid_temperature(value: Any) -> bool:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    return VALID_TEMPERATURE_RANGE[0] <= value <= VALID_TEMPERATURE_RANGE[1]
+
+
+def bbt_readings(data: Optional[Records]) -> List[Reading]:
+    """有效体温按日期排序；同一天有多条记录时以后一条为准，日期或体温无效的记录跳过"""
+    by_day: Dict[int, float] = {}
+    for record in data or []:
+        raw_date = record.get("date")
+        temperature = record.get("temperature")
+        if isinstance(raw_date, str) and _valid_temperature(temperature):
+            day = date_ordinal(raw_date)
+            if day:
+                by_day[day] = temperature
+    return sorted(by_day.items())
+
+
+def _shift_summary(baseline: Sequence[Reading], highs: Sequence[Reading], baseline_max: float) -> Dict[str, Any]:
+    """一次升温的描述：升温日为第一次高温的日期"""
+    baseline_avg = sum(temperature for _, temperature in baseline) / len(baseline)
+    high_avg = sum(temperature for _, temperature in highs) / len(highs)
+    return {
+        "day": highs[0][0],
+        "coverline": baseline_max + COVERLINE_OFFSET,
+        "rise": high_avg - baseline_avg,
+        "margin": highs[-1][1] - baseline_max,
+        "span": highs[-1][0] - baseline[0][0],
+    }
+
+
+def _analysis(shift: Optional[Dict[str, Any]], evaluated: int, follow: int, elevated: int) -> Dict[str, Any]:
+    """检测结果转成洞察使用的字段"""
+    if shift is None:
+        if not evaluated:
+            return {"pattern": "数据不足", "ovulation_detected": False}
+        return {"pattern": "单相型体温", "ovulation_detected": False, "temperature_rise": 0.0}
+
+    # 置信度：第3次高温超出基线的幅度、升温后体温保持在覆盖线以上的比例，中间有漏测的天数时按比例降低
+    strength = min(shift["margin"] / 0.4, 1.0)
+    sustained = elevated / FOLLOW_READINGS
+    continuity = min((BASELINE_READINGS + HIGH_READINGS - 1) / shift["span"], 1.0)
+    return {
+        "pattern": "双相型体温",
+        "ovulation_detected": True,
+        "temperature_rise": round(shift["rise"], 2),
+        "shift_date": date.fromordinal(shift["day"]).isoformat(),
+        "coverline": round(shift["coverline"], 2),
+        "confidence": round((0.4 + 0.3 * strength + 0.3 * sustained) * continuity, 2),
+    }
+
+
+class BBTShiftDetector:
+    """逐次读入体温的双相检测器，保留最近一次升温"""
+
+    __slots__ = ("_recent", "_maxima", "_position", "_last_day", "evaluated", "shift", "_follow", "_elevated")
+
+    def __init__(self):
+        self._recent: Deque[Reading] = deque(maxlen=BASELINE_READINGS + HIGH_READINGS)
+        self._maxima: Deque[Tuple[int, float]] = deque()  # 基线窗口内的单调递减队列 (段内序号, 体温)
+        self._position = 0                                # 当前连续段内已读入的次数
+        self._last_day: Optional[int] = None
+        self.evaluated = 0                                # 凑满 6+3 次体温、做过判断的次数
+        self.shift: Optional[Dict[str, Any]] = None
+        self._follow = 0
+        self._elevated = 0
+
+    @classmethod
+    def from_readings(cls, readings: Sequence[Reading]) -> "BBTShiftDetector":
+        detector = cls()
+        for day, temperature in readings:
+            detector.push(day, temperature)
+        return detector
+
+    @property
+    def last_day(self) -> Optional[int]:
+        return self._last_day
+
+    def push(self, day: int, temperature: float) -> bool:
+        """读入一次体温（日期必须晚于已读入的体温），检测到新的升温时返回True"""
+        if self._last_day is not None:
+            if day <= self._last_day:
+                raise ValueError("体温必须按日期递增读入")
+            if day - self._last_day > MAX_GAP_DAYS:
+                self._recent.clear()
+                self._maxima.clear()
+                self._position = 0
+        self._last_day = day
+
+        if self.shift is not None and self._follow < FOLLOW_READINGS:
+            self._follow += 1
+            self._elevated += temperature > self.shift["coverline"]
+
+        position = self._position
+        self._position += 1
+        self._recent.append((day, temperature))
+
+        # 最近3次之前的那次体温进入基线窗口，超出6次的移出
+        if position >= HIGH_READINGS:
+            entering = self._recent[-HIGH_READINGS - 1][1]
+            while self._maxima and self._maxima[-1][1] <= entering:
+                self._maxima.pop()
+            self._maxima.append((position - HIGH_READINGS, entering))
+            if self._maxima[0][0] <= position - HIGH_READINGS - BASELINE_READINGS:
+                self._maxima.popleft()
+
+        if len(self._recent) < BASELINE_READINGS + HIGH_READINGS:
+            return False
+        self.evaluated += 1
+        return self._check()
+
+    def _check(self) -> bool:
+        baseline_max = self._maxima[0][1]
+        readings = list(self._recent)
+        baseline, highs = readings[:BASELINE_READINGS], readings[BASELINE_READINGS:]
+        coverline = baseline_max + COVERLINE_OFFSET
+        if any(temperature <= coverline for _, temperature in highs):
+            return False
+        if highs[-1][1] < baseline_max + THIRD_READING_RISE:
+            return False
+        if self.shift is not None and highs[0][0] - self.shift["day"] < MIN_SHIFT_SPACING_DAYS:
+            return False
+        self.shift = _shift_summary(baseline, highs, baseline_max)
+        self._follow = self._elevated = 0
+        return True
+
+    def result(self) -> Dict[str, Any]:
+        return _analysis(self.shift, self.evaluated, self._follow, self._elevated)
+
+    def to_state(self) -> Dict[str, Any]:
+        """可以存进JSON状态的检测器快照"""
+        return {
+            "schema_version": DETECTOR_SCHEMA_VERSION,
+            "recent": [list(reading) for reading in self._recent],
+            "position": self._position,
+            "last_day": self._last_day,
+            "evaluated": self.evaluated,
+            "shift": dict(self.shift) if self.shift else None,
+            "follow": self._follow,
+            "elevated": self._elevated,
+        }
+
+    @classmethod
+    def from_state(cls, state: Mapping[str, Any]) -> "BBTShiftDetector":
+        detector = cls()
+        detector._recent.extend((day, temperature) for day, temperature in state["recent"])
+        detector._position = state["position"]
+        detector._last_day = state["last_day"]
+        detector.evaluated = state["evaluated"]
+        detector.shift = dict(state["shift"]) if state["shift"] else None
+        detector._follow = state["follow"]
+        detector._elevated = state["elevated"]
+        # 单调队列由最近的体温重建（最多6次）
+        first = detector._position - len(detector._recent)
+        for offset, (_, temperature) in enumerate(list(detector._recent)[:-HIGH_READINGS]):
+            while detector._maxima and detector._maxima[-1][1] <= temperature:
+                detector._maxima.pop()
+            detector._maxima.append((first + offset, temperature))
+        return detector
+
+
+def detect_bbt_shift(data: Optional[Records]) -> Dict[str, Any]:
+    """一次遍历全部体温记录，返回最近一次升温的分析结果"""
+    return BBTShiftDetector.from_readings(bbt_readings(data)).result()
+
+
+def _tail_date(records: Sequence[Dict[str, Any]]) -> Any:
+    return records[-1].get("date") if records else None
+
+
+def detector_current(state: Optional[Mapping[str, Any]], records: Sequence[Dict[str, Any]]) -> bool:
+    """检测器状态是否为当前版本且与记录列表对应（只比较条数和最后一条记录的日期）"""
+    return (
+        isinstance(state, Mapping)
+        and state.get("schema_version") == DETECTOR_SCHEMA_VERSION
+        and state.get("records") == len(records)
+        and state.get("tail") == _tail_date(records)
+    )
+
+
+def build_detector_state(records: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """由全部记录重建检测器状态"""
+    return {
+        **BBTShiftDetector.from_readings(bbt_readings(records)).to_state(),
+        "records": len(records),
+        "tail": _tail_date(records),
+    }
+
+
+def update_detector_state(
+    state: Optional[Mapping[str, Any]],
+    existing_records: Sequence[Dict[str, Any]],
+    result: MergeResult,
+) -> Dict[str, Any]:
+    """
+    按合并结果更新检测器状态。
+
+    只新增了日期晚于已读入体温的记录时逐条读入；修改了已有记录、补录了更早的日期或状态与记录对不上时整体重建。
+    """
+    if result.updated_records or not detector_current(state, existing_records):
+        return build_detector_state(result.records)
+    if not result.inserted_records:
+        return dict(state)
+
+    detector = BBTShiftDetector.from_state(state)
+    readings = bbt_readings(result.inserted_records)
+    if readings and detector.last_day is not None and readings[0][0] <= detector.last_day:
+        return build_detector_state(result.records)
+    for day, temperature in readings:
+        detector.push(day, temperature)
+    return {**detector.to_state(), "records": len(result.records), "tail": _tail_date(result.records)}
+
+
+def analyze_bbt(data: Optional[Records], state: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """体温分析：state是与记录对应的检测器状态时直接读取，否则一次遍历全部记录"""
+    if detector_current(state, data or []):
+        return BBTShiftDetector.from_state(state).result()
+    return detect_bbt_shift(data)
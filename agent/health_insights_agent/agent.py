@@ -4,16 +4,27 @@
 """
 
 import json
+import os
 from typing import Dict, List, Any, Optional
-from datetime import date
 
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END, START
 from langgraph.types import Command
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state, copilotkit_exit
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, ToolMessage
+from copilotkit.langgraph import copilotkit_exit
+from langchain_core.messages import AIMessage, ToolMessage
+
+from shared.history import window_history
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import get_last_user_message
+from shared.prompt_layout import context_block, layout_messages
+from shared.response_cache import CacheScope
+from shared.scores import score_labels, score_summaries
+from shared.state_emitter import emit_state
+from shared.streaming import StreamTarget, customize_config, invoke_model
+from shared.summaries import domain_summaries
+from shared.versioning import data_version
+from health_insights_agent.quick_answer import is_overview_request, render_overview
 
 HEALTH_INSIGHTS_TOOL = {
     "type": "function",
@@ -91,32 +102,29 @@ HEALTH_INSIGHTS_TOOL = {
 class HealthInsightsState(CopilotKitState):
     """健康洞察状态"""
     insights_data: Optional[Dict[str, Any]] = None
-
-def calculate_overall_health_score(
-    cycle_score: int = 50,
-    symptom_score: int = 50,
-    fertility_score: int = 50,
-    nutrition_score: int = 50,
-    exercise_score: int = 40
-) -> int:
-    """计算综合健康评分"""
-    weights = {
-        'cycle': 0.2,
-        'symptom': 0.2,
-        'fertility': 0.15,
-        'nutrition': 0.25,
-        'exercise': 0.2
-    }
     
-    weighted_score = (
-        cycle_score * weights['cycle'] +
-        symptom_score * weights['symptom'] +
-        fertility_score * weights['fertility'] +
-        nutrition_score * weights['nutrition'] +
-        exercise_score * weights['exercise']
-    )
-    
-    return int(weighted_score)
+    # 由主协调器传入的各领域数据（只读）
+    cycle_data: Optional[Dict[str, Any]] = None
+    symptom_mood_data: Optional[Dict[str, Any]] = None
+    fertility_data: Optional[Dict[str, Any]] = None
+    nutrition_data: Optional[Dict[str, Any]] = None
+    exercise_data: Optional[Dict[str, Any]] = None
+    lifestyle_data: Optional[Dict[str, Any]] = None
+
+# 数据没有变化时，整体分析类的请求是否直接按模板回答、不调用模型（1开启/0关闭）
+QUICK_ANSWER_ENABLED = os.getenv("HEALTH_INSIGHTS_QUICK_ANSWER", "1") == "1"
+
+# 提示词中读取的领域摘要，由各领域Agent在写入数据时发布
+INSIGHT_DOMAINS = (
+    "cycle_data", "symptom_mood_data", "fertility_data", "nutrition_data", "exercise_data", "lifestyle_data",
+)
+
+def render_domain_summary(summary: Optional[Dict[str, Any]]) -> str:
+    """摘要转成紧凑JSON，去掉只用于判断过期的版本字段"""
+    if summary is None:
+        return "无数据"
+    visible = {key: value for key, value in summary.items() if key not in ("schema_version", "version")}
+    return json.dumps(visible, ensure_ascii=False, separators=(",", ":"), default=str)
 
 def analyze_health_trends(data_summary: Dict) -> Dict[str, List[str]]:
     """分析健康趋势"""
@@ -181,6 +189,98 @@ def generate_priority_recommendations(data_summary: Dict) -> List[Dict]:
     
     return recommendations
 
+def build_health_insights(state: Dict[str, Any], pattern_insights: Optional[List] = None) -> Dict[str, Any]:
+    """根据各领域摘要重新计算综合健康洞察；pattern_insights由模型生成，这里原样放入"""
+    summaries = domain_summaries(state, INSIGHT_DOMAINS)
+    scores = score_summaries(summaries)
+    
+    # 生成数据概要：只列出有数据的领域评分
+    data_summary: Dict[str, Any] = {
+        f"{domain}_score": score for domain, score in scores.domains.items() if score is not None
+    }
+    data_summary["cycle_regularity"] = (summaries["cycle_data"] or {}).get("regularity") or "未知"
+    data_summary["symptom_severity"] = (summaries["symptom_mood_data"] or {}).get("average_severity") or 0
+    
+    return {
+        "overall_health_score": scores.overall,
+        "trend_analysis": analyze_health_trends(data_summary),
+        "pattern_insights": pattern_insights or [],
+        "priority_recommendations": generate_priority_recommendations(data_summary),
+        "data_summary": data_summary,
+        # 计算时各领域数据的版本，数据没有变化时洞察可以直接复用
+        "state_version": scores.state_version,
+    }
+
+# 生成中的模式洞察与各领域评分一起组装成预览推送给前端
+HEALTH_INSIGHTS_STREAM = StreamTarget(
+    "insights_data",
+    "generate_health_insights",
+    "insights_data",
+    lambda state, partial: build_health_insights(state, partial.get("pattern_insights") or []),
+)
+
+# 固定指令：每次调用逐字节相同，洞察、各领域摘要和日期放在对话末尾的当前上下文中
+HEALTH_INSIGHTS_INSTRUCTIONS = """你是专业的健康数据分析师，专门负责跨领域健康数据分析和智能洞察生成。
+
+当前洞察数据和可用的各领域健康数据（月经周期、症状情绪、生育健康、营养健康、运动健康、生活方式）见对话末尾的当前数据。
+
+你的核心功能：
+1. 📊 综合健康评分计算
+2. 📈 健康趋势分析
+3. 🔍 健康模式识别
+4. 💡 优先级建议生成
+5. 📋 跨领域数据关联分析
+
+分析重点：
+- 识别各健康领域之间的关联模式
+- 发现潜在的健康风险或机会
+- 提供个性化的改善建议
+- 追踪健康趋势变化
+
+重要指导原则：
+- 基于多维度数据进行综合分析
+- 提供科学、实用的健康建议
+- 识别需要优先关注的健康问题
+- 支持中英文用户交互
+- 当用户询问健康状况分析时，调用generate_health_insights工具
+- 今日日期见对话末尾的当前数据
+
+使用示例：
+用户说："分析我的健康状况" → 生成综合健康洞察
+用户说："我的健康趋势如何" → 分析健康趋势
+用户说："给我一些健康建议" → 提供优先级建议
+"""
+
+def build_health_insights_context(state: Dict[str, Any]) -> str:
+    """健康洞察提示词中每轮变化的部分：当前洞察、各领域摘要和今日日期"""
+    try:
+        # 版本字段只用于判断数据是否变化，不放进提示词
+        visible_insights = {
+            key: value for key, value in state["insights_data"].items()
+            if key not in ("state_version", "analyzed_version")
+        }
+        insights_json = json.dumps(visible_insights, ensure_ascii=False, separators=(",", ":"))
+    except Exception as e:
+        insights_json = f"数据序列化错误: {str(e)}"
+
+    # 各领域只带固定体量的摘要，与历史记录条数无关
+    domain_context = {
+        key: render_domain_summary(summary)
+        for key, summary in domain_summaries(state, INSIGHT_DOMAINS).items()
+    }
+
+    return context_block(
+        f"当前洞察数据: {insights_json}",
+        f"""可用的健康数据：
+- 月经周期数据: {domain_context["cycle_data"]}
+- 症状情绪数据: {domain_context["symptom_mood_data"]}
+- 生育健康数据: {domain_context["fertility_data"]}
+- 营养健康数据: {domain_context["nutrition_data"]}
+- 运动健康数据: {domain_context["exercise_data"]}
+- 生活方式数据: {domain_context["lifestyle_data"]}
+（各领域为摘要：counts为各记录列表的总条数，recent_开头的字段为最近几条记录）""",
+    )
+
 async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     """健康洞察流程入口点"""
     
@@ -196,7 +296,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
             "priority_recommendations": [],
             "data_summary": {}
         }
-        await copilotkit_emit_state(config, state)
+        await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
@@ -218,79 +318,49 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             "data_summary": {}
         }
 
-    try:
-        insights_json = json.dumps(state["insights_data"], indent=2)
-    except Exception as e:
-        insights_json = f"数据序列化错误: {str(e)}"
-    
-    # 获取其他agent的数据进行综合分析
-    cycle_data = state.get("cycle_data", {})
-    symptom_data = state.get("symptom_mood_data", {})
-    fertility_data = state.get("fertility_data", {})
-    nutrition_data = state.get("nutrition_data", {})
-    exercise_data = state.get("exercise_data", {})
-    
-    system_prompt = f"""你是专业的健康数据分析师，专门负责跨领域健康数据分析和智能洞察生成。
-
-当前洞察数据: {insights_json}
-
-可用的健康数据：
-- 月经周期数据: {json.dumps(cycle_data, indent=2) if cycle_data else "无数据"}
-- 症状情绪数据: {json.dumps(symptom_data, indent=2) if symptom_data else "无数据"}
-- 生育健康数据: {json.dumps(fertility_data, indent=2) if fertility_data else "无数据"}
-- 营养健康数据: {json.dumps(nutrition_data, indent=2) if nutrition_data else "无数据"}
-- 运动健康数据: {json.dumps(exercise_data, indent=2) if exercise_data else "无数据"}
-
-你的核心功能：
-1. 📊 综合健康评分计算
-2. 📈 健康趋势分析
-3. 🔍 健康模式识别
-4. 💡 优先级建议生成
-5. 📋 跨领域数据关联分析
-
-分析重点：
-- 识别各健康领域之间的关联模式
-- 发现潜在的健康风险或机会
-- 提供个性化的改善建议
-- 追踪健康趋势变化
-
-重要指导原则：
-- 基于多维度数据进行综合分析
-- 提供科学、实用的健康建议
-- 识别需要优先关注的健康问题
-- 支持中英文用户交互
-- 当用户询问健康状况分析时，调用generate_health_insights工具
-- 今日日期：{date.today().isoformat()}
-
-使用示例：
-用户说："分析我的健康状况" → 生成综合健康洞察
-用户说："我的健康趋势如何" → 分析健康趋势
-用户说："给我一些健康建议" → 提供优先级建议
-"""
+    # 领域数据变化后先在本地重算评分和建议（按数据版本缓存），模型生成的pattern_insights保留
+    previous_insights = state["insights_data"]
+    state["insights_data"] = {
+        **build_health_insights(state, previous_insights.get("pattern_insights", [])),
+        "analyzed_version": previous_insights.get("analyzed_version"),
+    }
 
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "insights_data",
-            "tool": "generate_health_insights",
-            "tool_argument": "insights_data"
-        }],
-    )
+    config = customize_config(config, HEALTH_INSIGHTS_STREAM)
+
+    # 上次模型分析之后数据没有变化，整体分析类的请求直接按模板回答
+    insights_data = state["insights_data"]
+    if (
+        QUICK_ANSWER_ENABLED
+        and insights_data["analyzed_version"] == insights_data["state_version"]
+        and is_overview_request(get_last_user_message(state.get("messages", [])))
+    ):
+        answer = AIMessage(content=render_overview(insights_data, score_labels(INSIGHT_DOMAINS)))
+        messages = state.get("messages", []) + [answer]
+        await copilotkit_exit(config)
+        return Command(
+            goto=END,
+            update={
+                "messages": messages,
+                "insights_data": insights_data
+            }
+        )
 
-    model_with_tools = model.bind_tools(
-        [*state.get("copilotkit", {}).get("actions", []), HEALTH_INSIGHTS_TOOL],
+    model_with_tools = get_model_with_tools(
+        [HEALTH_INSIGHTS_TOOL],
+        actions=state.get("copilotkit", {}).get("actions", []),
+        response_cache=CacheScope("health_insights", data_version(state["insights_data"], (), ("analyzed_version",))),
         parallel_tool_calls=False,
     )
 
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+    response = await invoke_model(model_with_tools, layout_messages(
+        "health_insights",
+        HEALTH_INSIGHTS_INSTRUCTIONS,
+        build_health_insights_context(state),
+        window_history(state.get("messages", []), config),
+    ), config, state, HEALTH_INSIGHTS_STREAM)
 
     messages = state.get("messages", []) + [response]
     
@@ -309,40 +379,9 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
         if tool_call_name == "generate_health_insights":
             new_insights_data = tool_call_args["insights_data"]
             
-            # 从各agent数据中提取评分
-            cycle_score = cycle_data.get("cycle_insights", {}).get("cycle_health_score", 50)
-            nutrition_score = nutrition_data.get("nutrition_insights", {}).get("nutrition_score", 50)
-            exercise_score = exercise_data.get("activity_score", 40)
-            
-            # 计算综合健康评分
-            overall_score = calculate_overall_health_score(
-                cycle_score=cycle_score,
-                nutrition_score=nutrition_score,
-                exercise_score=exercise_score
-            )
-            
-            # 生成数据概要
-            data_summary = {
-                "cycle_score": cycle_score,
-                "nutrition_score": nutrition_score,
-                "exercise_score": exercise_score,
-                "cycle_regularity": cycle_data.get("cycle_insights", {}).get("regularity", "未知"),
-                "symptom_severity": len(symptom_data.get("symptoms", [])),
-            }
-            
-            # 分析趋势
-            trends = analyze_health_trends(data_summary)
-            
-            # 生成建议
-            recommendations = generate_priority_recommendations(data_summary)
-            
-            insights_data = {
-                "overall_health_score": overall_score,
-                "trend_analysis": trends,
-                "pattern_insights": new_insights_data.get("pattern_insights", []),
-                "priority_recommendations": recommendations,
-                "data_summary": data_summary
-            }
+            insights_data = build_health_insights(state, new_insights_data.get("pattern_insights", []))
+            # 记录这次模型分析对应的数据版本，数据不变时后续的整体分析请求不再调用模型
+            insights_data["analyzed_version"] = insights_data["state_version"]
             
             tool_response = ToolMessage(
                 content="健康洞察生成成功",
@@ -352,7 +391,7 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             messages = messages + [tool_response]
             
             updated_state = {**state, "insights_data": insights_data, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
+            await emit_state(config, updated_state, final=True)
             
             return Command(
                 goto=END,
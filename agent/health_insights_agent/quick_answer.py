@@ -0,0 +1,103 @@
+"""
+健康洞察快速回答 - 数据没有变化时，"分析我的健康状况"一类的请求不调用模型
+单一职责：识别只要求整体分析/趋势/建议的消息，用已有的洞察按模板生成回答；
+具体的、开放式的问题仍交给模型
+"""
+
+from typing import Any, List, Mapping, Sequence
+
+from shared.keyword_matcher import KeywordMatcher
+
+# 表示"整体分析"的说法
+OVERVIEW_PHRASES = [
+    '分析我的健康', '健康状况', '健康情况', '身体状况', '身体情况', '健康怎么样', '身体怎么样',
+    '健康趋势', '健康报告', '健康分析', '综合分析', '整体分析', '健康评分', '健康建议', '分析一下',
+    'how am i doing', "how's my health", 'how is my health', 'health status', 'health summary',
+    'health report', 'health trend', 'health trends', 'analyze my health', 'analyse my health',
+    'overall health', 'health score', 'health advice',
+]
+# 不改变意图的虚词和客套话
+FILLER_PHRASES = [
+    '我', '的', '请', '帮我', '给我', '一下', '一些', '吗', '呢', '啊', '吧', '了', '怎么样', '如何',
+    '现在', '最近', '目前', '整体', '看看', '说说', '最新', '有什么', '一份',
+    'please', 'can', 'you', 'me', 'my', 'i', 'the', 'a', 'give', 'show', 'what', 'is', 'about',
+    'current', 'overall', 'latest', 'some', 'quick',
+]
+# 去掉上述说法后最多允许剩下的字符数；"分析一下我的睡眠"中剩下的"睡眠"就是具体问题，所以为0
+QUICK_ANSWER_MAX_REMAINDER = 0
+
+_MATCHER = KeywordMatcher({"overview": OVERVIEW_PHRASES, "filler": FILLER_PHRASES})
+
+_PRIORITY_LABELS = {"High": "高", "Medium": "中", "Low": "低"}
+
+
+def is_overview_request(message: str) -> bool:
+    """消息是否只是要求整体分析（命中整体分析的说法，其余只有虚词）"""
+    if not message:
+        return False
+    text = message.lower()
+    covered = [False] * len(text)
+    overview = False
+    for hit in _MATCHER.iter_matches(text):
+        end = hit.offset + len(hit.keyword)
+        overview = overview or "overview" in hit.labels
+        covered[hit.offset:end] = [True] * len(hit.keyword)
+    if not overview:
+        return False
+    remainder = sum(1 for char, done in zip(text, covered) if not done and char.isalnum())
+    return remainder <= QUICK_ANSWER_MAX_REMAINDER
+
+
+def _join(items: Sequence[str]) -> str:
+    return "、".join(items) if items else "无"
+
+
+def _pattern_lines(patterns: Sequence[Any]) -> List[str]:
+    lines = []
+    for pattern in patterns:
+        if isinstance(pattern, Mapping):
+            text = "：".join(str(pattern[key]) for key in ("pattern", "description") if pattern.get(key))
+            if pattern.get("recommendation"):
+                text += f"（建议：{pattern['recommendation']}）"
+        else:
+            text = str(pattern)
+        if text:
+            lines.append(f"- {text}")
+    return lines
+
+
+def render_overview(insights_data: Mapping[str, Any], labels: Mapping[str, str]) -> str:
+    """按模板把洞察写成回答；labels为 {领域: 中文名称}"""
+    data_summary = insights_data.get("data_summary") or {}
+    trends = insights_data.get("trend_analysis") or {}
+
+    domain_scores = [
+        f"{label}{data_summary[f'{domain}_score']:.0f}分"
+        for domain, label in labels.items()
+        if data_summary.get(f"{domain}_score") is not None
+    ]
+    lines = [
+        f"根据目前的记录，您的综合健康评分为{insights_data.get('overall_health_score', 50)}分。",
+        f"各领域评分：{_join(domain_scores)}。",
+        f"改善中：{_join(trends.get('improving_areas') or [])}；"
+        f"需要关注：{_join(trends.get('declining_areas') or [])}；"
+        f"保持稳定：{_join(trends.get('stable_areas') or [])}。",
+    ]
+
+    recommendations = insights_data.get("priority_recommendations") or []
+    if recommendations:
+        lines.append("优先建议：")
+        for index, item in enumerate(recommendations, 1):
+            priority = _PRIORITY_LABELS.get(item.get("priority"), item.get("priority", ""))
+            lines.append(
+                f"{index}. [{priority}] {item.get('category', '')}：{item.get('recommendation', '')}"
+                + (f"（{item['timeline']}）" if item.get("timeline") else "")
+            )
+
+    patterns = _pattern_lines(insights_data.get("pattern_insights") or [])
+    if patterns:
+        lines.append("已发现的模式：")
+        lines.extend(patterns)
+
+    lines.append("（自上次分析以来各项记录没有变化，以上为最新的分析结果；如有具体问题可以继续问我。）")
+    return "\n".join(lines)
\ No newline at end of file
@@ -5,16 +5,36 @@
 
 import json
 from enum import Enum
-from typing import Dict, List, Any, Optional
+from typing import Dict, Any, Optional
 from datetime import date
 
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END, START
 from langgraph.types import Command
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state, copilotkit_exit
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, ToolMessage
+from copilotkit.langgraph import copilotkit_exit
+from langchain_core.messages import ToolMessage
+
+from shared.history import window_history
+from shared.merge import LAST_WRITE_WINS, collection, merge_collections
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import CONTEXT_NOTE, build_prompt_context, get_last_user_message
+from shared.prompt_layout import context_block, layout_messages
+from shared.quick_log import (
+    QUICK_LOG_ENABLED,
+    QuickLogParser,
+    alias_vocabulary,
+    log_date,
+    quick_log_response,
+    render_aliases,
+)
+from shared.response_cache import CacheScope
+from shared.scores import ScoreProvider, field_score
+from shared.state_emitter import emit_state
+from shared.streaming import StreamTarget, customize_config, invoke_model, merge_preview
+from shared.summaries import SUMMARY_FIELD, SUMMARY_RECENT_EVENTS, SummaryProvider, event
+from shared.timeseries import Records, tail_items
+from shared.versioning import REVISION_FIELD, next_revision
 
 class SleepQuality(str, Enum):
     EXCELLENT = "Excellent"
@@ -28,6 +48,20 @@ class StressLevel(str, Enum):
     HIGH = "High"
     VERY_HIGH = "Very High"
 
+# 中文说法对照：提示词中的中文翻译和本地快速记录共用（"一般"两边都有，按消息说的是睡眠还是压力区分）
+SLEEP_QUALITY_ALIASES = {
+    SleepQuality.EXCELLENT: ("优秀", "很好"),
+    SleepQuality.GOOD: ("良好", "好"),
+    SleepQuality.FAIR: ("一般", "还行"),
+    SleepQuality.POOR: ("差", "不好"),
+}
+STRESS_LEVEL_ALIASES = {
+    StressLevel.LOW: ("低压力", "轻松"),
+    StressLevel.MODERATE: ("中等压力", "一般"),
+    StressLevel.HIGH: ("高压力", "紧张"),
+    StressLevel.VERY_HIGH: ("很高压力", "非常紧张"),
+}
+
 LIFESTYLE_TOOL = {
     "type": "function",
     "function": {
@@ -98,6 +132,60 @@ LIFESTYLE_TOOL = {
     }
 }
 
+# 会随时间增长的记录列表，提示词中只展示计数、最近和相关条目
+LIFESTYLE_COLLECTIONS = ("sleep_records", "stress_tracking")
+
+# 各记录列表的自然键和冲突策略：每天一条睡眠和压力记录，同日重新记录以最新为准
+LIFESTYLE_MERGE_SPECS = {
+    "sleep_records": collection("date", policy=LAST_WRITE_WINS),
+    "stress_tracking": collection("date", policy=LAST_WRITE_WINS),
+}
+
+# 睡眠质量和压力等级对应的分数（评分函数和NumPy后端共用）
+SLEEP_QUALITY_SCORES = {
+    "Excellent": 10,
+    "Good": 8,
+    "Fair": 6,
+    "Poor": 3
+}
+SLEEP_TREND_SCORES = {
+    "Excellent": 4,
+    "Good": 3,
+    "Fair": 2,
+    "Poor": 1
+}
+STRESS_LEVEL_SCORES = {
+    "Low": 10,
+    "Moderate": 7,
+    "High": 4,
+    "Very High": 1
+}
+
+# 快速记录中的睡眠时长单位 -> 额外的小时数（"6个半小时"）
+SLEEP_HOUR_UNITS = {
+    "小时": 0, "个小时": 0, "个钟": 0, "个钟头": 0, "h": 0, "hr": 0, "hrs": 0, "hour": 0, "hours": 0,
+    "个半小时": 0.5, "个半钟头": 0.5,
+}
+# 单条快速记录允许的睡眠时长上限（小时）
+MAX_QUICK_LOG_SLEEP_HOURS = 16
+
+# 睡眠和压力分开解析，同一条消息两者都有时交给模型
+SLEEP_QUICK_LOG = QuickLogParser(
+    {
+        "sleep": {"睡": "sleep", "睡了": "sleep", "睡觉": "sleep", "睡眠": "sleep", "sleep": "sleep", "slept": "sleep"},
+        "unit": SLEEP_HOUR_UNITS,
+        "quality": alias_vocabulary(SLEEP_QUALITY_ALIASES),
+    },
+    fillers=("质量", "得", "整体", "还", "for", "quality"),
+)
+STRESS_QUICK_LOG = QuickLogParser(
+    {
+        "stress": {"压力": "stress", "stress": "stress"},
+        "level": alias_vocabulary(STRESS_LEVEL_ALIASES),
+    },
+    fillers=("水平", "还", "level"),
+)
+
 class LifestyleState(CopilotKitState):
     lifestyle_data: Optional[Dict[str, Any]] = None
 
@@ -107,13 +195,10 @@ def calculate_lifestyle_score(lifestyle_data: Dict) -> int:
     
     # 睡眠质量评分
     if lifestyle_data.get("sleep_records"):
-        recent_sleep = lifestyle_data["sleep_records"][-7:]
+        recent_sleep = tail_items(lifestyle_data["sleep_records"], "sleep_duration_hours", "sleep_quality", 7, 7, "Fair")
         sleep_scores = []
         
-        for record in recent_sleep:
-            duration = record.get("sleep_duration_hours", 7)
-            quality = record.get("sleep_quality", "Fair")
-            
+        for quality, duration in recent_sleep:
             # 睡眠时长评分
             if 7 <= duration <= 9:
                 duration_score = 10
@@ -123,13 +208,7 @@ def calculate_lifestyle_score(lifestyle_data: Dict) -> int:
                 duration_score = 5
             
             # 睡眠质量评分
-            quality_scores = {
-                "Excellent": 10,
-                "Good": 8,
-                "Fair": 6,
-                "Poor": 3
-            }
-            quality_score = quality_scores.get(quality, 6)
+            quality_score = SLEEP_QUALITY_SCORES.get(quality, 6)
             
             sleep_scores.append((duration_score + quality_score) / 2)
         
@@ -144,13 +223,7 @@ def calculate_lifestyle_score(lifestyle_data: Dict) -> int:
         
         for record in recent_stress:
             stress_level = record.get("stress_level", "Moderate")
-            stress_level_scores = {
-                "Low": 10,
-                "Moderate": 7,
-                "High": 4,
-                "Very High": 1
-            }
-            stress_scores.append(stress_level_scores.get(stress_level, 7))
+            stress_scores.append(STRESS_LEVEL_SCORES.get(stress_level, 7))
         
         if stress_scores:
             avg_stress_score = sum(stress_scores) / len(stress_scores)
@@ -158,20 +231,15 @@ def calculate_lifestyle_score(lifestyle_data: Dict) -> int:
     
     return min(score, 100)
 
-def analyze_sleep_trend(sleep_records: List[Dict]) -> str:
+def analyze_sleep_trend(sleep_records: Records) -> str:
     """分析睡眠趋势"""
     if len(sleep_records) < 3:
         return "数据不足"
     
-    recent_records = sleep_records[-7:]
-    quality_scores = {
-        "Excellent": 4,
-        "Good": 3,
-        "Fair": 2,
-        "Poor": 1
-    }
-    
-    scores = [quality_scores.get(record.get("sleep_quality", "Fair"), 2) for record in recent_records]
+    recent_qualities = [
+        quality for quality, _ in tail_items(sleep_records, "sleep_duration_hours", "sleep_quality", 7, 7, "Fair")
+    ]
+    scores = [SLEEP_TREND_SCORES.get(quality, 2) for quality in recent_qualities]
     avg_score = sum(scores) / len(scores)
     
     if avg_score >= 3.5:
@@ -181,6 +249,101 @@ def analyze_sleep_trend(sleep_records: List[Dict]) -> str:
     else:
         return "睡眠质量需要改善"
 
+def build_lifestyle_insights(lifestyle_data: Dict) -> Dict[str, Any]:
+    """根据睡眠和压力记录重新计算生活方式洞察"""
+    lifestyle_score = calculate_lifestyle_score(lifestyle_data)
+    sleep_trend = analyze_sleep_trend(lifestyle_data.get("sleep_records") or [])
+    
+    recommendations = []
+    if lifestyle_score < 60:
+        recommendations.append("建议改善整体生活方式，重点关注睡眠和压力管理")
+    
+    if sleep_trend == "睡眠质量需要改善":
+        recommendations.append("建立规律作息，创造良好睡眠环境")
+    
+    return {
+        "lifestyle_score": lifestyle_score,
+        "sleep_quality_trend": sleep_trend,
+        "stress_management_effectiveness": "需要更多数据评估",
+        "recommendations": recommendations
+    }
+
+def build_lifestyle_summary(lifestyle_data: Dict) -> Dict[str, Any]:
+    """生活方式摘要：评分、睡眠趋势和最近几次睡眠与压力记录"""
+    insights = lifestyle_data.get("lifestyle_insights") or {}
+    sleep_records = lifestyle_data.get("sleep_records") or []
+    stress_tracking = lifestyle_data.get("stress_tracking") or []
+    return {
+        "lifestyle_score": insights.get("lifestyle_score"),
+        "sleep_quality_trend": insights.get("sleep_quality_trend"),
+        "counts": {"sleep_records": len(sleep_records), "stress_tracking": len(stress_tracking)},
+        "recent_sleep": [
+            event(
+                record.get("date"),
+                f"{record['sleep_duration_hours']}h" if record.get("sleep_duration_hours") is not None else None,
+                record.get("sleep_quality"),
+            )
+            for record in sleep_records[-SUMMARY_RECENT_EVENTS:]
+        ],
+        "recent_stress": [
+            event(record.get("date"), record.get("stress_level"))
+            for record in stress_tracking[-SUMMARY_RECENT_EVENTS:]
+        ],
+    }
+
+# 供健康洞察读取的生活方式摘要
+SUMMARY_PROVIDER = SummaryProvider(LIFESTYLE_COLLECTIONS, build_lifestyle_summary)
+SCORE_PROVIDER = ScoreProvider("lifestyle", "生活方式", field_score("lifestyle_score"))
+
+# 生成中的睡眠/压力记录按合并规则并入已有数据后推送给前端
+LIFESTYLE_STREAM = StreamTarget(
+    "lifestyle_data",
+    "update_lifestyle_data",
+    "lifestyle_data",
+    merge_preview("lifestyle_data", LIFESTYLE_MERGE_SPECS),
+)
+
+# 固定指令：每次调用逐字节相同，数据和日期放在对话末尾的当前上下文中
+LIFESTYLE_INSTRUCTIONS = f"""你是专业的生活方式健康顾问，专门负责睡眠、压力和生活习惯的追踪与优化指导。
+
+你的核心功能：
+1. 😴 睡眠质量追踪和改善建议
+2. 😰 压力水平监测和管理策略
+3. 📈 生活方式健康评分
+4. 💡 个性化生活习惯建议
+
+睡眠质量：Excellent(优秀), Good(良好), Fair(一般), Poor(差)
+压力水平：Low(低), Moderate(中等), High(高), Very High(很高)
+
+中文翻译：
+{render_aliases(SLEEP_QUALITY_ALIASES)}
+{render_aliases(STRESS_LEVEL_ALIASES)}
+
+指导原则：
+- 专注于生活方式健康指导
+- 当用户提供睡眠或压力相关信息时，调用update_lifestyle_data工具
+- 提供科学的睡眠和压力管理建议
+- 今日日期见对话末尾的当前数据
+
+示例：
+"昨晚11点睡觉，7点起床，睡得很好" → 记录睡眠数据
+"今天压力很大，工作太忙了" → 记录压力水平
+"最近失眠" → 提供睡眠改善建议
+"""
+
+def build_lifestyle_context(state: Dict[str, Any]) -> str:
+    """生活方式追踪提示词中每轮变化的部分：当前数据摘要和今日日期"""
+    try:
+        lifestyle_json = build_prompt_context(
+            state["lifestyle_data"],
+            LIFESTYLE_COLLECTIONS,
+            get_last_user_message(state.get("messages", [])),
+        )
+    except Exception as e:
+        lifestyle_json = f"数据序列化错误: {str(e)}"
+
+    return context_block(f"当前生活方式数据: {lifestyle_json}\n{CONTEXT_NOTE}")
+
 async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     """生活方式追踪流程入口点"""
     
@@ -199,7 +362,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
                 ]
             }
         }
-        await copilotkit_emit_state(config, state)
+        await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
@@ -224,69 +387,33 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             }
         }
 
-    try:
-        lifestyle_json = json.dumps(state["lifestyle_data"], indent=2)
-    except Exception as e:
-        lifestyle_json = f"数据序列化错误: {str(e)}"
-    
-    system_prompt = f"""你是专业的生活方式健康顾问，专门负责睡眠、压力和生活习惯的追踪与优化指导。
-
-当前生活方式数据: {lifestyle_json}
-
-你的核心功能：
-1. 😴 睡眠质量追踪和改善建议
-2. 😰 压力水平监测和管理策略
-3. 📈 生活方式健康评分
-4. 💡 个性化生活习惯建议
-
-睡眠质量：Excellent(优秀), Good(良好), Fair(一般), Poor(差)
-压力水平：Low(低), Moderate(中等), High(高), Very High(很高)
-
-中文翻译：
-- 优秀/很好 → Excellent
-- 良好/好 → Good  
-- 一般/还行 → Fair
-- 差/不好 → Poor
-- 低压力/轻松 → Low
-- 中等压力/一般 → Moderate
-- 高压力/紧张 → High
-- 很高压力/非常紧张 → Very High
-
-指导原则：
-- 专注于生活方式健康指导
-- 当用户提供睡眠或压力相关信息时，调用update_lifestyle_data工具
-- 提供科学的睡眠和压力管理建议
-- 今日日期：{date.today().isoformat()}
-
-示例：
-"昨晚11点睡觉，7点起床，睡得很好" → 记录睡眠数据
-"今天压力很大，工作太忙了" → 记录压力水平
-"最近失眠" → 提供睡眠改善建议
-"""
-
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "lifestyle_data",
-            "tool": "update_lifestyle_data",
-            "tool_argument": "lifestyle_data"
-        }],
-    )
+    config = customize_config(config, LIFESTYLE_STREAM)
 
-    model_with_tools = model.bind_tools(
-        [*state.get("copilotkit", {}).get("actions", []), LIFESTYLE_TOOL],
-        parallel_tool_calls=False,
-    )
+    # 结构化的快速记录在本地解析成同样的工具调用，不调用模型
+    response = None
+    if QUICK_LOG_ENABLED:
+        response = quick_log_response(
+            "update_lifestyle_data",
+            extract_lifestyle_log(get_last_user_message(state.get("messages", []))),
+        )
 
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+    if response is None:
+        model_with_tools = get_model_with_tools(
+            [LIFESTYLE_TOOL],
+            actions=state.get("copilotkit", {}).get("actions", []),
+            response_cache=CacheScope("lifestyle", SUMMARY_PROVIDER.version(state["lifestyle_data"])),
+            parallel_tool_calls=False,
+        )
+
+        response = await invoke_model(model_with_tools, layout_messages(
+            "lifestyle",
+            LIFESTYLE_INSTRUCTIONS,
+            build_lifestyle_context(state),
+            window_history(state.get("messages", []), config),
+        ), config, state, LIFESTYLE_STREAM)
 
     messages = state.get("messages", []) + [response]
     
@@ -306,47 +433,26 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             new_lifestyle_data = tool_call_args["lifestyle_data"]
             existing_data = state.get("lifestyle_data", {})
             
+            merged_collections, merge_summary = merge_collections(existing_data, new_lifestyle_data, LIFESTYLE_MERGE_SPECS)
             lifestyle_data = {
-                "sleep_records": existing_data.get("sleep_records", []).copy(),
-                "stress_tracking": existing_data.get("stress_tracking", []).copy(),
-                "lifestyle_insights": existing_data.get("lifestyle_insights", {})
+                **merged_collections,
+                "lifestyle_insights": existing_data.get("lifestyle_insights", {}),
+                REVISION_FIELD: next_revision(existing_data, merge_summary.changed)
             }
             
-            if "sleep_records" in new_lifestyle_data:
-                for new_sleep in new_lifestyle_data["sleep_records"]:
-                    lifestyle_data["sleep_records"].append(new_sleep)
-            
-            if "stress_tracking" in new_lifestyle_data:
-                for new_stress in new_lifestyle_data["stress_tracking"]:
-                    lifestyle_data["stress_tracking"].append(new_stress)
-            
             # 重新计算生活方式洞察
-            lifestyle_score = calculate_lifestyle_score(lifestyle_data)
-            sleep_trend = analyze_sleep_trend(lifestyle_data["sleep_records"])
-            
-            recommendations = []
-            if lifestyle_score < 60:
-                recommendations.append("建议改善整体生活方式，重点关注睡眠和压力管理")
-            
-            if sleep_trend == "睡眠质量需要改善":
-                recommendations.append("建立规律作息，创造良好睡眠环境")
-            
-            lifestyle_data["lifestyle_insights"] = {
-                "lifestyle_score": lifestyle_score,
-                "sleep_quality_trend": sleep_trend,
-                "stress_management_effectiveness": "需要更多数据评估",
-                "recommendations": recommendations
-            }
+            lifestyle_data["lifestyle_insights"] = build_lifestyle_insights(lifestyle_data)
+            lifestyle_data[SUMMARY_FIELD] = SUMMARY_PROVIDER.publish(lifestyle_data)
             
             tool_response = ToolMessage(
-                content="生活方式数据更新成功",
+                content=f"生活方式数据更新成功（{merge_summary.describe()}）",
                 tool_call_id=tool_call_id
             )
             
             messages = messages + [tool_response]
             
             updated_state = {**state, "lifestyle_data": lifestyle_data, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
+            await emit_state(config, updated_state, final=True)
             
             return Command(
                 goto=END,
@@ -365,6 +471,52 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
         }
     )
 
+def _extract_sleep(message: str, today: Optional[date]) -> Optional[Dict[str, Any]]:
+    tokens = SLEEP_QUICK_LOG.parse(message)
+    record_date = log_date(tokens, today) if tokens else None
+    if record_date is None or not any(token.kind == "sleep" for token in tokens):
+        return None
+
+    record: Dict[str, Any] = {"date": record_date}
+    for index, token in enumerate(tokens):
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if token.kind == "number":
+            if "sleep_duration_hours" in record or following is None or following.kind != "unit":
+                return None
+            hours = token.value + following.value
+            if not 0 < hours <= MAX_QUICK_LOG_SLEEP_HOURS:
+                return None
+            record["sleep_duration_hours"] = hours
+        elif token.kind == "unit":
+            if index == 0 or tokens[index - 1].kind != "number":
+                return None
+        elif token.kind == "quality":
+            if "sleep_quality" in record:
+                return None
+            record["sleep_quality"] = token.value
+    if len(record) == 1:
+        return None
+    return {"lifestyle_data": {"sleep_records": [record]}}
+
+def _extract_stress(message: str, today: Optional[date]) -> Optional[Dict[str, Any]]:
+    tokens = STRESS_QUICK_LOG.parse(message)
+    record_date = log_date(tokens, today) if tokens else None
+    if record_date is None or not ("压力" in message or "stress" in message.lower()):
+        return None
+    levels = {token.value for token in tokens if token.kind == "level"}
+    if len(levels) != 1 or any(token.kind == "number" for token in tokens):
+        return None
+    return {"lifestyle_data": {"stress_tracking": [{"date": record_date, "stress_level": levels.pop()}]}}
+
+def extract_lifestyle_log(message: str, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    "昨晚睡了6小时质量一般"、"今天压力一般" 一类的快速记录解析成update_lifestyle_data的参数。
+
+    睡眠需要提到睡眠且给出带单位的时长或质量，压力需要提到压力和一个等级；
+    就寝/起床时间、压力来源等需要理解的内容交给模型处理。
+    """
+    return _extract_sleep(message, today) or _extract_stress(message, today)
+
 workflow = StateGraph(LifestyleState)
 workflow.add_node("start_flow", start_flow)
 workflow.add_node("chat_node", chat_node)
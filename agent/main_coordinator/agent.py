@@ -4,7 +4,11 @@
 """
 
 import json
+import os
 import re
+import time
+from collections import deque
+from statistics import median
 from typing import Dict, List, Any, Optional
 from datetime import date
 
@@ -15,13 +19,32 @@ from langgraph.types import Command
 
 # CopilotKit imports
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state
+from copilotkit.langgraph import copilotkit_customize_config
 
 # OpenAI imports
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, ToolMessage
+from langchain_core.messages import ToolMessage
 from copilotkit.langgraph import copilotkit_exit
 
+from shared.keyword_matcher import KeywordMatcher
+from shared.history import window_history
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import get_last_user_message
+from shared.prompt_layout import context_block, layout_messages
+from shared.response_cache import CacheScope
+from shared.state_emitter import emit_state
+from shared.versioning import data_version
+from main_coordinator.specialists import SpecialistSpec, is_placeholder, make_fan_out_node, make_specialist_node
+
+# 专门Agent子图
+from cycle_tracker_agent.agent import graph as cycle_tracker_graph
+from symptom_mood_agent.agent import graph as symptom_mood_graph
+from fertility_agent.agent import graph as fertility_graph
+from nutrition_agent.agent import graph as nutrition_graph
+from exercise_agent.agent import graph as exercise_graph
+from health_insights_agent.agent import graph as health_insights_graph
+from lifestyle_agent.agent import graph as lifestyle_graph
+from recipe_agent.agent import graph as recipe_graph
+
 class AgentRoute:
     """Agent路由判断"""
     CYCLE_TRACKER = "cycle_tracker"
@@ -84,72 +107,177 @@ class MainCoordinatorState(CopilotKitState):
     
     # 路由和协调信息
     current_route: Optional[str] = None
+    current_routes: Optional[List[str]] = None
     user_intent: Optional[str] = None
 
-def classify_user_intent(message: str) -> Dict[str, Any]:
-    """分析用户意图并返回路由建议"""
-    message_lower = message.lower()
-    
+# 路由目标 -> 内嵌子图及状态键映射
+SPECIALISTS = {
+    AgentRoute.CYCLE_TRACKER: SpecialistSpec(cycle_tracker_graph, "cycle_data", "cycle_data"),
+    AgentRoute.SYMPTOM_MOOD: SpecialistSpec(symptom_mood_graph, "symptom_mood_data", "tracking_data"),
+    AgentRoute.FERTILITY: SpecialistSpec(fertility_graph, "fertility_data", "fertility_data"),
+    AgentRoute.NUTRITION: SpecialistSpec(nutrition_graph, "nutrition_data", "nutrition_data"),
+    AgentRoute.EXERCISE: SpecialistSpec(exercise_graph, "exercise_data", "exercise_data"),
+    AgentRoute.HEALTH_INSIGHTS: SpecialistSpec(
+        health_insights_graph,
+        "health_insights_data",
+        "insights_data",
+        context_keys=("cycle_data", "symptom_mood_data", "fertility_data", "nutrition_data", "exercise_data", "lifestyle_data")
+    ),
+    AgentRoute.LIFESTYLE: SpecialistSpec(lifestyle_graph, "lifestyle_data", "lifestyle_data"),
+    AgentRoute.RECIPE: SpecialistSpec(recipe_graph, "recipe_data", "recipe"),
+}
+
+# LLM路由时展示各领域是否已初始化（状态键 -> 名称），响应缓存也按这些状态区分
+ROUTER_STATUS_LABELS = {
+    "cycle_data": "经期追踪",
+    "symptom_mood_data": "症状情绪",
+    "fertility_data": "生育健康",
+    "nutrition_data": "营养健康",
+    "exercise_data": "运动健康",
+    "health_insights_data": "健康洞察",
+    "lifestyle_data": "生活方式",
+    "recipe_data": "食谱助手",
+}
+
+# LLM路由的固定指令：每次调用逐字节相同，系统状态和用户消息放在对话末尾的当前上下文中
+ROUTER_INSTRUCTIONS = """你是女性经期健康助手的主协调器，负责智能路由用户请求到最合适的专门Agent。
+
+可用的专门Agent：
+1. 📅 cycle_tracker - 经期追踪（记录月经日期、流量、周期计算）
+2. 🩹 symptom_mood - 症状情绪（记录身体症状和情绪状态）
+3. 🌱 fertility - 生育健康（排卵跟踪、受孕支持）
+4. 🥗 nutrition - 营养健康（营养指导、补充建议）
+5. 🏃‍♀️ exercise - 运动健康（运动推荐、健身计划）
+6. 🧠 health_insights - 健康洞察（AI分析、趋势预测）
+7. 🏠 lifestyle - 生活方式（睡眠、压力、生活习惯）
+8. 🍳 recipe - 食谱助手（食谱创建、烹饪指导）
+
+路由决策原则：
+- 分析用户消息的核心意图
+- 识别关键词和上下文
+- 选择最合适的专门Agent
+- 如果涉及多个领域，优先选择最主要的需求
+- 当意图不明确时，提供友好的引导
+
+当前系统状态和用户最新消息见对话末尾的当前上下文。
+请分析用户意图并决定路由到哪个Agent，或者如果需要更多信息来判断，请友好地询问用户。
+"""
+
+def build_router_context(state: Dict[str, Any], last_message: str) -> str:
+    """LLM路由提示词中每轮变化的部分：各领域初始化状态、用户最新消息和今日日期"""
+    status = "\n".join(
+        f"- {label}: {'未初始化' if is_placeholder(state.get(key)) else '已初始化'}"
+        for key, label in ROUTER_STATUS_LABELS.items()
+    )
+    return context_block(f"当前系统状态：\n{status}", f"用户最新消息：\"{last_message}\"")
+
+# 本地分类置信度达到该阈值时直接路由，低于阈值的模糊消息才交给LLM判断
+ROUTING_CONFIDENCE_THRESHOLD = float(os.getenv("COORDINATOR_ROUTING_THRESHOLD", "0.6"))
+
+# 一条消息同时命中多个记录类领域时，并发交给对应的专门Agent处理
+FAN_OUT_ENABLED = os.getenv("COORDINATOR_FAN_OUT", "1") == "1"
+
+# 允许并发处理的记录类领域；健康洞察和食谱依赖其他领域的结果，不参与并发
+FAN_OUT_ROUTES = (
+    AgentRoute.CYCLE_TRACKER,
+    AgentRoute.SYMPTOM_MOOD,
+    AgentRoute.FERTILITY,
+    AgentRoute.NUTRITION,
+    AgentRoute.EXERCISE,
+    AgentRoute.LIFESTYLE,
+)
+
+class RoutingTier:
+    """路由决策层级"""
+    LOCAL = "local"
+    LLM = "llm"
+
+class RoutingStats:
+    """按层级统计路由决策次数、延迟和token消耗"""
+
+    def __init__(self, window: int = 1000):
+        self.counts = {RoutingTier.LOCAL: 0, RoutingTier.LLM: 0}
+        self.tokens = {RoutingTier.LOCAL: 0, RoutingTier.LLM: 0}
+        self.latencies_ms = {
+            RoutingTier.LOCAL: deque(maxlen=window),
+            RoutingTier.LLM: deque(maxlen=window),
+        }
+
+    def record(self, tier: str, latency_ms: float, tokens: int = 0) -> None:
+        self.counts[tier] += 1
+        self.tokens[tier] += tokens
+        self.latencies_ms[tier].append(latency_ms)
+
+    def p50(self, tier: str) -> Optional[float]:
+        samples = self.latencies_ms[tier]
+        return median(samples) if samples else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        return {
+            tier: {
+                "count": count,
+                "share": count / total if total else 0.0,
+                "p50_latency_ms": self.p50(tier),
+                "tokens": self.tokens[tier],
+            }
+            for tier, count in self.counts.items()
+        }
+
+ROUTING_STATS = RoutingStats()
+
+# 各路由的关键词表，模块加载时一次性编译为匹配器
+ROUTE_KEYWORDS = {
     # 经期追踪关键词
-    cycle_keywords = [
+    AgentRoute.CYCLE_TRACKER: [
         '月经', '经期', '大姨妈', '生理期', '来例假', '流量', '周期',
         'period', 'menstrual', 'cycle', 'flow', 'bleeding'
-    ]
-    
+    ],
     # 症状情绪关键词
-    symptom_mood_keywords = [
+    AgentRoute.SYMPTOM_MOOD: [
         '症状', '头痛', '痉挛', '疼痛', '疲劳', '腹胀', '恶心', '痤疮',
         '情绪', '心情', '焦虑', '烦躁', '开心', '悲伤', '压力',
         'symptom', 'pain', 'cramp', 'headache', 'bloating', 'mood', 'anxiety', 'tired'
-    ]
-    
+    ],
     # 生育相关关键词
-    fertility_keywords = [
+    AgentRoute.FERTILITY: [
         '怀孕', '备孕', '排卵', '受孕', '生育', '避孕', '基础体温',
         'pregnancy', 'ovulation', 'fertility', 'conceive', 'basal temperature'
-    ]
-    
+    ],
     # 营养关键词
-    nutrition_keywords = [
-        '营养', '饮食', '补充', '维生素', '钙', '铁', '水分', '健康饮食',
+    AgentRoute.NUTRITION: [
+        '营养', '饮食', '补充', '维生素', '钙', '铁', '水分', '健康饮食', '喝水', '饮水', '毫升', 'ml',
         'nutrition', 'diet', 'vitamin', 'supplement', 'calcium', 'iron', 'water'
-    ]
-    
+    ],
     # 运动关键词
-    exercise_keywords = [
+    AgentRoute.EXERCISE: [
         '运动', '锻炼', '瑜伽', '健身', '跑步', '游泳', '散步',
         'exercise', 'workout', 'yoga', 'fitness', 'running', 'swimming', 'walking'
-    ]
-    
+    ],
     # 食谱关键词
-    recipe_keywords = [
+    AgentRoute.RECIPE: [
         '食谱', '菜谱', '做菜', '烹饪', '料理', '配方',
         'recipe', 'cooking', 'dish', 'meal', 'ingredient'
-    ]
-    
+    ],
     # 健康洞察关键词
-    health_keywords = [
+    AgentRoute.HEALTH_INSIGHTS: [
         '分析', '建议', '预测', '趋势', '模式', '洞察', '健康状况',
         'analysis', 'insight', 'prediction', 'trend', 'pattern', 'health status'
-    ]
-    
+    ],
     # 生活方式关键词
-    lifestyle_keywords = [
+    AgentRoute.LIFESTYLE: [
         '睡眠', '作息', '生活习惯', '压力', '体重', '生活方式',
         'sleep', 'lifestyle', 'stress', 'weight', 'habit'
-    ]
-    
-    # 计算每个类别的匹配度
-    matches = {
-        AgentRoute.CYCLE_TRACKER: sum(1 for kw in cycle_keywords if kw in message_lower),
-        AgentRoute.SYMPTOM_MOOD: sum(1 for kw in symptom_mood_keywords if kw in message_lower),
-        AgentRoute.FERTILITY: sum(1 for kw in fertility_keywords if kw in message_lower),
-        AgentRoute.NUTRITION: sum(1 for kw in nutrition_keywords if kw in message_lower),
-        AgentRoute.EXERCISE: sum(1 for kw in exercise_keywords if kw in message_lower),
-        AgentRoute.RECIPE: sum(1 for kw in recipe_keywords if kw in message_lower),
-        AgentRoute.HEALTH_INSIGHTS: sum(1 for kw in health_keywords if kw in message_lower),
-        AgentRoute.LIFESTYLE: sum(1 for kw in lifestyle_keywords if kw in message_lower),
-    }
+    ],
+}
+
+ROUTE_MATCHER = KeywordMatcher(ROUTE_KEYWORDS)
+
+def classify_user_intent(message: str) -> Dict[str, Any]:
+    """分析用户意图并返回路由建议"""
+    # 一次匹配得到各路由的命中；跨路由共享的关键词（如"压力"）按路由数平分权重
+    result = ROUTE_MATCHER.match(message)
+    matches = result.scores
     
     # 找出匹配度最高的类别
     best_match = max(matches.items(), key=lambda x: x[1])
@@ -159,7 +287,9 @@ def classify_user_intent(message: str) -> Dict[str, Any]:
         return {
             "target_agent": AgentRoute.HEALTH_INSIGHTS,
             "confidence": 0.3,
-            "reasoning": "无明确意图，默认提供健康洞察"
+            "reasoning": "无明确意图，默认提供健康洞察",
+            "matches": matches,
+            "hits": result.hits
         }
     
     confidence = min(best_match[1] / 3.0, 1.0)  # 最多3个关键词匹配为满分
@@ -167,9 +297,61 @@ def classify_user_intent(message: str) -> Dict[str, Any]:
     return {
         "target_agent": best_match[0],
         "confidence": confidence,
-        "reasoning": f"检测到{best_match[1]}个相关关键词，匹配{best_match[0]}"
+        "reasoning": f"检测到{result.counts[best_match[0]]}个相关关键词，匹配{best_match[0]}",
+        "matches": matches,
+        "hits": result.hits
+    }
+
+def route_locally(message: str, threshold: float = ROUTING_CONFIDENCE_THRESHOLD) -> Optional[Dict[str, Any]]:
+    """本地分类器足够确定时返回路由决策，否则返回None交给LLM"""
+    if not message:
+        return None
+    
+    intent = classify_user_intent(message)
+    if intent["confidence"] < threshold:
+        return None
+    
+    # 最高分并列时说明消息跨领域，交给LLM判断主要需求
+    scores = sorted(intent["matches"].values(), reverse=True)
+    if len(scores) > 1 and scores[0] == scores[1]:
+        return None
+    
+    return {
+        "target_agent": intent["target_agent"],
+        "user_intent": message,
+        "reasoning": intent["reasoning"],
+        "priority": 3,
+        "confidence": intent["confidence"]
     }
 
+# 同时属于多个路由的关键词（如"压力"），单独命中时不足以说明涉及多个领域
+SHARED_ROUTE_KEYWORDS = frozenset(
+    keyword for keyword, labels in zip(ROUTE_MATCHER.keywords, ROUTE_MATCHER.keyword_labels) if len(labels) > 1
+)
+
+def select_fan_out_routes(message: str) -> List[str]:
+    """
+    返回需要并发处理的记录类领域；少于两个时不需要并发。
+
+    只有命中了本领域独有关键词的领域才参与并发；食谱或健康洞察的得分不低于所有记录类领域时，
+    消息的主要需求是食谱/分析，不做并发。
+    """
+    if not message:
+        return []
+    
+    result = ROUTE_MATCHER.match(message)
+    routes = [
+        route for route in FAN_OUT_ROUTES
+        if any(keyword not in SHARED_ROUTE_KEYWORDS for keyword in result.hits[route])
+    ]
+    if len(routes) < 2:
+        return []
+    
+    top_record_score = max(result.scores[route] for route in FAN_OUT_ROUTES)
+    if max(result.scores[AgentRoute.RECIPE], result.scores[AgentRoute.HEALTH_INSIGHTS]) >= top_record_score:
+        return []
+    return routes
+
 async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     """主协调器流程入口点"""
     
@@ -191,60 +373,71 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     if not state.get("recipe_data"):
         state["recipe_data"] = {"initialized": False}
     
-    await copilotkit_emit_state(config, state)
+    await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
         update=state
     )
 
-async def chat_node(state: Dict[str, Any], config: RunnableConfig):
-    """主协调器聊天节点"""
+async def apply_routing(state: Dict[str, Any], config: RunnableConfig, routing_info: Dict[str, Any], messages: List[Any]):
+    """记录路由决策并在同一轮内交给对应的专门Agent子图"""
+    target_agent = routing_info["target_agent"]
     
-    # 获取最后一条用户消息
-    last_message = ""
-    if state.get("messages"):
-        for msg in reversed(state["messages"]):
-            if hasattr(msg, 'content') and msg.content:
-                last_message = msg.content
-                break
+    # 更新当前路由信息
+    state["current_route"] = target_agent
+    state["current_routes"] = [target_agent]
+    state["user_intent"] = routing_info.get("user_intent", "")
     
-    system_prompt = f"""你是女性经期健康助手的主协调器，负责智能路由用户请求到最合适的专门Agent。
-
-当前系统状态：
-- 经期追踪: {'已初始化' if state.get('cycle_data', {}).get('initialized') else '未初始化'}
-- 症状情绪: {'已初始化' if state.get('symptom_mood_data', {}).get('initialized') else '未初始化'}
-- 生育健康: {'已初始化' if state.get('fertility_data', {}).get('initialized') else '未初始化'}
-- 营养健康: {'已初始化' if state.get('nutrition_data', {}).get('initialized') else '未初始化'}
-- 运动健康: {'已初始化' if state.get('exercise_data', {}).get('initialized') else '未初始化'}
-- 健康洞察: {'已初始化' if state.get('health_insights_data', {}).get('initialized') else '未初始化'}
-- 生活方式: {'已初始化' if state.get('lifestyle_data', {}).get('initialized') else '未初始化'}
-- 食谱助手: {'已初始化' if state.get('recipe_data', {}).get('initialized') else '未初始化'}
-
-可用的专门Agent：
-1. 📅 cycle_tracker - 经期追踪（记录月经日期、流量、周期计算）
-2. 🩹 symptom_mood - 症状情绪（记录身体症状和情绪状态）
-3. 🌱 fertility - 生育健康（排卵跟踪、受孕支持）
-4. 🥗 nutrition - 营养健康（营养指导、补充建议）
-5. 🏃‍♀️ exercise - 运动健康（运动推荐、健身计划）
-6. 🧠 health_insights - 健康洞察（AI分析、趋势预测）
-7. 🏠 lifestyle - 生活方式（睡眠、压力、生活习惯）
-8. 🍳 recipe - 食谱助手（食谱创建、烹饪指导）
-
-路由决策原则：
-- 分析用户消息的核心意图
-- 识别关键词和上下文
-- 选择最合适的专门Agent
-- 如果涉及多个领域，优先选择最主要的需求
-- 当意图不明确时，提供友好的引导
-
-用户最新消息："{last_message}"
+    updated_state = {**state, "messages": messages}
+    await emit_state(config, updated_state, final=True)
+    
+    return Command(
+        goto=target_agent,
+        update={
+            "messages": messages,
+            "current_route": target_agent,
+            "current_routes": [target_agent],
+            "user_intent": state["user_intent"]
+        }
+    )
 
-请分析用户意图并决定路由到哪个Agent，或者如果需要更多信息来判断，请友好地询问用户。
-"""
+async def apply_fan_out(state: Dict[str, Any], config: RunnableConfig, routes: List[str], user_intent: str):
+    """记录多领域路由并交给并发节点处理"""
+    state["current_route"] = routes[0]
+    state["current_routes"] = routes
+    state["user_intent"] = user_intent
+    
+    await emit_state(config, state, final=True)
+    
+    return Command(
+        goto="fan_out",
+        update={
+            "current_route": routes[0],
+            "current_routes": routes,
+            "user_intent": user_intent
+        }
+    )
 
-    model = ChatOpenAI(model="gpt-4o-mini")
+async def chat_node(state: Dict[str, Any], config: RunnableConfig):
+    """主协调器聊天节点"""
+    
+    # 第一层：本地关键词分类，置信度足够时无需调用LLM
+    routing_started = time.perf_counter()
+    last_user_message = get_last_user_message(state.get("messages", []))
     
+    # 跨多个记录类领域的消息并发交给各专门Agent
+    fan_out_routes = select_fan_out_routes(last_user_message) if FAN_OUT_ENABLED else []
+    if len(fan_out_routes) > 1:
+        ROUTING_STATS.record(RoutingTier.LOCAL, (time.perf_counter() - routing_started) * 1000)
+        return await apply_fan_out(state, config, fan_out_routes, last_user_message)
+    
+    local_routing = route_locally(last_user_message)
+    if local_routing:
+        ROUTING_STATS.record(RoutingTier.LOCAL, (time.perf_counter() - routing_started) * 1000)
+        return await apply_routing(state, config, local_routing, state.get("messages", []))
+    
+    # 第二层：意图模糊时交给LLM路由
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
@@ -257,18 +450,26 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
         }],
     )
 
-    model_with_tools = model.bind_tools(
-        [
-            *state.get("copilotkit", {}).get("actions", []),
-            ROUTER_TOOL
-        ],
+    model_with_tools = get_model_with_tools(
+        [ROUTER_TOOL],
+        actions=state.get("copilotkit", {}).get("actions", []),
+        response_cache=CacheScope("coordinator", data_version({key: is_placeholder(state.get(key)) for key in ROUTER_STATUS_LABELS}, ())),
         parallel_tool_calls=False,
     )
 
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+    response = await model_with_tools.ainvoke(layout_messages(
+        "coordinator",
+        ROUTER_INSTRUCTIONS,
+        build_router_context(state, last_user_message),
+        window_history(state.get("messages", []), config),
+    ), config)
+
+    usage = getattr(response, "usage_metadata", None) or {}
+    ROUTING_STATS.record(
+        RoutingTier.LLM,
+        (time.perf_counter() - routing_started) * 1000,
+        usage.get("total_tokens", 0)
+    )
 
     messages = state.get("messages", []) + [response]
     
@@ -288,38 +489,12 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             routing_info = tool_call_args["routing_decision"]
             target_agent = routing_info["target_agent"]
             
-            # 更新当前路由信息
-            state["current_route"] = target_agent
-            state["user_intent"] = routing_info.get("user_intent", "")
-            
             tool_response = ToolMessage(
                 content=f"正在为您连接到{target_agent}专门助手...",
                 tool_call_id=tool_call_id
             )
             
-            messages = messages + [tool_response]
-            
-            # 根据路由决策，这里应该调用相应的专门Agent
-            # 在实际实现中，这里会启动对应的Agent子图
-            response_message = f"""
-✅ 已为您智能路由到 **{target_agent}** 专门助手
-
-📋 **意图分析**: {routing_info.get('user_intent', '未指定')}
-🎯 **决策理由**: {routing_info.get('reasoning', '智能分析结果')}
-⭐ **优先级**: {routing_info.get('priority', 3)}/5
-
-现在我将专门为您处理{target_agent}相关的需求。请告诉我更多具体信息，我来为您提供专业的帮助！
-            """
-            
-            messages.append(SystemMessage(content=response_message))
-            
-            updated_state = {**state, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
-            
-            return Command(
-                goto=END,
-                update=updated_state
-            )
+            return await apply_routing(state, config, routing_info, messages + [tool_response])
     
     # 如果没有调用工具，说明AI选择直接回复用户
     await copilotkit_exit(config)
@@ -337,12 +512,17 @@ workflow = StateGraph(MainCoordinatorState)
 # 添加节点
 workflow.add_node("start_flow", start_flow)
 workflow.add_node("chat_node", chat_node)
+for route, spec in SPECIALISTS.items():
+    workflow.add_node(route, make_specialist_node(spec))
+workflow.add_node("fan_out", make_fan_out_node(SPECIALISTS))
 
-# 添加边
+# 添加边（chat_node通过Command跳转到专门Agent或直接结束）
 workflow.set_entry_point("start_flow")
 workflow.add_edge(START, "start_flow")
 workflow.add_edge("start_flow", "chat_node")
-workflow.add_edge("chat_node", END)
+for route in SPECIALISTS:
+    workflow.add_edge(route, END)
+workflow.add_edge("fan_out", END)
 
 # 编译图形
 graph = workflow.compile() 
\ No newline at end of file
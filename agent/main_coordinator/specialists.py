@@ -0,0 +1,98 @@
+"""
+专门Agent子图交接 - 主协调器内嵌各专门Agent的编译子图
+单一职责：在协调器状态与子图状态之间映射数据键，让路由后的请求在同一轮内完成处理
+"""
+
+import asyncio
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+
+class SpecialistSpec(NamedTuple):
+    """专门Agent子图及其状态键映射"""
+    graph: Any
+    # 协调器状态中的数据键 <-> 子图状态中的数据键
+    coordinator_key: str
+    agent_key: str
+    # 只读传入子图的其他协调器数据键（如健康洞察需要的各领域数据）
+    context_keys: Tuple[str, ...] = ()
+
+
+def is_placeholder(data: Any) -> bool:
+    """判断是否为协调器start_flow写入的未初始化占位数据"""
+    return not data or data == {"initialized": False}
+
+
+def to_specialist_input(state: Dict[str, Any], spec: SpecialistSpec) -> Dict[str, Any]:
+    """把协调器状态映射为子图输入"""
+    data = state.get(spec.coordinator_key)
+    specialist_input = {
+        "messages": state.get("messages", []),
+        "copilotkit": state.get("copilotkit") or {"actions": []},
+        # 占位数据交给子图的start_flow按各自默认结构初始化
+        spec.agent_key: None if is_placeholder(data) else data,
+    }
+    for key in spec.context_keys:
+        context = state.get(key)
+        specialist_input[key] = None if is_placeholder(context) else context
+    return specialist_input
+
+
+def from_specialist_output(result: Dict[str, Any], spec: SpecialistSpec) -> Dict[str, Any]:
+    """把子图输出映射回协调器状态更新"""
+    return {
+        "messages": result.get("messages", []),
+        spec.coordinator_key: result.get(spec.agent_key),
+    }
+
+
+def make_specialist_node(spec: SpecialistSpec):
+    """生成在协调器图中运行专门Agent子图的节点"""
+
+    async def specialist_node(state: Dict[str, Any], config: RunnableConfig):
+        result = await spec.graph.ainvoke(to_specialist_input(state, spec), config)
+        return from_specialist_output(result, spec)
+
+    return specialist_node
+
+
+def merge_specialist_outputs(
+    state: Dict[str, Any],
+    outputs: Sequence[Tuple[SpecialistSpec, Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """按路由声明顺序合并多个子图的状态更新，结果与各分支完成先后无关"""
+    base_messages = state.get("messages", [])
+    seen_ids = {getattr(message, "id", None) for message in base_messages}
+    seen_ids.discard(None)
+    
+    merged_messages: List[Any] = list(base_messages)
+    update: Dict[str, Any] = {}
+    for spec, result in outputs:
+        # 每个分支都会带回完整的输入消息，只追加该分支新产生的消息
+        for message in result.get("messages", []):
+            message_id = getattr(message, "id", None)
+            if message_id is not None and message_id in seen_ids:
+                continue
+            if message_id is not None:
+                seen_ids.add(message_id)
+            merged_messages.append(message)
+        update[spec.coordinator_key] = result.get(spec.agent_key)
+    
+    update["messages"] = merged_messages
+    return update
+
+
+def make_fan_out_node(specialists: Dict[str, SpecialistSpec]):
+    """生成并发运行多个专门Agent子图的节点，路由列表取自state["current_routes"]"""
+
+    async def fan_out_node(state: Dict[str, Any], config: RunnableConfig):
+        routes = [route for route in specialists if route in (state.get("current_routes") or [])]
+        specs = [specialists[route] for route in routes]
+        results = await asyncio.gather(*(
+            spec.graph.ainvoke(to_specialist_input(state, spec), config)
+            for spec in specs
+        ))
+        return merge_specialist_outputs(state, list(zip(specs, results)))
+
+    return fan_out_node
@@ -15,13 +15,20 @@ from langgraph.types import Command
 
 # CopilotKit imports
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state
+from copilotkit.langgraph import copilotkit_customize_config
 
 # OpenAI imports
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage
 from copilotkit.langgraph import (copilotkit_exit)
 
+from shared.history import window_history
+from shared.merge import KEEP_FIRST, appended, collection, merge_collections
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import CONTEXT_NOTE_EN, build_prompt_context, get_last_user_message
+from shared.prompt_layout import TODAY_LINE_EN, context_block, layout_messages
+from shared.response_cache import CacheScope
+from shared.state_emitter import emit_state
+from shared.versioning import REVISION_FIELD, data_version, next_revision
+
 class FlowIntensity(str, Enum):
     """
     Menstrual flow intensity levels.
@@ -314,6 +321,21 @@ UPDATE_CYCLE_TOOL = {
     }
 }
 
+# Record lists that grow over time; the prompt only shows counts, recent and relevant entries
+MENSTRUAL_COLLECTIONS = ("symptoms", "moods", "notes", "exercises", "nutrition", "health_insights", "lifestyle_factors")
+
+# Natural key and conflict policy for each record list in the update path;
+# a day can hold several nutrition and lifestyle entries, so those lists only drop exact repeats
+MENSTRUAL_MERGE_SPECS = {
+    "symptoms": collection("date", "symptom_type", policy=KEEP_FIRST),
+    "moods": collection("date", "mood_type", policy=KEEP_FIRST),
+    "notes": collection("date", "note", policy=KEEP_FIRST),
+    "exercises": collection("date", "exercise_type", policy=KEEP_FIRST),
+    "nutrition": appended(),
+    "health_insights": collection("date", "title", policy=KEEP_FIRST),
+    "lifestyle_factors": appended(),
+}
+
 class AgentState(CopilotKitState):
     """
     The state of the menstrual tracking data.
@@ -371,7 +393,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
             "premium_features_enabled": False
         }
         # Emit the initial state
-        await copilotkit_emit_state(config, state)
+        await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
@@ -381,6 +403,117 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
         }
     )
 
+# Fixed instructions: byte-identical on every call; cycle data and today's date go in the trailing context message
+MENSTRUAL_INSTRUCTIONS = """You are a professional AI assistant for comprehensive menstrual cycle tracking and women's health management. You MUST understand and respond to both English and Chinese inputs.
+
+The current cycle data and today's date are given at the end of the conversation.
+
+You provide expert guidance in:
+1. 🩸 PERIOD TRACKING: Recording period dates, flow intensity, and cycle patterns
+2. 🎭 SYMPTOM & MOOD MONITORING: Tracking physical symptoms and emotional states
+3. 🏃‍♀️ EXERCISE RECOMMENDATIONS: Cycle-optimized fitness guidance
+4. 🥗 NUTRITION GUIDANCE: Cycle-specific dietary recommendations and hydration tracking
+5. 🌱 FERTILITY HEALTH: Ovulation tracking, BBT monitoring, and conception support
+6. 🧠 AI HEALTH INSIGHTS: Personalized recommendations and pattern analysis
+7. 📊 LIFESTYLE FACTORS: Sleep, stress, and general wellness tracking
+
+AVAILABLE OPTIONS:
+
+FLOW INTENSITIES: Light, Medium, Heavy, Spotting
+
+SYMPTOMS: Cramps, Headache, Bloating, Breast Tenderness, Back Pain, Nausea, Acne, Fatigue, Tiredness, Mood Swings, Food Cravings
+
+MOODS: Happy, Sad, Anxious, Irritable, Calm, Energetic, Tired, Emotional
+
+EXERCISES: Yoga, Walking, Running, Swimming, Strength Training, Cycling, Pilates, Rest
+
+NUTRITION FOCUS: Iron Rich Foods, Calcium Sources, Magnesium Foods, Omega-3 Foods, Vitamin D Sources, Anti-inflammatory Foods
+
+FERTILITY GOALS: Trying to Conceive, Avoiding Pregnancy, General Health Monitoring, Menopause Tracking
+
+HEALTH SCORES: Excellent, Good, Moderate, Poor, Needs Attention
+
+CHINESE TO ENGLISH TRANSLATIONS FOR SYMPTOMS & MOODS:
+- 疲劳/疲倦/累 → Fatigue
+- 头痛 → Headache
+- 痉挛/抽筋/痛经 → Cramps
+- 腹胀/胀气 → Bloating
+- 背痛/腰痛 → Back Pain
+- 恶心 → Nausea
+- 痤疮/痘痘 → Acne
+- 乳房胀痛 → Breast Tenderness
+- 情绪波动 → Mood Swings
+- 食欲不振/食物渴望 → Food Cravings
+
+- 焦虑/紧张 → Anxious
+- 开心/高兴 → Happy
+- 悲伤/难过 → Sad
+- 烦躁/易怒 → Irritable
+- 平静/冷静 → Calm
+- 精力充沛/有活力 → Energetic
+- 疲倦/累 → Tired
+- 情绪化 → Emotional
+
+FLOW INTENSITY TRANSLATIONS:
+- 轻微/轻 → Light
+- 中等/中 → Medium
+- 大量/重 → Heavy
+- 点滴/少量 → Spotting
+
+IMPORTANT GUIDELINES:
+- Always be supportive and non-judgmental
+- Provide accurate health information but remind users to consult healthcare providers for medical concerns
+- Help users understand their cycle patterns
+- Suggest lifestyle tips that may help with symptoms
+- Be sensitive to the personal nature of this data
+- MUST extract symptoms and moods from Chinese text
+- When user mentions "疲劳", "疲倦", or "累", use "Fatigue" as symptom type
+- When user mentions "焦虑" or "紧张", use "Anxious" as mood type
+- When user mentions "痉挛", "抽筋", or "痛经", use "Cramps" as symptom type
+- ALWAYS call the update_menstrual_data tool when user provides new information
+
+When updating data:
+- Preserve existing data and add new information
+- Always provide complete data structures with ALL existing data plus new entries
+- Generate helpful insights based on patterns
+- Predict next period and fertile windows when possible
+- Always use YYYY-MM-DD format for dates (e.g., "2025-06-14")
+- Use today's date as given with the current cycle data
+- Ensure all dates are valid and properly formatted
+- ALWAYS include symptoms, moods, and notes arrays even if empty
+- When adding new symptoms/moods/notes, append to existing arrays
+- MUST extract and record symptoms and moods from user input
+
+EXAMPLE USAGE:
+User says: "今天是我月经的第一天，流量中等" (Today is the first day of my period, medium flow)
+User says: "我今天感觉有些疲劳，程度7分" (I feel tired today, level 7)
+User says: "我的心情今天比较焦虑，强度8分" (My mood today is quite anxious, intensity 8)
+
+You MUST call update_menstrual_data with cycle_data containing:
+- current_cycle with start_date and period_days with medium flow
+- symptoms array with Fatigue symptom severity 7
+- moods array with Anxious mood intensity 8
+- Include empty arrays for notes, exercises, nutrition, health_insights, lifestyle_factors
+- Include empty objects for fertility_data and predictions
+- Set changes description explaining what was added
+
+If you've just updated the cycle data, briefly explain what you did without repeating all the details.
+"""
+
+def build_cycle_context(state: Dict[str, Any]) -> str:
+    """The per-turn part of the prompt: the cycle data summary"""
+    # Create a safe serialization of the cycle data
+    cycle_json = "No cycle data yet"
+    try:
+        cycle_json = build_prompt_context(
+            state["cycle_data"],
+            MENSTRUAL_COLLECTIONS,
+            get_last_user_message(state.get("messages", [])),
+        )
+    except Exception as e:
+        cycle_json = f"Error serializing cycle data: {str(e)}"
+    return context_block(f"Current cycle data: {cycle_json}\n{CONTEXT_NOTE_EN}", today_line=TODAY_LINE_EN)
+
 async def chat_node(state: Dict[str, Any], config: RunnableConfig):
     """
     Main chat node for menstrual tracking assistance.
@@ -417,112 +550,6 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             "premium_features_enabled": False
         }
     
-    # Create a safe serialization of the cycle data
-    cycle_json = "No cycle data yet"
-    try:
-        cycle_json = json.dumps(state["cycle_data"], indent=2)
-    except Exception as e:
-        cycle_json = f"Error serializing cycle data: {str(e)}"
-    
-    system_prompt = f"""You are a professional AI assistant for comprehensive menstrual cycle tracking and women's health management. You MUST understand and respond to both English and Chinese inputs.
-    
-    Current cycle data: {cycle_json}
-    
-    You provide expert guidance in:
-    1. 🩸 PERIOD TRACKING: Recording period dates, flow intensity, and cycle patterns
-    2. 🎭 SYMPTOM & MOOD MONITORING: Tracking physical symptoms and emotional states
-    3. 🏃‍♀️ EXERCISE RECOMMENDATIONS: Cycle-optimized fitness guidance
-    4. 🥗 NUTRITION GUIDANCE: Cycle-specific dietary recommendations and hydration tracking
-    5. 🌱 FERTILITY HEALTH: Ovulation tracking, BBT monitoring, and conception support
-    6. 🧠 AI HEALTH INSIGHTS: Personalized recommendations and pattern analysis
-    7. 📊 LIFESTYLE FACTORS: Sleep, stress, and general wellness tracking
-    
-    AVAILABLE OPTIONS:
-    
-    FLOW INTENSITIES: Light, Medium, Heavy, Spotting
-    
-    SYMPTOMS: Cramps, Headache, Bloating, Breast Tenderness, Back Pain, Nausea, Acne, Fatigue, Tiredness, Mood Swings, Food Cravings
-    
-    MOODS: Happy, Sad, Anxious, Irritable, Calm, Energetic, Tired, Emotional
-    
-    EXERCISES: Yoga, Walking, Running, Swimming, Strength Training, Cycling, Pilates, Rest
-    
-    NUTRITION FOCUS: Iron Rich Foods, Calcium Sources, Magnesium Foods, Omega-3 Foods, Vitamin D Sources, Anti-inflammatory Foods
-    
-    FERTILITY GOALS: Trying to Conceive, Avoiding Pregnancy, General Health Monitoring, Menopause Tracking
-    
-    HEALTH SCORES: Excellent, Good, Moderate, Poor, Needs Attention
-    
-    CHINESE TO ENGLISH TRANSLATIONS FOR SYMPTOMS & MOODS:
-    - 疲劳/疲倦/累 → Fatigue
-    - 头痛 → Headache  
-    - 痉挛/抽筋/痛经 → Cramps
-    - 腹胀/胀气 → Bloating
-    - 背痛/腰痛 → Back Pain
-    - 恶心 → Nausea
-    - 痤疮/痘痘 → Acne
-    - 乳房胀痛 → Breast Tenderness
-    - 情绪波动 → Mood Swings
-    - 食欲不振/食物渴望 → Food Cravings
-    
-    - 焦虑/紧张 → Anxious
-    - 开心/高兴 → Happy
-    - 悲伤/难过 → Sad
-    - 烦躁/易怒 → Irritable
-    - 平静/冷静 → Calm
-    - 精力充沛/有活力 → Energetic
-    - 疲倦/累 → Tired
-    - 情绪化 → Emotional
-    
-    FLOW INTENSITY TRANSLATIONS:
-    - 轻微/轻 → Light
-    - 中等/中 → Medium
-    - 大量/重 → Heavy
-    - 点滴/少量 → Spotting
-    
-    IMPORTANT GUIDELINES:
-    - Always be supportive and non-judgmental
-    - Provide accurate health information but remind users to consult healthcare providers for medical concerns
-    - Help users understand their cycle patterns
-    - Suggest lifestyle tips that may help with symptoms
-    - Be sensitive to the personal nature of this data
-    - MUST extract symptoms and moods from Chinese text
-    - When user mentions "疲劳", "疲倦", or "累", use "Fatigue" as symptom type
-    - When user mentions "焦虑" or "紧张", use "Anxious" as mood type
-    - When user mentions "痉挛", "抽筋", or "痛经", use "Cramps" as symptom type
-    - ALWAYS call the update_menstrual_data tool when user provides new information
-    
-    When updating data:
-    - Preserve existing data and add new information
-    - Always provide complete data structures with ALL existing data plus new entries
-    - Generate helpful insights based on patterns
-    - Predict next period and fertile windows when possible
-    - Always use YYYY-MM-DD format for dates (e.g., "2025-06-14")
-    - Use today's date: {date.today().isoformat()}
-    - Ensure all dates are valid and properly formatted
-    - ALWAYS include symptoms, moods, and notes arrays even if empty
-    - When adding new symptoms/moods/notes, append to existing arrays
-    - MUST extract and record symptoms and moods from user input
-    
-    EXAMPLE USAGE:
-    User says: "今天是我月经的第一天，流量中等" (Today is the first day of my period, medium flow)
-    User says: "我今天感觉有些疲劳，程度7分" (I feel tired today, level 7)  
-    User says: "我的心情今天比较焦虑，强度8分" (My mood today is quite anxious, intensity 8)
-    
-    You MUST call update_menstrual_data with cycle_data containing:
-    - current_cycle with start_date and period_days with medium flow
-    - symptoms array with Fatigue symptom severity 7
-    - moods array with Anxious mood intensity 8
-    - Include empty arrays for notes, exercises, nutrition, health_insights, lifestyle_factors
-    - Include empty objects for fertility_data and predictions  
-    - Set changes description explaining what was added
-    
-    If you've just updated the cycle data, briefly explain what you did without repeating all the details.
-    """
-
-    # Define the model
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
     # Define config for the model
     if config is None:
         config = RunnableConfig(recursion_limit=25)
@@ -538,19 +565,20 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
     )
 
     # Bind the tools to the model
-    model_with_tools = model.bind_tools(
-        [
-            *state.get("copilotkit", {}).get("actions", []),
-            UPDATE_CYCLE_TOOL
-        ],
+    model_with_tools = get_model_with_tools(
+        [UPDATE_CYCLE_TOOL],
+        actions=state.get("copilotkit", {}).get("actions", []),
+        response_cache=CacheScope("menstrual", data_version(state["cycle_data"], MENSTRUAL_COLLECTIONS)),
         parallel_tool_calls=False,
     )
 
     # Run the model and generate a response
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+    response = await model_with_tools.ainvoke(layout_messages(
+        "menstrual",
+        MENSTRUAL_INSTRUCTIONS,
+        build_cycle_context(state),
+        window_history(state.get("messages", []), config),
+    ), config)
 
     # Update messages with the response
     messages = state.get("messages", []) + [response]
@@ -590,17 +618,17 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
                     "cycle_length": None,
                     "period_days": []
                 }),
-                "symptoms": existing_data.get("symptoms", []).copy(),
-                "moods": existing_data.get("moods", []).copy(),
-                "notes": existing_data.get("notes", []).copy(),
-                "exercises": existing_data.get("exercises", []).copy(),
-                "nutrition": existing_data.get("nutrition", []).copy(),
-                "health_insights": existing_data.get("health_insights", []).copy(),
+                "symptoms": existing_data.get("symptoms", []),
+                "moods": existing_data.get("moods", []),
+                "notes": existing_data.get("notes", []),
+                "exercises": existing_data.get("exercises", []),
+                "nutrition": existing_data.get("nutrition", []),
+                "health_insights": existing_data.get("health_insights", []),
                 "fertility_data": existing_data.get("fertility_data", {
                     "goal": FertilityGoal.GENERAL_HEALTH.value,
                     "intercourse_dates": []
                 }),
-                "lifestyle_factors": existing_data.get("lifestyle_factors", []).copy(),
+                "lifestyle_factors": existing_data.get("lifestyle_factors", []),
                 "predictions": existing_data.get("predictions", {
                     "next_period_date": None,
                     "ovulation_date": None,
@@ -616,24 +644,10 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             if "current_cycle" in new_cycle_data:
                 cycle_data["current_cycle"].update(new_cycle_data["current_cycle"])
             
-            # For arrays, append new items (with basic deduplication)
-            for key in ["symptoms", "moods", "notes", "exercises", "nutrition", "health_insights", "lifestyle_factors"]:
-                if key in new_cycle_data and new_cycle_data[key]:
-                    for new_item in new_cycle_data[key]:
-                        # Simple deduplication - avoid exact duplicates on same date
-                        is_duplicate = False
-                        for existing_item in cycle_data[key]:
-                            if (new_item.get("date") == existing_item.get("date") and
-                                ((key == "symptoms" and new_item.get("symptom_type") == existing_item.get("symptom_type")) or
-                                 (key == "moods" and new_item.get("mood_type") == existing_item.get("mood_type")) or
-                                 (key == "exercises" and new_item.get("exercise_type") == existing_item.get("exercise_type")) or
-                                 (key == "health_insights" and new_item.get("title") == existing_item.get("title")) or
-                                 (key == "notes" and new_item.get("note") == existing_item.get("note")))):
-                                is_duplicate = True
-                                break
-                        
-                        if not is_duplicate:
-                            cycle_data[key].append(new_item)
+            # Merge arrays by natural key (existing lists are never mutated)
+            merged_collections, merge_summary = merge_collections(cycle_data, new_cycle_data, MENSTRUAL_MERGE_SPECS)
+            cycle_data.update(merged_collections)
+            cycle_data[REVISION_FIELD] = next_revision(cycle_data, merge_summary.changed)
             
             # Update fertility data
             if "fertility_data" in new_cycle_data:
@@ -650,7 +664,7 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             # Add tool response to messages
             from langchain_core.messages import ToolMessage
             tool_response = ToolMessage(
-                content="Menstrual data updated successfully.",
+                content=f"Menstrual data updated successfully ({merge_summary.inserted} added, {merge_summary.updated} updated, {merge_summary.skipped} duplicates skipped).",
                 tool_call_id=tool_call_id
             )
             
@@ -658,7 +672,7 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             
             # Update the state with cycle_data
             updated_state = {**state, "cycle_data": cycle_data, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
+            await emit_state(config, updated_state, final=True)
             
             # Return command with updated data
             return Command(
@@ -15,13 +15,32 @@ from langgraph.types import Command
 
 # CopilotKit imports
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state
 
 # OpenAI imports
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, ToolMessage
+from langchain_core.messages import ToolMessage
 from copilotkit.langgraph import copilotkit_exit
 
+from shared.history import window_history
+from shared.merge import KEEP_FIRST, LAST_WRITE_WINS, SUM, collection, merge_collections
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import CONTEXT_NOTE, build_prompt_context, get_last_user_message
+from shared.prompt_layout import context_block, layout_messages
+from shared.quick_log import (
+    QUICK_LOG_ENABLED,
+    QuickLogParser,
+    alias_vocabulary,
+    log_date,
+    quick_log_response,
+    render_aliases,
+)
+from shared.response_cache import CacheScope
+from shared.scores import ScoreProvider, field_score
+from shared.state_emitter import emit_state
+from shared.streaming import StreamTarget, customize_config, invoke_model, merge_preview
+from shared.summaries import SUMMARY_FIELD, SUMMARY_RECENT_EVENTS, SummaryProvider, event
+from shared.timeseries import tail_values
+from shared.versioning import REVISION_FIELD, next_revision
+
 class NutritionFocus(str, Enum):
     """营养重点类型"""
     IRON_RICH = "Iron Rich Foods"
@@ -41,6 +60,21 @@ class SupplementType(str, Enum):
     OMEGA3 = "Omega-3"
     MULTIVITAMIN = "Multivitamin"
 
+# 中文说法对照：提示词中的中文翻译和本地快速记录共用
+NUTRITION_FOCUS_ALIASES = {
+    NutritionFocus.IRON_RICH: ("铁质", "补铁"),
+    NutritionFocus.CALCIUM: ("钙质", "补钙"),
+    NutritionFocus.MAGNESIUM: ("镁质", "镁元素"),
+    NutritionFocus.OMEGA3: ("鱼油", "DHA"),
+    NutritionFocus.VITAMIN_D: ("维生素D", "VD"),
+    NutritionFocus.ANTI_INFLAMMATORY: ("抗炎", "消炎"),
+}
+SUPPLEMENT_ALIASES = {
+    SupplementType.IRON: ("铁剂", "铁片"),
+    SupplementType.CALCIUM: ("钙片", "钙剂"),
+    SupplementType.MULTIVITAMIN: ("复合维生素", "多维"),
+}
+
 NUTRITION_TOOL = {
     "type": "function",
     "function": {
@@ -66,7 +100,7 @@ NUTRITION_TOOL = {
                                         },
                                         "description": "当日营养重点"
                                     },
-                                    "water_intake_ml": {"type": "number", "minimum": 0, "description": "水分摄入量(毫升)"},
+                                    "water_intake_ml": {"type": "number", "minimum": 0, "description": "当日水分摄入总量(毫升)，会覆盖已有记录"},
                                     "meal_notes": {"type": "string", "description": "饮食备注"}
                                 }
                             }
@@ -108,6 +142,35 @@ NUTRITION_TOOL = {
     }
 }
 
+# 会随时间增长的记录列表，提示词中只展示计数、最近和相关条目
+NUTRITION_COLLECTIONS = ("daily_nutrition", "supplements")
+
+# 各记录列表的自然键和冲突策略：模型提交的是当日饮水总量，覆盖已有记录；补充剂同日同类只记一次
+NUTRITION_MERGE_SPECS = {
+    "daily_nutrition": collection("date", policy=LAST_WRITE_WINS),
+    "supplements": collection("date", "supplement_type", policy=KEEP_FIRST),
+}
+# 本地快速记录（"喝了500ml水"）提交的是本次的增量，累加到当日总量上
+NUTRITION_QUICK_LOG_MERGE_SPECS = {
+    **NUTRITION_MERGE_SPECS,
+    "daily_nutrition": collection("date", policy=SUM, sum_fields=("water_intake_ml",)),
+}
+
+# 快速记录中的饮水单位 -> 毫升倍数（"杯"的容量因人而异，交给模型处理）
+WATER_UNITS = {"ml": 1, "毫升": 1, "l": 1000, "升": 1000, "公升": 1000, "liter": 1000, "liters": 1000}
+# 单条快速记录允许的饮水量上限（毫升）
+MAX_QUICK_LOG_WATER_ML = 5000
+
+# 只记录饮水量和补充剂；营养重点（"想要补铁"）通常是在要建议，交给模型
+NUTRITION_QUICK_LOG = QuickLogParser(
+    {
+        "water": {"水": "water", "喝水": "water", "饮水": "water", "water": "water"},
+        "unit": WATER_UNITS,
+        "supplement": alias_vocabulary(SUPPLEMENT_ALIASES),
+    },
+    fillers=("喝", "喝了", "吃", "吃了", "服用", "一共", "和", "drank", "drink", "took", "take"),
+)
+
 class NutritionState(CopilotKitState):
     """营养健康追踪状态"""
     nutrition_data: Optional[Dict[str, Any]] = None
@@ -117,8 +180,7 @@ def calculate_nutrition_score(nutrition_data: Dict) -> int:
     score = 50
     
     if nutrition_data.get("daily_nutrition"):
-        recent_nutrition = nutrition_data["daily_nutrition"][-7:]
-        water_intakes = [entry.get("water_intake_ml", 0) for entry in recent_nutrition]
+        water_intakes = tail_values(nutrition_data["daily_nutrition"], "water_intake_ml", 7, 0)
         avg_water = sum(water_intakes) / len(water_intakes) if water_intakes else 0
         
         if avg_water >= 2000:
@@ -144,8 +206,7 @@ def analyze_hydration_status(nutrition_data: Dict) -> str:
     if not nutrition_data.get("daily_nutrition"):
         return "无数据"
     
-    recent_nutrition = nutrition_data["daily_nutrition"][-3:]
-    water_intakes = [entry.get("water_intake_ml", 0) for entry in recent_nutrition]
+    water_intakes = tail_values(nutrition_data["daily_nutrition"], "water_intake_ml", 3, 0)
     
     if not water_intakes:
         return "无数据"
@@ -159,6 +220,100 @@ def analyze_hydration_status(nutrition_data: Dict) -> str:
     else:
         return "水分摄入不足"
 
+def build_nutrition_insights(nutrition_data: Dict) -> Dict[str, Any]:
+    """根据营养记录重新计算营养洞察"""
+    nutrition_score = calculate_nutrition_score(nutrition_data)
+    hydration_status = analyze_hydration_status(nutrition_data)
+    
+    recommendations = []
+    if hydration_status == "水分摄入不足":
+        recommendations.append("建议增加每日水分摄入量至2000ml以上")
+    
+    if len(nutrition_data.get("supplements") or []) < 3:
+        recommendations.append("建议规律服用必需的营养补充剂")
+    
+    return {
+        "nutrition_score": nutrition_score,
+        "hydration_status": hydration_status,
+        "recommendations": recommendations
+    }
+
+def build_nutrition_summary(nutrition_data: Dict) -> Dict[str, Any]:
+    """营养摘要：评分、饮水状态和最近几天的饮水与补充剂"""
+    insights = nutrition_data.get("nutrition_insights") or {}
+    daily = nutrition_data.get("daily_nutrition") or []
+    supplements = nutrition_data.get("supplements") or []
+    return {
+        "nutrition_score": insights.get("nutrition_score"),
+        "hydration_status": insights.get("hydration_status"),
+        "counts": {"daily_nutrition": len(daily), "supplements": len(supplements)},
+        "recent_water": [
+            event(day.get("date"), f"{day['water_intake_ml']}ml" if day.get("water_intake_ml") is not None else None)
+            for day in daily[-SUMMARY_RECENT_EVENTS:]
+        ],
+        "recent_supplements": [
+            event(item.get("date"), item.get("supplement_type"), item.get("dosage"))
+            for item in supplements[-SUMMARY_RECENT_EVENTS:]
+        ],
+    }
+
+# 供健康洞察读取的营养摘要
+SUMMARY_PROVIDER = SummaryProvider(NUTRITION_COLLECTIONS, build_nutrition_summary)
+SCORE_PROVIDER = ScoreProvider("nutrition", "营养健康", field_score("nutrition_score"))
+
+# 生成中的饮食/补充剂记录按合并规则并入已有数据后推送给前端
+NUTRITION_STREAM = StreamTarget(
+    "nutrition_data",
+    "update_nutrition_data",
+    "nutrition_data",
+    merge_preview("nutrition_data", NUTRITION_MERGE_SPECS),
+)
+
+# 固定指令：每次调用逐字节相同，数据和日期放在对话末尾的当前上下文中
+NUTRITION_INSTRUCTIONS = f"""你是专业的营养健康指导师，专门负责女性周期性营养需求分析和饮食建议。
+
+你的核心功能：
+1. 💧 水分摄入跟踪和建议
+2. 🥗 营养重点分析和指导
+3. 💊 营养补充剂建议
+4. 📈 营养健康评分
+
+营养重点：Iron Rich Foods(铁质), Calcium Sources(钙质), Magnesium Foods(镁质), Omega-3 Foods(鱼油), Vitamin D Sources(维生素D), Anti-inflammatory Foods(抗炎)
+
+补充剂：Iron(铁), Calcium(钙), Magnesium(镁), Vitamin D(维生素D), Folate(叶酸), Omega-3(鱼油), Multivitamin(复合维生素)
+
+中文翻译：
+{render_aliases(NUTRITION_FOCUS_ALIASES)}
+{render_aliases(SUPPLEMENT_ALIASES)}
+
+重要指导原则：
+- 专注于营养健康指导，不涉及经期、症状、运动等其他方面
+- 支持中英文输入，准确理解用户描述
+- 当用户提供营养相关信息时，必须调用update_nutrition_data工具
+- 提供科学的营养建议，强调均衡饮食
+- 水分摄入以毫升为单位记录，water_intake_ml填写当日总量（已有记录加上本次饮水量），会覆盖当日已有数值
+- 日期格式使用YYYY-MM-DD
+- 今日日期见对话末尾的当前数据
+
+使用示例：
+用户说："今天喝了1500ml水" → 记录今日水分摄入
+用户说："吃了钙片" → 记录钙补充剂
+用户说："想要补铁" → 提供铁质丰富食物建议
+"""
+
+def build_nutrition_context(state: Dict[str, Any]) -> str:
+    """营养健康指导提示词中每轮变化的部分：当前数据摘要和今日日期"""
+    try:
+        nutrition_json = build_prompt_context(
+            state["nutrition_data"],
+            NUTRITION_COLLECTIONS,
+            get_last_user_message(state.get("messages", [])),
+        )
+    except Exception as e:
+        nutrition_json = f"数据序列化错误: {str(e)}"
+
+    return context_block(f"当前营养数据: {nutrition_json}\n{CONTEXT_NOTE}")
+
 async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     """营养健康追踪流程入口点"""
     
@@ -176,7 +331,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
                 ]
             }
         }
-        await copilotkit_emit_state(config, state)
+        await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
@@ -200,77 +355,34 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             }
         }
 
-    try:
-        nutrition_json = json.dumps(state["nutrition_data"], indent=2)
-    except Exception as e:
-        nutrition_json = f"数据序列化错误: {str(e)}"
-    
-    system_prompt = f"""你是专业的营养健康指导师，专门负责女性周期性营养需求分析和饮食建议。
-
-当前营养数据: {nutrition_json}
-
-你的核心功能：
-1. 💧 水分摄入跟踪和建议
-2. 🥗 营养重点分析和指导
-3. 💊 营养补充剂建议
-4. 📈 营养健康评分
-
-营养重点：Iron Rich Foods(铁质), Calcium Sources(钙质), Magnesium Foods(镁质), Omega-3 Foods(鱼油), Vitamin D Sources(维生素D), Anti-inflammatory Foods(抗炎)
-
-补充剂：Iron(铁), Calcium(钙), Magnesium(镁), Vitamin D(维生素D), Folate(叶酸), Omega-3(鱼油), Multivitamin(复合维生素)
-
-中文翻译：
-- 铁质/补铁 → Iron Rich Foods
-- 钙质/补钙 → Calcium Sources
-- 镁质/镁元素 → Magnesium Foods
-- 鱼油/DHA → Omega-3 Foods
-- 维生素D/VD → Vitamin D Sources
-- 抗炎/消炎 → Anti-inflammatory Foods
-- 铁剂/铁片 → Iron
-- 钙片/钙剂 → Calcium
-- 复合维生素/多维 → Multivitamin
-
-重要指导原则：
-- 专注于营养健康指导，不涉及经期、症状、运动等其他方面
-- 支持中英文输入，准确理解用户描述
-- 当用户提供营养相关信息时，必须调用update_nutrition_data工具
-- 提供科学的营养建议，强调均衡饮食
-- 水分摄入以毫升为单位记录
-- 日期格式使用YYYY-MM-DD
-- 今日日期：{date.today().isoformat()}
-
-使用示例：
-用户说："今天喝了1500ml水" → 记录今日水分摄入
-用户说："吃了钙片" → 记录钙补充剂
-用户说："想要补铁" → 提供铁质丰富食物建议
-"""
-
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "nutrition_data",
-            "tool": "update_nutrition_data",
-            "tool_argument": "nutrition_data"
-        }],
-    )
+    config = customize_config(config, NUTRITION_STREAM)
 
-    model_with_tools = model.bind_tools(
-        [
-            *state.get("copilotkit", {}).get("actions", []),
-            NUTRITION_TOOL
-        ],
-        parallel_tool_calls=False,
-    )
+    # 结构化的快速记录在本地解析成同样的工具调用，不调用模型
+    response = None
+    if QUICK_LOG_ENABLED:
+        response = quick_log_response(
+            "update_nutrition_data",
+            extract_nutrition_log(get_last_user_message(state.get("messages", []))),
+        )
+    quick_logged = response is not None
+
+    if response is None:
+        model_with_tools = get_model_with_tools(
+            [NUTRITION_TOOL],
+            actions=state.get("copilotkit", {}).get("actions", []),
+            response_cache=CacheScope("nutrition", SUMMARY_PROVIDER.version(state["nutrition_data"])),
+            parallel_tool_calls=False,
+        )
 
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+        response = await invoke_model(model_with_tools, layout_messages(
+            "nutrition",
+            NUTRITION_INSTRUCTIONS,
+            build_nutrition_context(state),
+            window_history(state.get("messages", []), config),
+        ), config, state, NUTRITION_STREAM)
 
     messages = state.get("messages", []) + [response]
     
@@ -290,56 +402,26 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             new_nutrition_data = tool_call_args["nutrition_data"]
             existing_data = state.get("nutrition_data", {})
             
+            merge_specs = NUTRITION_QUICK_LOG_MERGE_SPECS if quick_logged else NUTRITION_MERGE_SPECS
+            merged_collections, merge_summary = merge_collections(existing_data, new_nutrition_data, merge_specs)
             nutrition_data = {
-                "daily_nutrition": existing_data.get("daily_nutrition", []).copy(),
-                "supplements": existing_data.get("supplements", []).copy(),
-                "nutrition_insights": existing_data.get("nutrition_insights", {})
+                **merged_collections,
+                "nutrition_insights": existing_data.get("nutrition_insights", {}),
+                REVISION_FIELD: next_revision(existing_data, merge_summary.changed)
             }
             
-            if "daily_nutrition" in new_nutrition_data:
-                for new_nutrition in new_nutrition_data["daily_nutrition"]:
-                    is_duplicate = any(
-                        n.get("date") == new_nutrition.get("date")
-                        for n in nutrition_data["daily_nutrition"]
-                    )
-                    if not is_duplicate:
-                        nutrition_data["daily_nutrition"].append(new_nutrition)
-            
-            if "supplements" in new_nutrition_data:
-                for new_supplement in new_nutrition_data["supplements"]:
-                    is_duplicate = any(
-                        s.get("date") == new_supplement.get("date") and
-                        s.get("supplement_type") == new_supplement.get("supplement_type")
-                        for s in nutrition_data["supplements"]
-                    )
-                    if not is_duplicate:
-                        nutrition_data["supplements"].append(new_supplement)
-            
-            nutrition_score = calculate_nutrition_score(nutrition_data)
-            hydration_status = analyze_hydration_status(nutrition_data)
-            
-            recommendations = []
-            if hydration_status == "水分摄入不足":
-                recommendations.append("建议增加每日水分摄入量至2000ml以上")
-            
-            if len(nutrition_data.get("supplements", [])) < 3:
-                recommendations.append("建议规律服用必需的营养补充剂")
-            
-            nutrition_data["nutrition_insights"] = {
-                "nutrition_score": nutrition_score,
-                "hydration_status": hydration_status,
-                "recommendations": recommendations
-            }
+            nutrition_data["nutrition_insights"] = build_nutrition_insights(nutrition_data)
+            nutrition_data[SUMMARY_FIELD] = SUMMARY_PROVIDER.publish(nutrition_data)
         
             tool_response = ToolMessage(
-                content="营养健康数据更新成功",
+                content=f"营养健康数据更新成功（{merge_summary.describe()}）",
                 tool_call_id=tool_call_id
             )
             
             messages = messages + [tool_response]
             
             updated_state = {**state, "nutrition_data": nutrition_data, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
+            await emit_state(config, updated_state, final=True)
             
             return Command(
                 goto=END,
@@ -358,6 +440,47 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
         }
     )
 
+def extract_nutrition_log(message: str, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    "喝了2000ml水"、"吃了钙片" 一类的快速记录解析成update_nutrition_data的参数。
+
+    饮水量必须带毫升/升单位且在合理范围内；同时出现多个饮水量或有多余数字时返回None，交给模型处理。
+    """
+    tokens = NUTRITION_QUICK_LOG.parse(message)
+    record_date = log_date(tokens, today) if tokens else None
+    if record_date is None:
+        return None
+
+    water_ml = None
+    mentions_water = False
+    supplements: List[str] = []
+    for index, token in enumerate(tokens):
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if token.kind == "number":
+            if water_ml is not None or following is None or following.kind != "unit":
+                return None
+            water_ml = token.value * following.value
+        elif token.kind == "unit":
+            if index == 0 or tokens[index - 1].kind != "number":
+                return None
+        elif token.kind == "water":
+            mentions_water = True
+        elif token.kind == "supplement" and token.value not in supplements:
+            supplements.append(token.value)
+    if water_ml is not None and not (mentions_water and 0 < water_ml <= MAX_QUICK_LOG_WATER_ML):
+        return None
+    if water_ml is None and not supplements:
+        return None
+
+    nutrition_data: Dict[str, List[Dict[str, Any]]] = {}
+    if water_ml is not None:
+        nutrition_data["daily_nutrition"] = [{"date": record_date, "water_intake_ml": round(water_ml)}]
+    if supplements:
+        nutrition_data["supplements"] = [
+            {"date": record_date, "supplement_type": supplement} for supplement in supplements
+        ]
+    return {"nutrition_data": nutrition_data}
+
 # 定义图形
 workflow = StateGraph(NutritionState)
 
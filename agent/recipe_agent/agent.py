@@ -14,13 +14,18 @@ from langgraph.types import Command
 
 # CopilotKit imports
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state
 
 # OpenAI imports
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage
 from copilotkit.langgraph import (copilotkit_exit)
 
+from shared.history import window_history
+from shared.model_registry import get_model_with_tools
+from shared.prompt_layout import TODAY_LINE_EN, context_block, layout_messages
+from shared.response_cache import CacheScope
+from shared.state_emitter import emit_state
+from shared.streaming import StreamTarget, customize_config, invoke_model
+from shared.versioning import data_version
+
 class SkillLevel(str, Enum):
     """
     The level of skill required for the recipe.
@@ -136,7 +141,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
             "instructions": ["First step instruction"]
         }
         # Emit the initial state to ensure it's properly shared with the frontend
-        await copilotkit_emit_state(config, state)
+        await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
@@ -147,9 +152,28 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     )
 
 
-async def chat_node(state: Dict[str, Any], config: RunnableConfig):
+# The recipe fields generated so far are previewed over the existing recipe
+RECIPE_STREAM = StreamTarget("recipe", "generate_recipe", "recipe")
+
+# Fixed instructions: byte-identical on every call; the recipe and today's date go in the trailing context message
+RECIPE_INSTRUCTIONS = """You are a helpful assistant for creating recipes.
+The current state of the recipe is given at the end of the conversation.
+You can improve the recipe by calling the generate_recipe tool.
+
+IMPORTANT:
+1. Create a recipe using the existing ingredients and instructions. Make sure the recipe is complete.
+2. For ingredients, append new ingredients to the existing ones.
+3. For instructions, append new steps to the existing ones.
+4. 'ingredients' is always an array of objects with 'icon', 'name', and 'amount' fields
+5. 'instructions' is always an array of strings
+
+If you have just created or modified the recipe, just answer in one sentence what you did. dont describe the recipe, just say what you did.
+"""
+
+
+def build_recipe_context(state: Dict[str, Any]) -> str:
     """
-    Standard chat node.
+    The per-turn part of the prompt: the current recipe.
     """
     # Create a safer serialization of the recipe
     recipe_json = "No recipe yet"
@@ -158,53 +182,35 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             recipe_json = json.dumps(state["recipe"], indent=2)
         except Exception as e:
             recipe_json = f"Error serializing recipe: {str(e)}"
-    
-    system_prompt = f"""You are a helpful assistant for creating recipes. 
-    This is the current state of the recipe: {recipe_json}
-    You can improve the recipe by calling the generate_recipe tool.
-    
-    IMPORTANT:
-    1. Create a recipe using the existing ingredients and instructions. Make sure the recipe is complete.
-    2. For ingredients, append new ingredients to the existing ones.
-    3. For instructions, append new steps to the existing ones.
-    4. 'ingredients' is always an array of objects with 'icon', 'name', and 'amount' fields
-    5. 'instructions' is always an array of strings
-
-    If you have just created or modified the recipe, just answer in one sentence what you did. dont describe the recipe, just say what you did.
-    """
+    return context_block(f"This is the current state of the recipe: {recipe_json}", today_line=TODAY_LINE_EN)
 
-    # Define the model
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
+
+async def chat_node(state: Dict[str, Any], config: RunnableConfig):
+    """
+    Standard chat node.
+    """
     # Define config for the model
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
     # Use CopilotKit's custom config functions to properly set up streaming for the recipe state
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "recipe",
-            "tool": "generate_recipe",
-            "tool_argument": "recipe"
-        }],
-    )
+    config = customize_config(config, RECIPE_STREAM)
 
     # Bind the tools to the model
-    model_with_tools = model.bind_tools(
-        [
-            *state["copilotkit"]["actions"],
-            GENERATE_RECIPE_TOOL
-        ],
-        # Disable parallel tool calls to avoid race conditions
+    model_with_tools = get_model_with_tools(
+        [GENERATE_RECIPE_TOOL],
+        actions=state["copilotkit"]["actions"],
+        response_cache=CacheScope("recipe", data_version(state.get("recipe"), ())),
         parallel_tool_calls=False,
     )
 
     # Run the model and generate a response
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state["messages"],
-    ], config)
+    response = await invoke_model(model_with_tools, layout_messages(
+        "recipe",
+        RECIPE_INSTRUCTIONS,
+        build_recipe_context(state),
+        window_history(state["messages"], config),
+    ), config, state, RECIPE_STREAM)
 
     # Update messages with the response
     messages = state["messages"] + [response]
@@ -263,7 +269,7 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             
             # Explicitly emit the updated state to ensure it's shared with frontend
             state["recipe"] = recipe
-            await copilotkit_emit_state(config, state)
+            await emit_state(config, state, final=True)
             
             # Return command with updated recipe
             return Command(
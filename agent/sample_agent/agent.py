@@ -4,7 +4,6 @@ It defines the workflow graph, state, tools, nodes and edges.
 """
 
 from typing_extensions import Literal
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, AIMessage
 from langchain_core.runnables import RunnableConfig
 from langchain.tools import tool
@@ -13,6 +12,11 @@ from langgraph.types import Command
 from langgraph.prebuilt import ToolNode
 from copilotkit import CopilotKitState
 
+from shared.history import window_history
+from shared.model_registry import get_model_with_tools
+from shared.response_cache import CacheScope
+from shared.versioning import data_version
+
 class AgentState(CopilotKitState):
     """
     Here we define the state of the agent
@@ -54,40 +58,43 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> Command[Litera
     https://www.perplexity.ai/search/react-agents-NcXLQhreS0WDzpVaS4m9Cg
     """
     
-    # 1. Define the model
-    model = ChatOpenAI(model="gpt-4o-mini-2024-07-18")
-
-    # 2. Bind the tools to the model
-    model_with_tools = model.bind_tools(
+    # 1. Get the shared model with the tools bound
+    #    (cached per tool set, so this is cheap on every turn)
+    model_with_tools = get_model_with_tools(
         [
-            *state["copilotkit"]["actions"],
             get_weather,
             # your_tool_here
         ],
+        actions=state["copilotkit"]["actions"],
+        model="gpt-4o-mini-2024-07-18",
+
+        # 1.1 Reuse the previous reply when the same message is resent
+        #     and the language setting has not changed.
+        response_cache=CacheScope("sample", data_version({"language": state.get("language")}, ())),
 
-        # 2.1 Disable parallel tool calls to avoid race conditions,
+        # 1.2 Disable parallel tool calls to avoid race conditions,
         #     enable this for faster performance if you want to manage
         #     the complexity of running tool calls in parallel.
         parallel_tool_calls=False,
     )
 
-    # 3. Define the system message by which the chat model will be run
+    # 2. Define the system message by which the chat model will be run
     system_message = SystemMessage(
         content=f"You are a helpful assistant. Talk in {state.get('language', 'english')}."
     )
 
-    # 4. Run the model to generate a response
+    # 3. Run the model to generate a response
     response = await model_with_tools.ainvoke([
         system_message,
-        *state["messages"],
+        *window_history(state["messages"], config),
     ], config)
 
-    # 5. Check for tool calls in the response and handle them. We ignore
+    # 4. Check for tool calls in the response and handle them. We ignore
     #    CopilotKit actions, as they are handled by CopilotKit.
     if isinstance(response, AIMessage) and response.tool_calls:
         actions = state["copilotkit"]["actions"]
 
-        # 5.1 Check for any non-copilotkit actions in the response and
+        # 4.1 Check for any non-copilotkit actions in the response and
         #     if there are none, go to the tool node.
         if not any(
             action.get("name") == response.tool_calls[0].get("name")
@@ -95,7 +102,7 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> Command[Litera
         ):
             return Command(goto="tool_node", update={"messages": response})
 
-    # 6. We've handled all tool calls, so we can end the graph.
+    # 5. We've handled all tool calls, so we can end the graph.
     return Command(
         goto=END,
         update={
@@ -0,0 +1,343 @@
+"""
+NumPy分析后端 - 对多个用户的记录整批做向量化计算
+单一职责：计算与各Agent评分/分析函数完全相同的结果，并提供一次为多个用户评分的批量入口（夜间重算用）
+
+numpy是可选依赖：未安装时本模块仍可导入，HAS_NUMPY为False，调用函数时抛出ImportError。
+"""
+
+import sys
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # numpy是可选依赖
+    np = None
+
+from fertility_agent.bbt import (
+    BASELINE_READINGS, COVERLINE_OFFSET, FOLLOW_READINGS, HIGH_READINGS, MAX_GAP_DAYS, MIN_SHIFT_SPACING_DAYS,
+    THIRD_READING_RISE, _analysis as _bbt_analysis, _shift_summary, bbt_readings,
+)
+from lifestyle_agent.agent import SLEEP_QUALITY_SCORES, SLEEP_TREND_SCORES, STRESS_LEVEL_SCORES
+from shared.timeseries import Records, category_stats, tail_items, tail_values
+
+HAS_NUMPY = np is not None
+
+# Python 3.12起sum()对浮点数做补偿求和，np.cumsum只等价于之前版本的顺序累加
+_COMPENSATED_SUM = sys.version_info >= (3, 12)
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("NumPy分析后端需要安装numpy: pip install numpy")
+
+
+def _pad(rows: Sequence[Sequence[float]], width: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    把每个用户最近几条数值左对齐放进 用户数×width 的矩阵（不足补0），返回 (矩阵, 每行长度)。
+
+    每个用户只在Python里切出最近几条，之后的计算都是整批的数组运算。
+    """
+    lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+    flat = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=int(lengths.sum()))
+    matrix = np.zeros((len(rows), width), dtype=np.float64)
+    matrix[np.arange(width) < lengths[:, None]] = flat
+    return matrix, lengths
+
+
+def _tail_values(
+    records: Sequence[Optional[Records]],
+    value_field: str,
+    count: int,
+    default: float,
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """各用户最近count条数值组成的矩阵和每行长度，与tail_values逐条一致"""
+    return _pad([tail_values(data, value_field, count, default) for data in records], count)
+
+
+def _tail_scores(
+    records: Sequence[Optional[Records]],
+    value_field: str,
+    category_field: str,
+    count: int,
+    scores: Dict[str, int],
+    default_category: str,
+    default_score: int,
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    各用户最近count条记录的类别换算成分数后组成的矩阵，
+    与 scores.get(类别, default_score)（类别缺失时取default_category）逐条一致
+    """
+    return _pad([
+        [
+            scores.get(category, default_score)
+            for category, _ in tail_items(data, value_field, category_field, count, None, default_category)
+        ]
+        for data in records
+    ], count)
+
+
+def _row_sums(matrix: "np.ndarray") -> "np.ndarray":
+    """按行求和，与内置sum()逐位一致（补0不影响结果）"""
+    if _COMPENSATED_SUM:
+        return np.array([sum(row) for row in matrix.tolist()], dtype=np.float64)
+    if not matrix.shape[1]:
+        return np.zeros(len(matrix), dtype=np.float64)
+    return np.cumsum(matrix, axis=1)[:, -1]
+
+
+def _row_means(matrix: "np.ndarray", lengths: "np.ndarray") -> "np.ndarray":
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return _row_sums(matrix) / lengths
+
+
+# ---- 营养 ----
+
+def nutrition_scores(nutrition_data: Sequence[Dict[str, Any]]) -> List[int]:
+    """批量计算营养健康评分，与nutrition_agent.calculate_nutrition_score一致"""
+    _require_numpy()
+    water, lengths = _tail_values([data.get("daily_nutrition") for data in nutrition_data], "water_intake_ml", 7, 0)
+    avg_water = _row_means(water, lengths)
+    water_points = np.select(
+        [lengths == 0, avg_water >= 2000, avg_water >= 1500, avg_water >= 1000],
+        [0, 20, 15, 10],
+        0,
+    )
+    supplements = np.fromiter(
+        (min(len(data.get("supplements") or []), 7) for data in nutrition_data), dtype=np.int64, count=len(nutrition_data),
+    )
+    supplement_points = np.select([supplements >= 5, supplements >= 3, supplements >= 1], [15, 10, 5], 0)
+    return np.minimum(50 + water_points + supplement_points, 100).tolist()
+
+
+def hydration_statuses(nutrition_data: Sequence[Dict[str, Any]]) -> List[str]:
+    """批量分析水分摄入状态，与nutrition_agent.analyze_hydration_status一致"""
+    _require_numpy()
+    water, lengths = _tail_values([data.get("daily_nutrition") for data in nutrition_data], "water_intake_ml", 3, 0)
+    avg_water = _row_means(water, lengths)
+    labels = np.select(
+        [lengths == 0, avg_water >= 2000, avg_water >= 1500],
+        ["无数据", "水分摄入良好", "水分摄入一般"],
+        "水分摄入不足",
+    )
+    return labels.tolist()
+
+
+def calculate_nutrition_score(nutrition_data: Dict[str, Any]) -> int:
+    """计算营养健康评分"""
+    return nutrition_scores([nutrition_data])[0]
+
+
+def analyze_hydration_status(nutrition_data: Dict[str, Any]) -> str:
+    """分析水分摄入状态"""
+    return hydration_statuses([nutrition_data])[0]
+
+
+# ---- 生活方式 ----
+
+def lifestyle_scores(lifestyle_data: Sequence[Dict[str, Any]]) -> List[float]:
+    """批量计算生活方式评分，与lifestyle_agent.calculate_lifestyle_score一致"""
+    _require_numpy()
+    sleep_records = [data.get("sleep_records") for data in lifestyle_data]
+    duration, sleep_lengths = _tail_values(sleep_records, "sleep_duration_hours", 7, 7)
+    quality_score, _ = _tail_scores(sleep_records, "sleep_duration_hours", "sleep_quality", 7, SLEEP_QUALITY_SCORES, "Fair", 6)
+    duration_score = np.select([(duration >= 7) & (duration <= 9), (duration >= 6) & (duration <= 10)], [10, 8], 5)
+    # 补位的列清零，保证按行求和与逐条相加一致
+    sleep_score = np.where(np.arange(7) < sleep_lengths[:, None], (duration_score + quality_score) / 2, 0)
+    sleep_avg = _row_means(sleep_score, sleep_lengths)
+
+    # 压力等级只有类别没有数值，直接读最近7条
+    stress, stress_lengths = _pad([
+        [STRESS_LEVEL_SCORES.get(record.get("stress_level", "Moderate"), 7) for record in (data.get("stress_tracking") or [])[-7:]]
+        for data in lifestyle_data
+    ], 7)
+    stress_avg = _row_means(stress, stress_lengths)
+
+    scores = []
+    for index in range(len(lifestyle_data)):
+        # 与纯Python实现保持相同的类型：没有任何记录时是整数50
+        score = 50
+        if sleep_lengths[index]:
+            score += float(sleep_avg[index]) * 2
+        if stress_lengths[index]:
+            score += float(stress_avg[index]) * 2
+        scores.append(min(score, 100))
+    return scores
+
+
+def sleep_trends(sleep_records: Sequence[Optional[Records]]) -> List[str]:
+    """批量分析睡眠趋势，与lifestyle_agent.analyze_sleep_trend一致"""
+    _require_numpy()
+    # 不足3条的用户不参与计算
+    enough = [records if records is not None and len(records) >= 3 else None for records in sleep_records]
+    scores, lengths = _tail_scores(enough, "sleep_duration_hours", "sleep_quality", 7, SLEEP_TREND_SCORES, "Fair", 2)
+    avg_score = _row_means(scores, lengths)
+    labels = np.select(
+        [lengths == 0, avg_score >= 3.5, avg_score >= 2.5],
+        ["数据不足", "睡眠质量良好", "睡眠质量一般"],
+        "睡眠质量需要改善",
+    )
+    return labels.tolist()
+
+
+def calculate_lifestyle_score(lifestyle_data: Dict[str, Any]) -> float:
+    """计算生活方式评分"""
+    return lifestyle_scores([lifestyle_data])[0]
+
+
+def analyze_sleep_trend(sleep_records: Records) -> str:
+    """分析睡眠趋势"""
+    return sleep_trends([sleep_records])[0]
+
+
+# ---- 基础体温 ----
+
+def bbt_patterns(bbt_data: Sequence[Optional[Records]]) -> List[Dict[str, Any]]:
+    """
+    批量分析基础体温模式，与fertility_agent.analyze_bbt_pattern一致。
+
+    所有用户的体温拼接成一个数组，按用户和漏测间隔切成连续段，
+    "三高于六"的判断整批完成；只有候选升温（通常每个周期几次）在Python里按间隔规则筛选。
+    """
+    _require_numpy()
+    window = BASELINE_READINGS + HIGH_READINGS
+    readings = [bbt_readings(data) for data in bbt_data]
+    lengths = np.fromiter((len(user_readings) for user_readings in readings), dtype=np.int64, count=len(readings))
+    total = int(lengths.sum())
+    days = np.fromiter((day for user_readings in readings for day, _ in user_readings), dtype=np.int64, count=total)
+    temperatures = np.fromiter(
+        (temperature for user_readings in readings for _, temperature in user_readings), dtype=np.float64, count=total,
+    )
+    users = np.repeat(np.arange(len(readings)), lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+
+    # 每个位置在所属连续段内的序号：换用户或间隔超过MAX_GAP_DAYS时从0开始
+    index = np.arange(total)
+    breaks = np.ones(total, dtype=bool)
+    breaks[1:] = (users[1:] != users[:-1]) | (days[1:] - days[:-1] > MAX_GAP_DAYS)
+    positions = index - np.maximum.accumulate(np.where(breaks, index, 0)) if total else index
+    evaluated = np.bincount(users[positions >= window - 1], minlength=len(readings))
+
+    # 以第3次高温的位置j为准：基线是 j-8..j-3 的最大值（滑动窗口最大值），覆盖线在其上0.05℃
+    candidates = np.flatnonzero(positions >= window - 1)
+    accepted: Dict[int, int] = {}
+    if len(candidates):
+        baseline_max = sliding_window_view(temperatures, BASELINE_READINGS).max(axis=1)[candidates - window + 1]
+        coverline = baseline_max + COVERLINE_OFFSET
+        rising = (temperatures[candidates] >= baseline_max + THIRD_READING_RISE)
+        for offset in range(HIGH_READINGS):
+            rising &= temperatures[candidates - offset] > coverline
+        for last_high in candidates[rising].tolist():
+            user = int(users[last_high])
+            previous = accepted.get(user)
+            first_high = last_high - HIGH_READINGS + 1
+            if previous is None or days[first_high] - days[previous - HIGH_READINGS + 1] >= MIN_SHIFT_SPACING_DAYS:
+                accepted[user] = last_high
+
+    patterns: List[Dict[str, Any]] = []
+    for user, user_readings in enumerate(readings):
+        last_high = accepted.get(user)
+        if last_high is None:
+            patterns.append(_bbt_analysis(None, int(evaluated[user]), 0, 0))
+            continue
+        # 升温本身和升温后的体温只涉及十几个数，与逐条检测用同一段Python计算，结果逐位一致
+        local = last_high - int(starts[user])
+        baseline = user_readings[local - window + 1:local - HIGH_READINGS + 1]
+        highs = user_readings[local - HIGH_READINGS + 1:local + 1]
+        shift = _shift_summary(baseline, highs, max(temperature for _, temperature in baseline))
+        following = user_readings[local + 1:local + 1 + FOLLOW_READINGS]
+        elevated = sum(temperature > shift["coverline"] for _, temperature in following)
+        patterns.append(_bbt_analysis(shift, int(evaluated[user]), len(following), elevated))
+    return patterns
+
+
+def analyze_bbt_pattern(bbt_data: Records) -> Dict[str, Any]:
+    """分析基础体温模式"""
+    return bbt_patterns([bbt_data])[0]
+
+
+# ---- 症状和情绪 ----
+
+def _grouped_stats(
+    records: Sequence[Optional[Records]],
+    value_field: str,
+    category_field: str,
+) -> List[Dict[str, Tuple[int, float]]]:
+    """每个用户按类别首次出现顺序的 {类别: (条数, 合计)}，空类别不计入"""
+    return [
+        {
+            category: counted
+            for category, counted in category_stats(data, value_field, category_field, 0).items()
+            if category
+        }
+        for data in records
+    ]
+
+
+def symptom_patterns(symptoms: Sequence[Optional[Records]]) -> List[Dict[str, Any]]:
+    """批量分析症状模式，与symptom_mood_agent.analyze_symptom_patterns一致"""
+    _require_numpy()
+    results: List[Dict[str, Any]] = []
+    for data, stats in zip(symptoms, _grouped_stats(symptoms, "severity", "symptom_type")):
+        if not data:
+            results.append({"common_symptoms": [], "severity_analysis": "暂无数据"})
+            continue
+        common_symptoms = sorted(stats.items(), key=lambda x: x[1][0], reverse=True)[:3]
+        avg_severity = ", ".join(f"{s_type}: {total / count:.1f}" for s_type, (count, total) in stats.items())
+        results.append({
+            "common_symptoms": [symptom[0] for symptom in common_symptoms],
+            "severity_analysis": f"平均症状严重程度: {avg_severity}",
+        })
+    return results
+
+
+def mood_trends(moods: Sequence[Optional[Records]]) -> List[str]:
+    """批量分析情绪趋势，与symptom_mood_agent.analyze_mood_trends一致"""
+    _require_numpy()
+    results: List[str] = []
+    for data, stats in zip(moods, _grouped_stats(moods, "intensity", "mood_type")):
+        if not data:
+            results.append("暂无情绪数据")
+            continue
+        dominant_mood = max(stats.items(), key=lambda x: x[1][0])[0]
+        avg_intensity = ", ".join(f"{m_type}: {total / count:.1f}" for m_type, (count, total) in stats.items())
+        results.append(f"主要情绪: {dominant_mood}, 平均情绪强度: {avg_intensity}")
+    return results
+
+
+def analyze_symptom_patterns(symptoms: Records) -> Dict[str, Any]:
+    """分析症状模式"""
+    return symptom_patterns([symptoms])[0]
+
+
+def analyze_mood_trends(moods: Records) -> str:
+    """分析情绪趋势"""
+    return mood_trends([moods])[0]
+
+
+# ---- 批量入口 ----
+
+def score_users(users: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    一次为多个用户计算全部指标。
+
+    users中每项是一个用户的状态（nutrition_data、lifestyle_data、fertility_data、symptom_mood_data），
+    返回与users顺序一致的结果。
+    """
+    _require_numpy()
+    nutrition = [user.get("nutrition_data") or {} for user in users]
+    lifestyle = [user.get("lifestyle_data") or {} for user in users]
+    fertility = [user.get("fertility_data") or {} for user in users]
+    symptom_mood = [user.get("symptom_mood_data") or {} for user in users]
+
+    columns = {
+        "nutrition_score": nutrition_scores(nutrition),
+        "hydration_status": hydration_statuses(nutrition),
+        "lifestyle_score": lifestyle_scores(lifestyle),
+        "sleep_quality_trend": sleep_trends([data.get("sleep_records") or [] for data in lifestyle]),
+        "bbt_analysis": bbt_patterns([data.get("basal_body_temperature") or [] for data in fertility]),
+        "symptom_patterns": symptom_patterns([data.get("symptoms") or [] for data in symptom_mood]),
+        "mood_trends": mood_trends([data.get("moods") or [] for data in symptom_mood]),
+    }
+    return [{name: values[index] for name, values in columns.items()} for index in range(len(users))]
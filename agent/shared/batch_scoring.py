@@ -0,0 +1,322 @@
+"""
+批量评分任务 - 不经过聊天，离线为大量用户重新计算洞察
+单一职责：从JSONL文件或本地SQLite流式读取用户状态，在进程池中用各Agent的纯函数重算洞察块和领域摘要并写回，报告吞吐量
+
+用户状态沿用主协调器的字段：cycle_data、symptom_mood_data、fertility_data、nutrition_data、
+exercise_data、lifestyle_data，综合洞察写入insights_data。全程不调用模型。
+
+用法：
+    python -m shared.batch_scoring users.jsonl --output refreshed.jsonl --workers 4
+    python -m shared.batch_scoring users.db --table user_states
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from shared.summaries import SUMMARY_FIELD, SUMMARY_PROVIDER_MODULES, domain_summaries
+
+logger = logging.getLogger(__name__)
+
+# 每个任务处理的用户数：太小时进程间通信开销占比高，太大时负载不均
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "200"))
+# 默认进程数
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+
+# 洞察块：(状态字段, 洞察字段, 模块, 构建函数名)
+_INSIGHT_BLOCKS = (
+    ("nutrition_data", "nutrition_insights", "nutrition_agent.agent", "build_nutrition_insights"),
+    ("lifestyle_data", "lifestyle_insights", "lifestyle_agent.agent", "build_lifestyle_insights"),
+    ("fertility_data", "fertility_insights", "fertility_agent.agent", "build_fertility_insights"),
+    ("symptom_mood_data", "patterns", "symptom_mood_agent.agent", "build_symptom_mood_patterns"),
+)
+
+_builders: Optional[List[Tuple[str, str, Callable[[Dict[str, Any]], Dict[str, Any]]]]] = None
+_health_builder: Optional[Callable[..., Dict[str, Any]]] = None
+
+
+class BatchStats(NamedTuple):
+    """一次批量评分的统计"""
+    users: int
+    changed: int
+    failed: int
+    seconds: float
+
+    @property
+    def users_per_second(self) -> float:
+        return self.users / self.seconds if self.seconds > 0 else 0.0
+
+    def describe(self) -> str:
+        return (
+            f"处理{self.users}个用户（更新{self.changed}个，失败{self.failed}个），"
+            f"耗时{self.seconds:.2f}秒，{self.users_per_second:.0f} users/sec"
+        )
+
+
+def _load_builders() -> None:
+    """延迟导入各Agent模块，进程池的每个子进程只导入一次"""
+    global _builders, _health_builder
+    if _builders is not None:
+        return
+    from importlib import import_module
+
+    _builders = [
+        (state_key, insights_key, getattr(import_module(module), name))
+        for state_key, insights_key, module, name in _INSIGHT_BLOCKS
+    ]
+    _health_builder = import_module("health_insights_agent.agent").build_health_insights
+
+
+def refresh_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    重新计算一个用户的全部洞察块，返回新的状态（不修改传入的状态）。
+
+    只处理存在的领域；各领域的摘要在洞察之后同一遍更新（摘要版本包含洞察，洞察变化后旧摘要即失效），
+    综合洞察最后计算，读到的是刷新后的摘要。
+    模型生成的pattern_insights无法离线重算，和上次模型分析时的数据版本（analyzed_version）一起保留原值。
+    """
+    _load_builders()
+    refreshed = dict(state)
+    for state_key, insights_key, build in _builders:
+        data = state.get(state_key)
+        if data:
+            refreshed[state_key] = {**data, insights_key: build(data)}
+
+    # 摘要仍与数据版本一致时原样保留，否则重新发布
+    for state_key, summary in domain_summaries(refreshed).items():
+        if summary is not None and summary != refreshed[state_key].get(SUMMARY_FIELD):
+            refreshed[state_key] = {**refreshed[state_key], SUMMARY_FIELD: summary}
+
+    previous = state.get("insights_data") or {}
+    refreshed["insights_data"] = {
+        **_health_builder(refreshed, previous.get("pattern_insights", [])),
+        "analyzed_version": previous.get("analyzed_version"),
+    }
+    return refreshed
+
+
+def changed_blocks(state: Dict[str, Any], refreshed: Dict[str, Any]) -> List[Tuple[Tuple[str, ...], Any]]:
+    """对比重算前后的状态，返回有变化的洞察块和摘要 [(字段路径, 新值)]"""
+    insight_keys = {state_key: insights_key for state_key, insights_key, _ in _builders}
+    changes = []
+    for state_key in SUMMARY_PROVIDER_MODULES:
+        if state_key not in refreshed or refreshed[state_key] is state.get(state_key):
+            continue
+        previous = state.get(state_key) or {}
+        for field in (insight_keys.get(state_key), SUMMARY_FIELD):
+            if field and field in refreshed[state_key] and refreshed[state_key][field] != previous.get(field):
+                changes.append(((state_key, field), refreshed[state_key][field]))
+    if refreshed["insights_data"] != state.get("insights_data"):
+        changes.append((("insights_data",), refreshed["insights_data"]))
+    return changes
+
+
+# SQLite回写用的补丁：(JSON路径, 对应的新值JSON)
+Patch = Tuple[Tuple[str, ...], Tuple[str, ...]]
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _refresh_lines(lines: List[str], as_patches: bool = False) -> Tuple[List[Any], int, int]:
+    """
+    子进程任务：解析并重算一批JSON行。
+
+    默认返回完整的新行（没有变化的行原样返回，省去重新序列化）；
+    as_patches为True时只返回有变化的洞察块（Patch），没有变化时为None。
+    失败的行按没有变化处理。
+    """
+    output: List[Any] = []
+    changed = failed = 0
+    for line in lines:
+        try:
+            state = json.loads(line)
+            refreshed = refresh_state(state)
+            changes = changed_blocks(state, refreshed)
+        except Exception as e:
+            logger.warning("用户状态重算失败，保留原数据: %s", e)
+            output.append(None if as_patches else line)
+            failed += 1
+            continue
+        if not changes:
+            output.append(None if as_patches else line)
+            continue
+        changed += 1
+        if as_patches:
+            output.append((
+                tuple("$." + ".".join(path) for path, _ in changes),
+                tuple(_encode(block) for _, block in changes),
+            ))
+        else:
+            output.append(_encode(refreshed))
+    return output, changed, failed
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _InlineExecutor(Executor):
+    """workers=1时在当前进程内执行，便于调试"""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _run(
+    chunks: Iterable[Tuple[Any, List[str]]],
+    write: Callable[[Any, List[Any]], None],
+    workers: int,
+    as_patches: bool = False,
+) -> BatchStats:
+    """
+    把 (标记, 行列表) 分发到进程池，按提交顺序写回结果。
+
+    同时在途的任务数有上限，读取、计算和写回流水线进行，内存占用与总用户数无关。
+    """
+    started = time.perf_counter()
+    users = changed = failed = 0
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else _InlineExecutor()
+    pending: Deque[Tuple[Any, Future]] = deque()
+    try:
+        for tag, lines in chunks:
+            pending.append((tag, executor.submit(_refresh_lines, lines, as_patches)))
+            while len(pending) > workers * 2:
+                users, changed, failed = _collect(pending, write, users, changed, failed)
+        while pending:
+            users, changed, failed = _collect(pending, write, users, changed, failed)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return BatchStats(users, changed, failed, time.perf_counter() - started)
+
+
+def _collect(
+    pending: Deque[Tuple[Any, Future]],
+    write: Callable[[Any, List[Any]], None],
+    users: int,
+    changed: int,
+    failed: int,
+) -> Tuple[int, int, int]:
+    """等待最早提交的任务并写回"""
+    tag, future = pending.popleft()
+    lines, chunk_changed, chunk_failed = future.result()
+    write(tag, lines)
+    return users + len(lines), changed + chunk_changed, failed + chunk_failed
+
+
+def score_jsonl(
+    input_path: str,
+    output_path: Optional[str] = None,
+    workers: int = BATCH_WORKERS,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+) -> BatchStats:
+    """处理JSONL文件（每行一个用户状态）；不指定输出时写入临时文件后替换原文件"""
+    target = output_path or f"{input_path}.tmp"
+    with open(input_path, encoding="utf-8") as source, open(target, "w", encoding="utf-8") as sink:
+        lines = (line.rstrip("\n") for line in source if line.strip())
+
+        def write(_tag: Any, refreshed: List[Optional[str]]) -> None:
+            sink.writelines(f"{line}\n" for line in refreshed)
+
+        stats = _run(((None, chunk) for chunk in _chunks(lines, chunk_size)), write, workers)
+    if output_path is None:
+        os.replace(target, input_path)
+    return stats
+
+
+def score_sqlite(
+    db_path: str,
+    table: str = "user_states",
+    state_column: str = "state",
+    workers: int = BATCH_WORKERS,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+) -> BatchStats:
+    """
+    处理SQLite表（每行一个用户，state列为JSON文本），原地更新。
+
+    按rowid分页读取，每批写回后提交，中途中断时已处理的用户保持更新后的状态。
+    只回写有变化的洞察块（需要SQLite的JSON1函数，3.38起默认包含）。
+    """
+    for name in (table, state_column):
+        if not name.replace("_", "").isalnum():
+            raise ValueError(f"非法的表名或列名: {name}")
+
+    connection = sqlite3.connect(db_path)
+    try:
+        def pages() -> Iterator[Tuple[List[int], List[str]]]:
+            last_rowid = -1
+            while True:
+                rows = connection.execute(
+                    f"SELECT rowid, {state_column} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, chunk_size),
+                ).fetchall()
+                if not rows:
+                    return
+                last_rowid = rows[-1][0]
+                yield [row[0] for row in rows], [row[1] for row in rows]
+
+        def write(rowids: List[int], patches: List[Optional[Patch]]) -> None:
+            # 只用json_set写回有变化的洞察块，记录列表不经过Python重新序列化
+            by_paths: Dict[Tuple[str, ...], List[Tuple[Any, ...]]] = {}
+            for rowid, patch in zip(rowids, patches):
+                if patch is not None:
+                    paths, values = patch
+                    by_paths.setdefault(paths, []).append((*values, rowid))
+            for paths, rows in by_paths.items():
+                assignments = ", ".join(f"'{path}', json(?)" for path in paths)
+                connection.executemany(
+                    f"UPDATE {table} SET {state_column} = json_set({state_column}, {assignments}) WHERE rowid = ?",
+                    rows,
+                )
+            connection.commit()
+
+        return _run(pages(), write, workers, as_patches=True)
+    finally:
+        connection.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="离线重新计算用户健康洞察（不调用模型）")
+    parser.add_argument("input", help="JSONL文件或SQLite数据库（.db/.sqlite/.sqlite3）")
+    parser.add_argument("--output", help="JSONL输出文件，默认覆盖输入文件")
+    parser.add_argument("--table", default="user_states", help="SQLite表名")
+    parser.add_argument("--state-column", default="state", help="SQLite状态JSON列")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="进程数，1表示在当前进程内执行")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="每个任务的用户数")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    if args.input.endswith((".db", ".sqlite", ".sqlite3")):
+        stats = score_sqlite(
+            args.input, args.table, args.state_column,
+            workers=args.workers, chunk_size=args.chunk_size,
+        )
+    else:
+        stats = score_jsonl(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size)
+    print(stats.describe())
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
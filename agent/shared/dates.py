@@ -0,0 +1,31 @@
+"""
+日期解析 - 提示词上下文、快速记录和周期/体温分析共用
+单一职责：识别 YYYY-MM-DD / X月X日 形式的日期，并把年月日安全地转成ISO日期；记录中的ISO日期转成序数
+"""
+
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Optional
+
+# 2026-10-01
+ISO_DATE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+# 2026年10月1日 / 10月1号（年份可省略）
+CN_DATE = re.compile(r"(?:(\d{4})年)?(\d{1,2})月(\d{1,2})[日号]")
+
+
+def safe_date(year: int, month: int, day: int) -> Optional[str]:
+    """年月日转ISO日期，日期不存在（如2月30日）时返回None"""
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=8192)
+def date_ordinal(raw_date: str) -> int:
+    """ISO日期转序数，不是ISO格式时返回0"""
+    try:
+        return date.fromisoformat(raw_date).toordinal()
+    except ValueError:
+        return 0
@@ -0,0 +1,226 @@
+"""
+对话历史窗口 - 控制每轮发给模型的历史消息体量
+单一职责：保留最近N轮原文，更早的轮次用滚动摘要代替（后台生成，不阻塞当前请求），并受token预算约束
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+from shared.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# 原文保留的最近轮数（一轮从一条用户消息开始）
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+# 历史消息（含摘要）的token上限
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+# 滚动摘要的token上限
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+# 是否在后台调用模型生成摘要（关闭时只用抽取式摘要）
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "1") == "1"
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+
+# 每条消息的格式开销（role等）
+_MESSAGE_OVERHEAD = 4
+# 抽取式摘要中每条用户消息保留的字符数
+_EXCERPT_CHARS = 80
+_SUMMARY_CACHE_SIZE = 1024
+
+SUMMARY_PROMPT = """请把下面的对话压缩成一段简短的中文摘要，供健康助手在后续对话中参考。
+保留用户提到的日期、症状、数值、目标和偏好，以及助手已经记录或建议过的内容；不要编造。
+摘要不超过200字。"""
+
+# thread_id -> (已摘要的消息条数, 摘要文本)
+_summaries: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+_pending: Dict[str, asyncio.Task] = {}
+
+
+def get_thread_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    """从运行配置中取会话ID"""
+    if not config:
+        return None
+    thread_id = (config.get("configurable") or {}).get("thread_id")
+    return str(thread_id) if thread_id else None
+
+
+def message_tokens(message: BaseMessage) -> int:
+    """估算单条消息的token数（含工具调用参数）"""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    tokens = count_tokens(content) + _MESSAGE_OVERHEAD
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += count_tokens(json.dumps(tool_call.get("args", {}), ensure_ascii=False, default=str))
+    return tokens
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """按用户消息切分轮次；系统消息（例如旧的路由横幅）直接丢弃"""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            continue
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def strip_tool_echoes(turn: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """
+    去掉已完成轮次里的工具调用回显。
+
+    工具调用和对应的ToolMessage成对移除；助手消息若有文字内容则保留文字。
+    """
+    stripped: List[BaseMessage] = []
+    removed_ids: Set[str] = set()
+    for message in turn:
+        if isinstance(message, AIMessage) and message.tool_calls:
+            removed_ids.update(tool_call["id"] for tool_call in message.tool_calls)
+            if isinstance(message.content, str) and message.content.strip():
+                stripped.append(AIMessage(content=message.content, id=message.id))
+        elif isinstance(message, ToolMessage):
+            if message.tool_call_id not in removed_ids:
+                stripped.append(message)
+        else:
+            stripped.append(message)
+    return stripped
+
+
+def extractive_summary(messages: Sequence[BaseMessage], max_tokens: int = HISTORY_SUMMARY_TOKENS) -> str:
+    """不调用模型的摘要：保留用户消息和助手文字回复的开头，超出预算时只保留最近的部分"""
+    kept: List[str] = []
+    used = 0
+    for message in reversed(messages):
+        if not isinstance(message.content, str) or not message.content.strip():
+            continue
+        if isinstance(message, HumanMessage):
+            role = "用户"
+        elif isinstance(message, AIMessage):
+            role = "助手"
+        else:
+            continue
+        text = " ".join(message.content.split())
+        if len(text) > _EXCERPT_CHARS:
+            text = text[:_EXCERPT_CHARS] + "…"
+        line = f"{role}: {text}"
+        tokens = count_tokens(line) + 1
+        if used + tokens > max_tokens:
+            break
+        kept.append(line)
+        used += tokens
+    kept.reverse()
+    return "\n".join(kept)
+
+
+def _cached_summary(thread_id: Optional[str]) -> Tuple[int, str]:
+    if thread_id is None or thread_id not in _summaries:
+        return 0, ""
+    _summaries.move_to_end(thread_id)
+    return _summaries[thread_id]
+
+
+def _store_summary(thread_id: str, covered: int, summary: str) -> None:
+    _summaries[thread_id] = (covered, summary)
+    _summaries.move_to_end(thread_id)
+    while len(_summaries) > _SUMMARY_CACHE_SIZE:
+        _summaries.popitem(last=False)
+
+
+async def _summarize(thread_id: str, previous: str, messages: List[BaseMessage], covered: int) -> None:
+    """后台生成滚动摘要：上一版摘要 + 新移出窗口的消息"""
+    # 延迟导入，避免模块加载时就依赖OpenAI配置
+    from shared.model_registry import get_model
+
+    transcript = extractive_summary(messages, max_tokens=HISTORY_TOKEN_BUDGET)
+    if previous:
+        transcript = f"此前摘要：\n{previous}\n\n新增对话：\n{transcript}"
+    try:
+        # 不挂任何回调，摘要调用不会出现在前端的流式输出里
+        response = await get_model(HISTORY_SUMMARY_MODEL).ainvoke([
+            SystemMessage(content=SUMMARY_PROMPT),
+            HumanMessage(content=transcript),
+        ], {"callbacks": []})
+        summary = response.content if isinstance(response.content, str) else ""
+        if summary:
+            _store_summary(thread_id, covered, summary.strip())
+    except Exception as e:
+        logger.warning("对话摘要生成失败，继续使用抽取式摘要: %s", e)
+    finally:
+        _pending.pop(thread_id, None)
+
+
+def _schedule_summary(thread_id: str, previous: str, messages: List[BaseMessage], covered: int) -> None:
+    if not HISTORY_SUMMARY_ENABLED or thread_id in _pending:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    # 在空的上下文里创建任务：否则任务会复制当前图节点的contextvars，
+    # LangChain据此把节点的回调挂到摘要调用上，CopilotKit会把摘要当作回复流式推给用户
+    _pending[thread_id] = contextvars.Context().run(
+        loop.create_task, _summarize(thread_id, previous, messages, covered)
+    )
+
+
+def window_history(
+    messages: Sequence[BaseMessage],
+    config: Optional[RunnableConfig] = None,
+    keep_turns: int = HISTORY_KEEP_TURNS,
+    budget: int = HISTORY_TOKEN_BUDGET,
+) -> List[BaseMessage]:
+    """
+    返回本轮要发给模型的历史消息。
+
+    最后一轮原样保留（可能正处于工具调用循环中）；之前保留的轮次去掉工具回显；
+    超出轮数或预算的更早轮次折叠成一条摘要消息放在最前面。
+    """
+    turns = split_turns(messages)
+    if not turns:
+        return []
+
+    current = turns[-1]
+    candidates = turns[-keep_turns:-1] if keep_turns > 1 else []
+
+    used = sum(message_tokens(message) for message in current)
+    kept: List[List[BaseMessage]] = []
+    for turn in reversed(candidates):
+        stripped = strip_tool_echoes(turn)
+        tokens = sum(message_tokens(message) for message in stripped)
+        if used + tokens > budget - HISTORY_SUMMARY_TOKENS:
+            break
+        kept.append(stripped)
+        used += tokens
+    kept.reverse()
+
+    history = [message for turn in kept for message in turn] + list(current)
+    older = turns[:len(turns) - 1 - len(kept)]
+    if not older:
+        return history
+
+    # 以原始消息计数，保证同一会话多轮之间的摘要进度可比
+    older_messages = [message for turn in older for message in turn]
+    thread_id = get_thread_id(config)
+    covered, summary = _cached_summary(thread_id)
+    if covered < len(older_messages):
+        # 缓存摘要之后新移出窗口的部分先用抽取式摘要补上，同时在后台更新滚动摘要
+        tail = extractive_summary(older_messages[covered:])
+        if thread_id is not None:
+            _schedule_summary(thread_id, summary, older_messages[covered:], len(older_messages))
+        summary = f"{summary}\n{tail}".strip() if summary else tail
+
+    if not summary:
+        return history
+    return [SystemMessage(content=f"此前对话摘要：\n{summary}"), *history]
+
+
+def history_stats() -> Dict[str, Any]:
+    """摘要缓存状态"""
+    return {"summaries": len(_summaries), "pending": len(_pending)}
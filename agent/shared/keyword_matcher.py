@@ -0,0 +1,114 @@
+"""
+多模式关键词匹配器 - 分组关键词表在构建时编译一次
+单一职责：找出文本中所有分组关键词（中英文混合）的出现位置，并按分组去重计分
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+
+class KeywordHit(NamedTuple):
+    """一次关键词命中"""
+    offset: int
+    keyword: str
+    labels: Tuple[str, ...]
+    index: int
+
+
+class MatchResult(NamedTuple):
+    """按分组汇总的匹配结果"""
+    # 每个分组命中的不同关键词，按关键词声明顺序排列
+    hits: Dict[str, List[str]]
+    # 每个分组命中的不同关键词个数
+    counts: Dict[str, int]
+    # 去重后的分组得分：同时属于多个分组的关键词按分组数平分权重
+    scores: Dict[str, float]
+
+
+def _is_latin(char: str) -> bool:
+    return char.isascii() and char.isalpha()
+
+
+class KeywordMatcher:
+    """
+    在构建时合并、去重全部关键词；匹配时沿用原先逐个 `kw in text` 的C层面子串判断。
+
+    match() 只判断是否命中，开销和原先的路由分类相当（共享关键词只判断一次）；只有子串命中的英文关键词
+    才再确认词边界：可以紧挨数字或中文（"2000ml"、"ml水"），但不会命中 "html" 里的 "ml"。
+    需要命中位置的分词（快速记录、快速回答）使用 iter_matches()。
+    """
+
+    def __init__(self, keyword_groups: Dict[str, Iterable[str]], case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self.labels = list(keyword_groups)
+
+        # 关键词 -> 所属分组（保持分组声明顺序）
+        owners: Dict[str, List[str]] = {}
+        for label, keywords in keyword_groups.items():
+            for keyword in keywords:
+                keyword = keyword if case_sensitive else keyword.lower()
+                if keyword and label not in owners.setdefault(keyword, []):
+                    owners[keyword].append(label)
+
+        self.keywords: List[str] = list(owners)
+        self.keyword_labels: List[Tuple[str, ...]] = [tuple(owners[kw]) for kw in self.keywords]
+        # 每个关键词首尾是否需要检查英文词边界
+        self._bounds: List[Tuple[bool, bool]] = [(_is_latin(kw[0]), _is_latin(kw[-1])) for kw in self.keywords]
+        self._unbounded = [(i, kw) for i, kw in enumerate(self.keywords) if not any(self._bounds[i])]
+        # 英文关键词另外编译一个带词边界的正则，子串命中后用它确认（以关键词开头，正则引擎可以按字面量快速定位）
+        self._bounded = [
+            (i, kw, re.compile(re.escape(kw) + (f"(?<![A-Za-z]{re.escape(kw)})" if start else "") + ("(?![A-Za-z])" if end else "")))
+            for i, (kw, (start, end)) in enumerate(zip(self.keywords, self._bounds)) if start or end
+        ]
+
+    def _offsets(self, text: str, index: int) -> List[int]:
+        """关键词在文本中所有满足词边界的起始位置"""
+        keyword = self.keywords[index]
+        check_start, check_end = self._bounds[index]
+        find, size, width = text.find, len(text), len(keyword)
+        offsets = []
+        offset = find(keyword)
+        while offset != -1:
+            end = offset + width
+            if not (check_start and offset and _is_latin(text[offset - 1])) and \
+                    not (check_end and end < size and _is_latin(text[end])):
+                offsets.append(offset)
+            offset = find(keyword, offset + 1)
+        return offsets
+
+    def _found(self, text: str) -> List[int]:
+        """命中的关键词序号：先做子串判断，需要词边界的英文关键词再用正则确认"""
+        found = [index for index, keyword in self._unbounded if keyword in text]
+        found.extend(index for index, keyword, bounded in self._bounded if keyword in text and bounded.search(text))
+        return found
+
+    def iter_matches(self, text: str) -> Iterator[KeywordHit]:
+        """按起始位置顺序产出所有命中（包括重叠命中，同一位置较长的关键词在前）"""
+        if not self.case_sensitive:
+            text = text.lower()
+
+        hits = [
+            (offset, -len(self.keywords[index]), index)
+            for index in self._found(text)
+            for offset in self._offsets(text, index)
+        ]
+        hits.sort()
+        for offset, _, index in hits:
+            yield KeywordHit(offset, self.keywords[index], self.keyword_labels[index], index)
+
+    def match(self, text: str) -> MatchResult:
+        """汇总每个分组命中的关键词、不同关键词个数和去重得分"""
+        if not self.case_sensitive:
+            text = text.lower()
+
+        hits: Dict[str, List[str]] = {label: [] for label in self.labels}
+        counts = {label: 0 for label in self.labels}
+        scores = {label: 0.0 for label in self.labels}
+        for index in sorted(self._found(text)):
+            keyword, labels = self.keywords[index], self.keyword_labels[index]
+            for label in labels:
+                hits[label].append(keyword)
+                counts[label] += 1
+                scores[label] += 1.0 / len(labels)
+
+        return MatchResult(hits=hits, counts=counts, scores=scores)
@@ -0,0 +1,223 @@
+"""
+记录合并引擎 - 按自然键把新记录并入已有列表
+单一职责：各Agent声明每个记录列表的自然键和冲突策略，用哈希索引合并（O(n+m)），并返回新增/更新/跳过的统计
+"""
+
+import json
+from typing import Any, Callable, Dict, Hashable, List, Mapping, NamedTuple, Sequence, Tuple
+
+KeyFunc = Callable[[Dict[str, Any]], Hashable]
+
+# 冲突策略：自然键相同的记录如何处理
+KEEP_FIRST = "keep_first"            # 保留已有记录
+LAST_WRITE_WINS = "last_write_wins"  # 新字段覆盖已有记录的同名字段
+SUM = "sum"                          # sum_fields累加，其余字段按last_write_wins处理
+
+_POLICIES = (KEEP_FIRST, LAST_WRITE_WINS, SUM)
+
+
+class MergeResult(NamedTuple):
+    """一次合并的结果"""
+    records: List[Dict[str, Any]]
+    inserted: int
+    updated: int
+    skipped: int
+    inserted_records: List[Dict[str, Any]]
+    updated_records: Sequence[Tuple[Dict[str, Any], Dict[str, Any]]] = ()  # 被更新的已有记录 (原记录, 新记录)
+
+
+class MergeSummary(NamedTuple):
+    """多个记录列表合并结果的汇总"""
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+    @property
+    def changed(self) -> bool:
+        """是否有记录被新增或更新"""
+        return bool(self.inserted or self.updated)
+
+    def describe(self) -> str:
+        return f"新增{self.inserted}条，更新{self.updated}条，跳过{self.skipped}条重复"
+
+
+class NaturalKey:
+    """由若干字段组成的自然键"""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, *fields: str):
+        if not fields:
+            raise ValueError("自然键至少需要一个字段")
+        self.fields = fields
+
+    def __call__(self, record: Dict[str, Any]) -> Hashable:
+        if len(self.fields) == 1:
+            return record.get(self.fields[0])
+        return tuple(record.get(field) for field in self.fields)
+
+
+def natural_key(*fields: str) -> NaturalKey:
+    """由若干字段组成的自然键，例如 natural_key("date", "symptom_type")"""
+    return NaturalKey(*fields)
+
+
+class CollectionSpec(NamedTuple):
+    """一个记录列表的合并声明"""
+    key: KeyFunc
+    policy: str = KEEP_FIRST
+    sum_fields: Tuple[str, ...] = ()
+
+
+def collection(*fields: str, policy: str = KEEP_FIRST, sum_fields: Sequence[str] = ()) -> CollectionSpec:
+    """声明记录列表：自然键字段 + 冲突策略"""
+    if policy not in _POLICIES:
+        raise ValueError(f"未知的冲突策略: {policy}")
+    if policy == SUM and not sum_fields:
+        raise ValueError("sum策略需要指定sum_fields")
+    return CollectionSpec(natural_key(*fields), policy, tuple(sum_fields))
+
+
+def whole_record(record: Dict[str, Any]) -> Hashable:
+    """以整条记录为键：只有字段完全相同的记录才视为重复"""
+    return json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def appended() -> CollectionSpec:
+    """声明没有自然键的记录列表（如同一天的多条饮食记录）：新记录追加，只跳过完全相同的重复记录"""
+    return CollectionSpec(whole_record, KEEP_FIRST)
+
+
+def _build_index(existing: List[Dict[str, Any]], incoming: Sequence[Dict[str, Any]], key: KeyFunc) -> Dict[Hashable, int]:
+    index: Dict[Hashable, int] = {}
+    if isinstance(key, NaturalKey):
+        # 先按第一个字段（通常是日期）筛选，只给可能冲突的记录计算完整键
+        first = key.fields[0]
+        wanted = {record.get(first) for record in incoming}
+        for position, record in enumerate(existing):
+            if record.get(first) in wanted:
+                index.setdefault(key(record), position)
+    else:
+        for position, record in enumerate(existing):
+            index.setdefault(key(record), position)
+    return index
+
+
+def _resolve(current: Dict[str, Any], record: Dict[str, Any], policy: str, sum_fields: Tuple[str, ...]) -> Dict[str, Any]:
+    merged = {**current, **record}
+    if policy == SUM:
+        for field in sum_fields:
+            if field in record:
+                merged[field] = (current.get(field) or 0) + (record.get(field) or 0)
+    return merged
+
+
+def merge_records(
+    existing: Sequence[Dict[str, Any]],
+    incoming: Sequence[Dict[str, Any]],
+    key: KeyFunc,
+    policy: str = KEEP_FIRST,
+    sum_fields: Sequence[str] = (),
+) -> MergeResult:
+    """
+    合并记录列表，不修改传入的列表。
+
+    已有记录先建索引（O(n)，自然键只索引首字段命中的记录），新记录逐条O(1)查找；
+    同一批新记录之间也按同样的策略合并。
+    没有任何变化时原样返回已有列表，避免复制整段历史。
+    """
+    if policy not in _POLICIES:
+        raise ValueError(f"未知的冲突策略: {policy}")
+
+    existing = existing if isinstance(existing, list) else list(existing or [])
+    if not incoming:
+        return MergeResult(existing, 0, 0, 0, [], [])
+
+    sum_fields = tuple(sum_fields)
+    # 已有数据里的重复项保持原样，索引指向第一条
+    index = _build_index(existing, incoming, key)
+
+    inserted_records: List[Dict[str, Any]] = []
+    updates: Dict[int, Dict[str, Any]] = {}
+    skipped = 0
+    total = len(existing)
+
+    for record in incoming:
+        record_key = key(record)
+        position = index.get(record_key)
+        if position is None:
+            index[record_key] = total + len(inserted_records)
+            inserted_records.append(record)
+            continue
+
+        if policy == KEEP_FIRST:
+            skipped += 1
+            continue
+
+        if position >= total:
+            current = inserted_records[position - total]
+        else:
+            current = updates.get(position, existing[position])
+        merged = _resolve(current, record, policy, sum_fields)
+        if merged == current:
+            skipped += 1
+        elif position >= total:
+            inserted_records[position - total] = merged
+        else:
+            updates[position] = merged
+
+    if not inserted_records and not updates:
+        return MergeResult(existing, 0, 0, skipped, [], [])
+
+    if updates:
+        records = list(existing)
+        for position, record in updates.items():
+            records[position] = record
+        records.extend(inserted_records)
+    else:
+        records = existing + inserted_records
+
+    return MergeResult(
+        records,
+        len(inserted_records),
+        len(updates),
+        skipped,
+        inserted_records,
+        [(existing[position], record) for position, record in updates.items()],
+    )
+
+
+def merge_collection_results(
+    existing_data: Mapping[str, Any],
+    incoming_data: Mapping[str, Any],
+    specs: Mapping[str, CollectionSpec],
+) -> Dict[str, MergeResult]:
+    """按声明合并多个记录列表，返回每个列表的合并结果（需要逐条新增/更新记录时使用）"""
+    results: Dict[str, MergeResult] = {}
+    for name, spec in specs.items():
+        current = existing_data.get(name) or []
+        if not incoming_data.get(name):
+            current = current if isinstance(current, list) else list(current)
+            results[name] = MergeResult(current, 0, 0, 0, [], [])
+            continue
+        results[name] = merge_records(current, incoming_data[name], spec.key, spec.policy, spec.sum_fields)
+    return results
+
+
+def summarize(results: Mapping[str, MergeResult]) -> MergeSummary:
+    """汇总多个记录列表的合并统计"""
+    return MergeSummary(
+        sum(result.inserted for result in results.values()),
+        sum(result.updated for result in results.values()),
+        sum(result.skipped for result in results.values()),
+    )
+
+
+def merge_collections(
+    existing_data: Mapping[str, Any],
+    incoming_data: Mapping[str, Any],
+    specs: Mapping[str, CollectionSpec],
+) -> Tuple[Dict[str, List[Dict[str, Any]]], MergeSummary]:
+    """按声明合并多个记录列表，返回 {列表名: 合并后的列表} 和汇总统计"""
+    results = merge_collection_results(existing_data, incoming_data, specs)
+    return {name: result.records for name, result in results.items()}, summarize(results)
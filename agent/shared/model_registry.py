@@ -0,0 +1,107 @@
+"""
+共享模型注册表 - 进程内复用ChatOpenAI客户端和已绑定工具的模型
+单一职责：按 (模型, 工具集, 前端actions哈希) 缓存绑定结果，所有Agent共享同一个异步HTTP连接池
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import httpx
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+
+from shared.response_cache import CacheScope, CachedModel
+from shared.tool_schemas import get_tool_definitions, get_tool_schema
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# 连接池配置
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+
+# 已绑定模型的缓存上限（前端actions不同会产生不同的绑定结果）
+MODEL_REGISTRY_SIZE = int(os.getenv("MODEL_REGISTRY_SIZE", "64"))
+
+_http_async_client: Optional[httpx.AsyncClient] = None
+_models: Dict[str, ChatOpenAI] = {}
+_bound_models: "OrderedDict[Tuple[Any, ...], Runnable]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get_http_async_client() -> httpx.AsyncClient:
+    """返回进程内共享的异步HTTP客户端，保持连接复用"""
+    global _http_async_client
+    if _http_async_client is None or _http_async_client.is_closed:
+        _http_async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+    return _http_async_client
+
+
+def get_model(model: str = DEFAULT_MODEL) -> ChatOpenAI:
+    """返回共享连接池的ChatOpenAI实例"""
+    if model not in _models:
+        _models[model] = ChatOpenAI(model=model, http_async_client=get_http_async_client())
+    return _models[model]
+
+
+def _digest(value: Any) -> str:
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def tool_fingerprint(tool: Any) -> str:
+    """工具定义的稳定指纹（来自Schema缓存）"""
+    return get_tool_schema(tool).fingerprint
+
+
+def get_model_with_tools(
+    tools: Sequence[Any],
+    actions: Sequence[Dict[str, Any]] = (),
+    model: str = DEFAULT_MODEL,
+    response_cache: Optional[CacheScope] = None,
+    **bind_kwargs: Any
+) -> Runnable:
+    """
+    返回绑定了前端actions和Agent工具的模型，相同组合只绑定一次。
+
+    传入response_cache时返回带响应缓存的包装（见 shared.response_cache）。
+    """
+    key = (
+        model,
+        tuple(tool_fingerprint(tool) for tool in tools),
+        _digest(list(actions)) if actions else None,
+        _digest(bind_kwargs),
+    )
+
+    bound = _bound_models.get(key)
+    if bound is not None:
+        _stats["hits"] += 1
+        _bound_models.move_to_end(key)
+    else:
+        _stats["misses"] += 1
+        bound = get_model(model).bind_tools([*actions, *get_tool_definitions(tools)], **bind_kwargs)
+        _bound_models[key] = bound
+        if len(_bound_models) > MODEL_REGISTRY_SIZE:
+            _bound_models.popitem(last=False)
+            _stats["evictions"] += 1
+    return bound if response_cache is None else CachedModel(bound, _digest(key), response_cache)
+
+
+def registry_stats() -> Dict[str, Any]:
+    """返回绑定缓存的命中统计"""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_bound_models),
+        "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+    }
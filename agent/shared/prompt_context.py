@@ -0,0 +1,164 @@
+"""
+提示词上下文构建器 - 用紧凑摘要代替整份领域数据
+单一职责：为系统提示词生成 计数 + 最近记录 + 与当前消息相关的记录 + 聚合结果，并受token预算约束
+"""
+
+import json
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from shared.dates import CN_DATE, ISO_DATE, safe_date
+from shared.summaries import SUMMARY_FIELD
+from shared.tokens import count_tokens
+from shared.versioning import REVISION_FIELD
+
+# 系统提示词中领域数据部分的token上限
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "1200"))
+# 每个记录列表默认展示的最近条数
+PROMPT_CONTEXT_RECENT = int(os.getenv("PROMPT_CONTEXT_RECENT", "5"))
+# 每个记录列表最多展示的相关条数
+PROMPT_CONTEXT_RELEVANT = 5
+
+# 放在数据后面的提示，避免模型以为未展示的历史记录不存在
+CONTEXT_NOTE = "（数据为摘要：counts为各列表总条数，recent为最近记录，relevant为与本条消息相关的记录；调用工具时只需提交新增或修改的条目）"
+CONTEXT_NOTE_EN = "(Summary view: counts are list sizes, recent holds the latest entries, relevant holds entries matching this message. When calling the tool, only send new or changed entries.)"
+
+_RELATIVE_DAYS = {
+    "今天": 0, "今日": 0, "today": 0,
+    "昨天": 1, "昨晚": 1, "yesterday": 1,
+    "前天": 2,
+}
+
+# 值过长的字段（备注等）不参与关键词匹配
+_MAX_MATCH_VALUE_LENGTH = 40
+
+
+def extract_dates(message: str, today: Optional[date] = None) -> Set[str]:
+    """提取消息中提到的日期（YYYY-MM-DD / X月X日 / 今天昨天前天）"""
+    today = today or date.today()
+    lowered = message.lower()
+    dates = set()
+
+    for year, month, day in ISO_DATE.findall(message):
+        dates.add(safe_date(int(year), int(month), int(day)))
+    for year, month, day in CN_DATE.findall(message):
+        dates.add(safe_date(int(year) if year else today.year, int(month), int(day)))
+    for word, offset in _RELATIVE_DAYS.items():
+        if word in lowered:
+            dates.add((today - timedelta(days=offset)).isoformat())
+
+    dates.discard(None)
+    return dates
+
+
+def _is_relevant(record: Dict[str, Any], lowered_message: str, dates: Set[str]) -> bool:
+    for key, value in record.items():
+        if not isinstance(value, str):
+            continue
+        if key == "date" or key.endswith("_date"):
+            if value in dates:
+                return True
+        elif 1 < len(value) <= _MAX_MATCH_VALUE_LENGTH and value.lower() in lowered_message:
+            return True
+    return False
+
+
+def select_relevant(records: Sequence[Any], message: str, dates: Set[str], limit: int, skip: int = 0) -> List[Any]:
+    """挑出与消息相关的记录：日期命中或字段值出现在消息中，最近的优先"""
+    if not message or limit <= 0:
+        return []
+    lowered = message.lower()
+    relevant = []
+    # 最近的skip条已经在recent里展示，不再重复
+    for index in range(len(records) - skip - 1, -1, -1):
+        record = records[index]
+        if isinstance(record, dict) and _is_relevant(record, lowered, dates):
+            relevant.append(record)
+            if len(relevant) >= limit:
+                break
+    relevant.reverse()
+    return relevant
+
+
+def _render(context: Dict[str, Any]) -> str:
+    return json.dumps(context, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _assemble(
+    data: Dict[str, Any],
+    collections: Sequence[str],
+    message: str,
+    dates: Set[str],
+    aggregates: Optional[Dict[str, Any]],
+    recent: int,
+    relevant_limit: int,
+) -> Dict[str, Any]:
+    # 领域摘要是给健康洞察看的，领域Agent自己的提示词里不重复；写入计数只用于判断数据是否变化
+    summary = {
+        key: value for key, value in data.items()
+        if key not in collections and key not in (SUMMARY_FIELD, REVISION_FIELD)
+    }
+    counts, recent_records, relevant_records = {}, {}, {}
+
+    for key in collections:
+        records = data.get(key) or []
+        counts[key] = len(records)
+        if recent > 0 and records:
+            recent_records[key] = records[-recent:]
+        relevant = select_relevant(records, message, dates, relevant_limit, skip=min(recent, len(records)))
+        if relevant:
+            relevant_records[key] = relevant
+
+    context: Dict[str, Any] = {**summary, "counts": counts, "recent": recent_records}
+    if relevant_records:
+        context["relevant"] = relevant_records
+    if aggregates:
+        context["aggregates"] = aggregates
+    return context
+
+
+def build_prompt_context(
+    data: Optional[Dict[str, Any]],
+    collections: Sequence[str],
+    message: str = "",
+    aggregates: Optional[Dict[str, Any]] = None,
+    recent: int = PROMPT_CONTEXT_RECENT,
+    relevant_limit: int = PROMPT_CONTEXT_RELEVANT,
+    budget: int = PROMPT_CONTEXT_TOKEN_BUDGET,
+) -> str:
+    """
+    生成领域数据的紧凑摘要。
+
+    collections 是会随时间增长的记录列表字段，只展示计数、最近recent条和相关记录；
+    其余字段（洞察、目标、当前周期等体量固定的数据）原样保留。
+    超出预算时依次缩小最近窗口和相关条数，最后截断。
+    """
+    if not data:
+        return "无数据"
+
+    dates = extract_dates(message) if message else set()
+    while True:
+        rendered = _render(_assemble(data, collections, message, dates, aggregates, recent, relevant_limit))
+        if count_tokens(rendered) <= budget:
+            return rendered
+        if recent > 1:
+            recent //= 2
+        elif relevant_limit > 1:
+            relevant_limit //= 2
+        elif recent or relevant_limit:
+            recent, relevant_limit = 0, 0
+        else:
+            break
+
+    # 固定体量的字段本身已超预算，只能按比例截断
+    ratio = budget / max(count_tokens(rendered), 1)
+    return rendered[:int(len(rendered) * ratio)] + "…（已截断）"
+
+
+def get_last_user_message(messages: Sequence[Any]) -> str:
+    """获取最后一条用户消息的文本"""
+    for msg in reversed(messages or []):
+        if getattr(msg, "type", None) == "human" and isinstance(msg.content, str):
+            return msg.content
+    return ""
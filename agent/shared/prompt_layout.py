@@ -0,0 +1,49 @@
+"""
+提示词布局 - 每次调用的提示词开头逐字节不变，命中模型服务端的前缀缓存
+单一职责：固定指令（角色、规则、中文翻译表）放在第一条系统消息，
+领域数据摘要、今日日期等每轮变化的内容放在对话历史之后的最后一条系统消息
+"""
+
+import hashlib
+from datetime import date
+from typing import Any, Dict, List, Sequence
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+# 当前上下文中日期一行的写法
+TODAY_LINE = "今日日期：{}"
+TODAY_LINE_EN = "Today's date: {}"
+
+# 各Agent最近一次使用的固定指令指纹
+_prefixes: Dict[str, str] = {}
+_stats = {"layouts": 0, "prefix_changes": 0}
+
+
+def context_block(*sections: str, today_line: str = TODAY_LINE) -> str:
+    """每轮变化的内容，末尾附上今日日期"""
+    return "\n\n".join([*(section for section in sections if section), today_line.format(date.today().isoformat())])
+
+
+def layout_messages(
+    agent: str,
+    instructions: str,
+    context: str,
+    history: Sequence[BaseMessage],
+) -> List[BaseMessage]:
+    """
+    [固定指令, *对话历史, 当前上下文]。
+
+    固定指令在进程内不应变化；同一Agent的指令指纹变了（误把变化的内容写进了指令）时计入prefix_changes。
+    """
+    digest = hashlib.sha1(instructions.encode("utf-8")).hexdigest()
+    previous = _prefixes.get(agent)
+    if previous is not None and previous != digest:
+        _stats["prefix_changes"] += 1
+    _prefixes[agent] = digest
+    _stats["layouts"] += 1
+    return [SystemMessage(content=instructions), *history, SystemMessage(content=context)]
+
+
+def prompt_layout_stats() -> Dict[str, Any]:
+    """返回提示词布局的统计：调用次数、固定指令变化次数"""
+    return {**_stats, "agents": len(_prefixes)}
@@ -0,0 +1,219 @@
+"""
+快速记录解析 - "头痛7分"、"喝了2000ml水"一类的结构化短消息在本地解析，不调用模型
+单一职责：把消息切分成 关键词/数字/日期 标记，只有整条消息都能被识别时才返回结果；
+各领域Agent据此生成与模型相同结构的工具参数，解析不了的消息仍交给模型
+"""
+
+import os
+import re
+import uuid
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage
+
+from shared.keyword_matcher import KeywordMatcher
+from shared.dates import CN_DATE, ISO_DATE, safe_date
+
+# 是否启用本地快速记录（1开启/0关闭）
+QUICK_LOG_ENABLED = os.getenv("QUICK_LOG_ENABLED", "1") == "1"
+# 识别之外最多允许剩下的字符数：任何没有识别的字都可能改变意思（"头痛3天了"），交给模型
+QUICK_LOG_MAX_REMAINDER = 0
+
+# 记录日期的说法 -> 距今天数
+DAY_WORDS = {
+    "今天": 0, "今日": 0, "今早": 0, "今晚": 0, "早上": 0, "today": 0, "tonight": 0, "this morning": 0,
+    "昨天": 1, "昨晚": 1, "昨夜": 1, "yesterday": 1, "last night": 1,
+    "前天": 2,
+}
+# 不影响记录内容的虚词
+COMMON_FILLERS = (
+    "我", "了", "的", "有", "感觉", "觉得", "记录", "一下", "大概", "左右", "约", "，", "。", "、", "！", "~",
+    "i", "i'm", "im", "had", "have", "feel", "feeling", "felt", "log", "a", "an", "my", "of", "about", "and", "was",
+)
+# 出现这些说法时（提问、否定、求建议、打算、好转）不做本地记录
+BLOCKERS = (
+    "?", "？", "吗", "呢", "么", "为什么", "怎么", "如何", "是不是", "能不能", "可以", "应该", "建议", "想要", "要不要",
+    "不", "没", "没有", "别", "无", "缓解", "办法",
+    "要", "想", "打算", "计划", "准备", "希望", "目标", "争取",
+    "好了", "好多了", "好些", "好转", "减轻", "减少", "消失",
+    "why", "how", "what", "should", "can", "could", "not", "no", "don't", "didn't", "never", "without",
+    "want", "wanna", "plan", "planning", "going to", "will", "need", "goal", "better", "gone",
+)
+
+_ARABIC_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_CN_NUMBER = re.compile(r"[零〇一二两三四五六七八九十百千]+")
+_CN_DIGITS = {"〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000}
+
+_stats = {"hits": 0, "fallbacks": 0}
+
+
+class LogToken(NamedTuple):
+    """消息中识别出的一段：kind为词表分组或 number/date/day/filler/blocker"""
+    start: int
+    end: int
+    kind: str
+    value: Any
+
+
+def parse_cn_number(text: str) -> Optional[int]:
+    """简单的中文数字：七、十二、两千、一千五（=1500）、一千零五"""
+    total, digit, last_unit, after_zero = 0, None, None, False
+    for char in text:
+        if char == "零":
+            after_zero = True
+            continue
+        if char in _CN_DIGITS:
+            if digit is not None:
+                return None
+            digit = _CN_DIGITS[char]
+            continue
+        unit = _CN_UNITS[char]
+        if last_unit is not None and unit >= last_unit:
+            return None
+        total += (1 if digit is None else digit) * unit
+        digit, last_unit, after_zero = None, unit, False
+    if digit is not None:
+        # 口语中省略的末位单位："一千五" = 1500，"两百五" = 250
+        total += digit * (last_unit // 10 if last_unit and last_unit >= 100 and not after_zero else 1)
+    return total
+
+
+def _number(value: float) -> Any:
+    """整数值按int返回，和模型给出的工具参数一致"""
+    return int(value) if value.is_integer() else value
+
+
+def render_aliases(aliases: Mapping[Any, Sequence[str]]) -> str:
+    """把 {枚举值: 中文说法} 对照写成提示词中的 "- 说法1/说法2 → 值" 行"""
+    return "\n".join(f"- {'/'.join(words)} → {getattr(kind, 'value', kind)}" for kind, words in aliases.items())
+
+
+def alias_vocabulary(aliases: Mapping[Any, Sequence[str]]) -> Dict[str, str]:
+    """{说法: 值}，包括中文说法和英文值本身"""
+    vocabulary: Dict[str, str] = {}
+    for kind, words in aliases.items():
+        value = getattr(kind, "value", kind)
+        for word in (*words, value):
+            vocabulary[word] = value
+    return vocabulary
+
+
+class QuickLogParser:
+    """
+    由各领域的词表编译的解析器。
+
+    vocabulary为 {分组: {说法: 值}}；同一说法在不同分组或同一分组中对应不同的值时视为有歧义，
+    消息里出现有歧义的说法时不做本地记录。
+    """
+
+    def __init__(self, vocabulary: Mapping[str, Mapping[str, Any]], fillers: Iterable[str] = ()):
+        values: Dict[str, Dict[str, Any]] = {}
+        ambiguous = set()
+        groups: Dict[str, List[str]] = {}
+        for kind, phrases in vocabulary.items():
+            for phrase, value in phrases.items():
+                phrase = phrase.lower()
+                known = values.setdefault(kind, {})
+                if phrase in known and known[phrase] != value:
+                    ambiguous.add(phrase)
+                known[phrase] = value
+                groups.setdefault(kind, []).append(phrase)
+        values["day"] = dict(DAY_WORDS)
+        groups["day"] = list(DAY_WORDS)
+        groups["filler"] = [*COMMON_FILLERS, *fillers]
+        groups["blocker"] = list(BLOCKERS)
+
+        self._values = values
+        self._ambiguous = ambiguous
+        self._matcher = KeywordMatcher(groups)
+
+    def _candidates(self, text: str) -> List[Tuple[int, int, str, Any]]:
+        candidates = []
+        for hit in self._matcher.iter_matches(text):
+            end = hit.offset + len(hit.keyword)
+            if len(hit.labels) > 1:
+                # 同时是多个分组的说法：虚词和词表重复时以词表为准，其余视为歧义
+                labels = [label for label in hit.labels if label != "filler"]
+                kind = labels[0] if len(labels) == 1 else "ambiguous"
+            else:
+                kind = hit.labels[0]
+            if hit.keyword in self._ambiguous:
+                kind = "ambiguous"
+            candidates.append((hit.offset, end, kind, self._values.get(kind, {}).get(hit.keyword)))
+
+        for pattern in (ISO_DATE, CN_DATE):
+            for match in pattern.finditer(text):
+                year, month, day = match.groups()
+                if year is None:
+                    year = date.today().year
+                candidates.append((match.start(), match.end(), "date", safe_date(int(year), int(month), int(day))))
+        for match in _ARABIC_NUMBER.finditer(text):
+            candidates.append((match.start(), match.end(), "number", _number(float(match.group()))))
+        for match in _CN_NUMBER.finditer(text):
+            number = parse_cn_number(match.group())
+            if number is not None:
+                candidates.append((match.start(), match.end(), "number", number))
+        return candidates
+
+    def parse(self, message: str) -> Optional[List[LogToken]]:
+        """
+        切分消息；有提问/否定、歧义说法或剩下的未识别字符过多时返回None。
+
+        同一位置有多个候选时取最长的，从左到右不重叠地选取。
+        """
+        if not message:
+            return None
+        text = message.lower()
+        selected: List[LogToken] = []
+        position = 0
+        for start, end, kind, value in sorted(self._candidates(text), key=lambda c: (c[0], c[0] - c[1])):
+            if start < position:
+                continue
+            selected.append(LogToken(start, end, kind, value))
+            position = end
+
+        if any(token.kind in ("blocker", "ambiguous") for token in selected):
+            return None
+        covered = [False] * len(text)
+        for token in selected:
+            covered[token.start:token.end] = [True] * (token.end - token.start)
+        remainder = sum(1 for char, done in zip(text, covered) if not done and char.isalnum())
+        if remainder > QUICK_LOG_MAX_REMAINDER:
+            return None
+        return [token for token in selected if token.kind != "filler"]
+
+
+def log_date(tokens: Sequence[LogToken], today: Optional[date] = None) -> Optional[str]:
+    """记录日期：消息中提到的唯一日期，没有提到时为今天；提到多个不同日期时返回None"""
+    today = today or date.today()
+    dates = set()
+    for token in tokens:
+        if token.kind == "day":
+            dates.add((today - timedelta(days=token.value)).isoformat())
+        elif token.kind == "date":
+            if token.value is None:
+                return None
+            dates.add(token.value)
+    if len(dates) > 1:
+        return None
+    return dates.pop() if dates else today.isoformat()
+
+
+def quick_log_response(tool_name: str, arguments: Optional[Dict[str, Any]]) -> Optional[AIMessage]:
+    """把本地解析的结果包装成与模型输出相同的工具调用；arguments为None时返回None"""
+    if arguments is None:
+        _stats["fallbacks"] += 1
+        return None
+    _stats["hits"] += 1
+    return AIMessage(
+        content="",
+        tool_calls=[{"id": f"quick_log_{uuid.uuid4().hex[:12]}", "name": tool_name, "args": arguments}],
+    )
+
+
+def quick_log_stats() -> Dict[str, Any]:
+    """返回本地快速记录的命中统计"""
+    total = _stats["hits"] + _stats["fallbacks"]
+    return {**_stats, "hit_rate": _stats["hits"] / total if total else 0.0}
@@ -0,0 +1,286 @@
+"""
+模型响应缓存 - 重复发送、界面重试、同一问题再问一次时复用上一次的模型输出
+单一职责：按 (Agent, 规范化的最后一条用户消息, 上一条助手回复, 领域数据版本, 工具集, 日期) 缓存模型响应，
+TTL + LRU淘汰，支持进程内存和本地SQLite两种后端；领域数据变化后版本不同，自然不会命中旧响应
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from datetime import date
+from typing import Any, AsyncIterator, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, messages_from_dict, message_to_dict
+
+from shared.streaming import aggregate_chunks
+from shared.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# 缓存后端：memory（进程内）、sqlite（本地文件，多进程/重启后仍可复用）、off（关闭）
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+# SQLite后端的数据库文件
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", ".response_cache.sqlite3")
+# 缓存条数上限和有效期（秒）
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "900"))
+
+# 规范化时去掉的句末标点和语气（问号保留，"头痛"和"头痛？"意图不同）
+_TRAILING = re.compile(r"[\s。．.！!~～…]+$")
+_SPACES = re.compile(r"\s+")
+
+_stats = {"hits": 0, "misses": 0, "bypasses": 0, "evictions": 0, "expirations": 0, "saved_tokens": 0}
+
+
+class CacheScope(NamedTuple):
+    """一次模型调用的缓存范围：哪个Agent，基于哪个版本的领域数据"""
+    agent: str
+    state_version: str
+
+
+class CacheEntry(NamedTuple):
+    payload: str
+    tokens: int
+
+
+def normalize_message(text: str) -> str:
+    """全角转半角、统一大小写和空白、去掉句末标点，"头痛7分。" 和 "头痛7分" 视为同一请求"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _TRAILING.sub("", _SPACES.sub(" ", text).strip())
+
+
+class MemoryBackend:
+    """进程内缓存"""
+
+    def __init__(self, size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, CacheEntry]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.time():
+            del self._entries[key]
+            _stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = (time.time() + self.ttl, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """本地SQLite缓存；按最近使用时间淘汰"""
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # 缓存丢失只会多调用一次模型，不需要每次写入都落盘
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, tokens INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, tokens, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                _stats["expirations"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return CacheEntry(row[0], row[1])
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, payload, tokens, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, entry.payload, entry.tokens, now + self.ttl, now),
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.size
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                _stats["evictions"] += overflow
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+_backend: Any = None
+
+
+def get_backend() -> Optional[Any]:
+    """按配置创建缓存后端（只创建一次）；关闭时返回None"""
+    global _backend
+    if _backend is None and RESPONSE_CACHE_BACKEND != "off":
+        if RESPONSE_CACHE_BACKEND == "sqlite":
+            _backend = SQLiteBackend()
+        elif RESPONSE_CACHE_BACKEND == "memory":
+            _backend = MemoryBackend()
+        else:
+            raise ValueError(f"未知的响应缓存后端: {RESPONSE_CACHE_BACKEND}")
+    return _backend
+
+
+def _request_parts(messages: Sequence[BaseMessage]) -> Optional[Tuple[str, str]]:
+    """(规范化的最后一条用户消息, 它之前最近一条有内容的助手回复)；没有用户消息时返回None"""
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        if message.type == "human" and isinstance(message.content, str):
+            previous = next(
+                (
+                    earlier.content for earlier in reversed(messages[:index])
+                    if earlier.type == "ai" and isinstance(earlier.content, str) and earlier.content
+                ),
+                "",
+            )
+            return normalize_message(message.content), previous
+    return None
+
+
+def response_key(scope: CacheScope, binding: str, messages: Sequence[BaseMessage]) -> Optional[str]:
+    """缓存键；binding为模型+工具集+前端actions的指纹"""
+    parts = _request_parts(messages)
+    if parts is None or not parts[0]:
+        return None
+    payload = json.dumps(
+        [scope.agent, scope.state_version, binding, *parts, date.today().isoformat()],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _cacheable(response: Any) -> bool:
+    """只缓存完整、有效的助手回复"""
+    return (
+        isinstance(response, AIMessage)
+        and not response.invalid_tool_calls
+        and bool(response.content or response.tool_calls)
+    )
+
+
+def _response_tokens(response: AIMessage, messages: Sequence[BaseMessage]) -> int:
+    """一次调用消耗的token：优先用接口返回的用量，没有时按输入输出估算"""
+    usage = response.usage_metadata or {}
+    if usage.get("total_tokens"):
+        return usage["total_tokens"]
+    texts = [message.content for message in (*messages, response) if isinstance(message.content, str)]
+    return sum(map(count_tokens, texts)) + count_tokens(json.dumps(response.tool_calls, ensure_ascii=False))
+
+
+def _restore(payload: str) -> AIMessage:
+    """还原缓存的回复，换上新的消息和工具调用ID，避免与对话中已有的ID重复"""
+    response = messages_from_dict([json.loads(payload)])[0]
+    suffix = uuid.uuid4().hex[:8]
+    tool_calls = [{**call, "id": f"{call['id']}_{suffix}"} for call in response.tool_calls]
+    return response.model_copy(update={"id": None, "tool_calls": tool_calls})
+
+
+class CachedModel:
+    """包装已绑定工具的模型，ainvoke/astream先查缓存；其余属性透传给原模型"""
+
+    def __init__(self, model: Any, binding: str, scope: CacheScope):
+        self._model = model
+        self._binding = binding
+        self._scope = scope
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model, name)
+
+    def _lookup(self, messages: Sequence[BaseMessage]) -> Tuple[Optional[str], Optional[CacheEntry]]:
+        backend = get_backend()
+        key = response_key(self._scope, self._binding, messages) if backend is not None else None
+        if key is None:
+            _stats["bypasses"] += 1
+            return None, None
+        try:
+            entry = backend.get(key)
+        except sqlite3.Error as e:
+            logger.warning("读取响应缓存失败，直接调用模型: %s", e)
+            entry = None
+        if entry is not None:
+            _stats["hits"] += 1
+            _stats["saved_tokens"] += entry.tokens
+        else:
+            _stats["misses"] += 1
+        return key, entry
+
+    def _store(self, key: str, response: Any, messages: Sequence[BaseMessage]) -> None:
+        if not _cacheable(response):
+            return
+        entry = CacheEntry(
+            json.dumps(message_to_dict(response), ensure_ascii=False),
+            _response_tokens(response, messages),
+        )
+        try:
+            get_backend().set(key, entry)
+        except sqlite3.Error as e:
+            logger.warning("写入响应缓存失败: %s", e)
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], config: Any = None, **kwargs: Any) -> Any:
+        key, entry = self._lookup(messages)
+        if entry is not None:
+            return _restore(entry.payload)
+        response = await self._model.ainvoke(messages, config, **kwargs)
+        if key is not None:
+            self._store(key, response, messages)
+        return response
+
+    async def astream(self, messages: Sequence[BaseMessage], config: Any = None, **kwargs: Any) -> AsyncIterator[Any]:
+        """流式调用；命中缓存时只产出一条完整消息，未命中时边转发分片边汇总，结束后写入缓存"""
+        key, entry = self._lookup(messages)
+        if entry is not None:
+            yield _restore(entry.payload)
+            return
+        chunks = []
+        async for chunk in self._model.astream(messages, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        if key is not None and chunks:
+            self._store(key, aggregate_chunks(chunks), messages)
+
+
+def response_cache_stats() -> Dict[str, Any]:
+    """返回响应缓存的命中统计和节省的token数"""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "backend": RESPONSE_CACHE_BACKEND,
+        "size": len(_backend) if _backend is not None else 0,
+        "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+    }
@@ -0,0 +1,146 @@
+"""
+跨领域评分注册表 - 各领域Agent提供自己的评分，综合评分一次算出
+单一职责：从各领域的摘要读取0-100的领域评分，按可配置的权重加权得到综合评分，
+结果按各领域摘要的数据版本缓存，数据没有变化时不重复计算
+"""
+
+import os
+from collections import OrderedDict
+from importlib import import_module
+from typing import Any, Callable, Dict, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from shared.summaries import SUMMARY_PROVIDER_MODULES
+from shared.versioning import combine_versions
+
+# 默认权重；没有数据的领域不参与加权，其余领域的权重按比例放大
+DEFAULT_SCORE_WEIGHTS = {
+    "cycle": 0.2,
+    "symptom": 0.2,
+    "fertility": 0.15,
+    "nutrition": 0.25,
+    "exercise": 0.2,
+    "lifestyle": 0.15,
+}
+# 所有领域都没有数据时的综合评分
+NEUTRAL_SCORE = 50
+
+# 综合评分缓存条数（按各领域数据版本缓存）
+HEALTH_SCORE_CACHE_SIZE = int(os.getenv("HEALTH_SCORE_CACHE_SIZE", "1024"))
+
+
+def parse_weights(raw: str) -> Dict[str, float]:
+    """解析 "cycle=0.3,nutrition=0.2" 形式的权重配置，未配置的领域使用默认权重"""
+    weights = dict(DEFAULT_SCORE_WEIGHTS)
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        domain, _, value = item.partition("=")
+        domain = domain.strip()
+        if domain not in weights:
+            raise ValueError(f"未知的评分领域: {domain}")
+        weights[domain] = float(value)
+    return weights
+
+
+# 各领域权重，可用环境变量覆盖部分领域
+HEALTH_SCORE_WEIGHTS = parse_weights(os.getenv("HEALTH_SCORE_WEIGHTS", ""))
+
+
+class ScoreProvider(NamedTuple):
+    """一个领域的评分：从该领域的摘要算出0-100的分数，没有可评分的数据时为None"""
+    domain: str
+    label: str
+    score: Callable[[Mapping[str, Any]], Optional[float]]
+
+
+def field_score(field: str) -> Callable[[Mapping[str, Any]], Optional[float]]:
+    """直接取摘要中已有的评分字段"""
+    def score(summary: Mapping[str, Any]) -> Optional[float]:
+        value = summary.get(field)
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    return score
+
+
+class HealthScores(NamedTuple):
+    """一次评分的结果：各领域评分（按领域名）、综合评分和对应的数据版本"""
+    overall: int
+    domains: Dict[str, Optional[float]]
+    labels: Dict[str, str]
+    state_version: str
+
+
+_providers: Dict[str, ScoreProvider] = {}
+_scores: "OrderedDict[Tuple[Any, ...], HealthScores]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get_score_provider(state_key: str) -> ScoreProvider:
+    """按状态字段取评分提供者，和摘要提供者定义在同一个领域Agent模块中"""
+    provider = _providers.get(state_key)
+    if provider is None:
+        provider = import_module(SUMMARY_PROVIDER_MODULES[state_key]).SCORE_PROVIDER
+        _providers[state_key] = provider
+    return provider
+
+
+def score_labels(state_keys: Sequence[str] = tuple(SUMMARY_PROVIDER_MODULES)) -> Dict[str, str]:
+    """{领域: 中文名称}，按state_keys的顺序"""
+    return {provider.domain: provider.label for provider in map(get_score_provider, state_keys)}
+
+
+def overall_score(domain_scores: Mapping[str, Optional[float]], weights: Mapping[str, float] = HEALTH_SCORE_WEIGHTS) -> int:
+    """有评分的领域按权重加权平均"""
+    total = weight_sum = 0.0
+    for domain, score in domain_scores.items():
+        weight = weights.get(domain, 0.0)
+        if score is not None and weight > 0:
+            total += score * weight
+            weight_sum += weight
+    return int(total / weight_sum) if weight_sum else NEUTRAL_SCORE
+
+
+def score_summaries(
+    summaries: Mapping[str, Optional[Mapping[str, Any]]],
+    weights: Mapping[str, float] = HEALTH_SCORE_WEIGHTS,
+) -> HealthScores:
+    """
+    由各领域摘要（shared.summaries.domain_summaries 的结果）一次算出全部评分。
+
+    以各摘要的数据版本和权重为键缓存；返回的字典是共享的缓存结果，调用方不要修改。
+    """
+    versions = tuple((state_key, (summary or {}).get("version")) for state_key, summary in summaries.items())
+    key = (versions, tuple(sorted(weights.items())))
+    cached = _scores.get(key)
+    if cached is not None:
+        _stats["hits"] += 1
+        _scores.move_to_end(key)
+        return cached
+
+    _stats["misses"] += 1
+    domains: Dict[str, Optional[float]] = {}
+    labels: Dict[str, str] = {}
+    for state_key, summary in summaries.items():
+        provider = get_score_provider(state_key)
+        domains[provider.domain] = provider.score(summary) if summary is not None else None
+        labels[provider.domain] = provider.label
+    result = HealthScores(
+        overall_score(domains, weights),
+        domains,
+        labels,
+        combine_versions(version for _, version in versions),
+    )
+    _scores[key] = result
+    if len(_scores) > HEALTH_SCORE_CACHE_SIZE:
+        _scores.popitem(last=False)
+        _stats["evictions"] += 1
+    return result
+
+
+def score_cache_stats() -> Dict[str, Any]:
+    """返回评分缓存的命中统计"""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_scores),
+        "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+    }
@@ -0,0 +1,146 @@
+"""
+状态推送 - 代替直接调用copilotkit_emit_state，推送量不随对话历史和推送次数增长
+单一职责：推送前去掉messages（CopilotKit同步状态时会丢弃它，但自定义事件会先把整段对话序列化一遍）；
+按节点执行记住上次推送的各顶层键的JSON文本，与上次完全相同的推送直接跳过；
+去抖窗口内的连续推送先暂存，窗口结束时补发最新的一次，final推送总会立即发出
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from copilotkit.langgraph import copilotkit_emit_state
+from langchain_core.runnables import RunnableConfig
+
+logger = logging.getLogger(__name__)
+
+# 去抖窗口（秒）：距上次推送不到这个时间的非final推送被合并，窗口结束时补发最新状态
+STATE_EMIT_DEBOUNCE = float(os.getenv("STATE_EMIT_DEBOUNCE", "0.05"))
+# 同时记住的节点执行数上限
+STATE_EMIT_SESSIONS = int(os.getenv("STATE_EMIT_SESSIONS", "1024"))
+
+# 不随状态推送的键：消息由CopilotKit在节点结束时单独同步
+EXCLUDED_KEYS = frozenset({"messages"})
+
+_stats = {"requests": 0, "sent": 0, "snapshots": 0, "unchanged": 0, "coalesced": 0, "flushed": 0, "bytes_sent": 0}
+
+
+class _Session:
+    """一次节点执行中已推送的状态（各顶层键的JSON文本）和去抖窗口内暂存的最新推送"""
+
+    __slots__ = ("emitted", "last_sent", "pending", "flush")
+
+    def __init__(self):
+        self.emitted: Dict[str, str] = {}
+        self.last_sent = 0.0
+        self.pending: Optional[Tuple[RunnableConfig, Dict[str, Any], Dict[str, str]]] = None
+        self.flush: Optional[asyncio.Task] = None
+
+
+_sessions: "OrderedDict[Tuple[str, str], _Session]" = OrderedDict()
+
+
+def _session_key(config: RunnableConfig) -> Optional[Tuple[str, str]]:
+    """
+    (会话ID, 节点执行的checkpoint命名空间)。
+
+    命名空间带任务ID，每次运行、每次重试都不同，所以重连后的新运行总是从完整快照开始；
+    拿不到时返回None，每次都完整推送。
+    """
+    configurable = config.get("configurable") or {}
+    namespace = configurable.get("checkpoint_ns") or (config.get("metadata") or {}).get("langgraph_checkpoint_ns")
+    if not namespace:
+        return None
+    return str(configurable.get("thread_id")), namespace
+
+
+def _serialize(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+async def _send(config: RunnableConfig, session: _Session, state: Dict[str, Any], texts: Dict[str, str]) -> None:
+    await copilotkit_emit_state(config, {key: value for key, value in state.items() if key not in EXCLUDED_KEYS})
+    session.emitted = texts
+    session.last_sent = time.monotonic()
+    _stats["sent"] += 1
+    _stats["bytes_sent"] += sum(map(len, texts.values()))
+
+
+async def _flush_later(session: _Session, delay: float) -> None:
+    """去抖窗口结束时补发窗口内最后一次被合并的推送"""
+    await asyncio.sleep(delay)
+    session.flush = None
+    if session.pending is None:
+        return
+    config, state, texts = session.pending
+    session.pending = None
+    try:
+        await _send(config, session, state, texts)
+        _stats["flushed"] += 1
+    except Exception as e:
+        # 预览推送只是展示用，节点已结束等原因推送失败时由final推送兜底
+        logger.debug("补发合并的状态推送失败: %s", e)
+
+
+def _cancel_flush(session: _Session) -> None:
+    session.pending = None
+    if session.flush is not None:
+        session.flush.cancel()
+        session.flush = None
+
+
+async def emit_state(config: RunnableConfig, state: Dict[str, Any], final: bool = False) -> bool:
+    """
+    推送状态（不含messages），返回是否立即推送。
+
+    CopilotKit的状态同步用推送的内容整体替换前端状态，所以每次推送的都是完整快照；
+    各顶层键的JSON文本与上次推送完全相同时跳过。
+    去抖窗口内的推送只暂存最新一次，窗口结束时由后台任务补发，前端最终总能看到最新状态。
+    final用于节点返回前的最后一次推送：不受去抖限制，取消待补发的推送，推送后释放该节点的记录。
+    """
+    _stats["requests"] += 1
+    texts = {key: _serialize(value) for key, value in state.items() if key not in EXCLUDED_KEYS}
+    key = _session_key(config)
+    session = _sessions.get(key) if key is not None else None
+    if session is None:
+        session = _Session()
+        if key is not None:
+            _sessions[key] = session
+            if len(_sessions) > STATE_EMIT_SESSIONS:
+                _cancel_flush(_sessions.popitem(last=False)[1])
+    elif key is not None:
+        _sessions.move_to_end(key)
+
+    try:
+        if texts == session.emitted:
+            # 最新状态与已推送的相同，窗口内暂存的中间状态不必再补发
+            session.pending = None
+            _stats["unchanged"] += 1
+            return False
+        wait = session.last_sent + STATE_EMIT_DEBOUNCE - time.monotonic()
+        if not final and wait > 0:
+            session.pending = (config, state, texts)
+            if session.flush is None:
+                session.flush = asyncio.create_task(_flush_later(session, wait))
+            _stats["coalesced"] += 1
+            return False
+
+        session.pending = None
+        if not session.emitted:
+            _stats["snapshots"] += 1
+        await _send(config, session, state, texts)
+        return True
+    finally:
+        if final:
+            _cancel_flush(session)
+            if key is not None:
+                _sessions.pop(key, None)
+
+
+def state_emitter_stats() -> Dict[str, Any]:
+    """返回状态推送的统计：请求、实际推送、完整快照、跳过/合并/补发次数和推送字节数"""
+    return {**_stats, "sessions": len(_sessions)}
@@ -0,0 +1,178 @@
+"""
+流式响应 - 专门Agent用astream调用模型，回答文本随生成随推送，不必等整段回答和工具参数都生成完
+单一职责：汇总流式分片为完整消息；目标工具的参数JSON尚未生成完时用partialjson增量解析，
+与已有数据合并成状态预览推送给前端（文本分片由CopilotKit从模型流事件中转发）
+"""
+
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+from copilotkit.langgraph import copilotkit_customize_config
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.ai import add_ai_message_chunks
+from langchain_core.messages.utils import message_chunk_to_message
+from langchain_core.runnables import RunnableConfig
+from partialjson.json_parser import JSONParser
+
+from shared.merge import CollectionSpec, merge_collections
+from shared.state_emitter import emit_state
+
+logger = logging.getLogger(__name__)
+
+# 是否流式调用模型（1开启/0关闭，关闭时整段生成后一次返回）
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+# 工具参数生成过程中推送状态预览的最小间隔（秒）
+STREAM_STATE_INTERVAL = float(os.getenv("STREAM_STATE_INTERVAL", "0.1"))
+
+# (当前状态, 目前解析出的工具参数) -> 状态键的预览值
+Preview = Callable[[Dict[str, Any], Dict[str, Any]], Any]
+
+_stats = {"streams": 0, "chunks": 0, "previews": 0, "preview_errors": 0, "first_token_seconds": 0.0}
+
+
+class StreamTarget(NamedTuple):
+    """
+    工具参数流式写入的状态键，含义同CopilotKit的emit_intermediate_state声明。
+
+    preview为None时预览值为已有数据被参数中的非空字段覆盖。
+    """
+    state_key: str
+    tool: str
+    tool_argument: str
+    preview: Optional[Preview] = None
+
+
+def merge_preview(state_key: str, merge_specs: Mapping[str, CollectionSpec]) -> Preview:
+    """按记录列表的合并声明把参数中的新记录并入已有数据，与工具调用完成后的合并结果一致"""
+
+    def preview(state: Dict[str, Any], partial: Dict[str, Any]) -> Dict[str, Any]:
+        existing = state.get(state_key) or {}
+        merged, _ = merge_collections(existing, partial, merge_specs)
+        return {**existing, **merged}
+
+    return preview
+
+
+def _overwrite_preview(state: Dict[str, Any], partial: Dict[str, Any], state_key: str) -> Dict[str, Any]:
+    existing = state.get(state_key) or {}
+    return {**existing, **{key: value for key, value in partial.items() if value is not None}}
+
+
+def _settled(value: Any) -> Any:
+    """去掉各列表中最后一条仍在生成的记录（自然键可能只生成了一半，如 "2026-10-1"）"""
+    if isinstance(value, dict):
+        return {key: _settled(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return value[:-1]
+    return value
+
+
+def customize_config(config: RunnableConfig, target: StreamTarget) -> RunnableConfig:
+    """
+    非流式模式沿用CopilotKit的emit_intermediate_state；流式模式由stream_response推送预览。
+
+    CopilotKit会把原始工具参数直接写进状态键，参数里只有新增记录时前端会短暂只显示这几条，流式模式下不再声明。
+    """
+    if STREAM_RESPONSES:
+        return config
+    return copilotkit_customize_config(
+        config,
+        emit_intermediate_state=[{
+            "state_key": target.state_key,
+            "tool": target.tool,
+            "tool_argument": target.tool_argument,
+        }],
+    )
+
+
+def aggregate_chunks(chunks: Sequence[AIMessageChunk]) -> BaseMessage:
+    """把流式分片合成完整的AIMessage（工具参数在这里一次解析）"""
+    response = add_ai_message_chunks(chunks[0], *chunks[1:]) if len(chunks) > 1 else chunks[0]
+    return message_chunk_to_message(response)
+
+
+async def stream_response(
+    model: Any,
+    messages: Sequence[BaseMessage],
+    config: RunnableConfig,
+    state: Dict[str, Any],
+    target: StreamTarget,
+) -> BaseMessage:
+    """
+    用astream调用模型，返回与ainvoke相同的完整消息。
+
+    目标工具的参数每收到新分片先累积原文，距上次解析超过STREAM_STATE_INTERVAL时才解析，有变化时推送预览；
+    预览只是展示用，解析或合并失败时跳过，工具调用完成后由chat_node推送最终状态。
+    """
+    _stats["streams"] += 1
+    started = time.perf_counter()
+    parser = JSONParser()
+    chunks: List[AIMessageChunk] = []
+    names: Dict[int, str] = {}
+    arguments: Dict[int, str] = {}
+    pending: Optional[int] = None
+    last_emit = 0.0
+    last_value: Any = None
+
+    async for chunk in model.astream(messages, config):
+        if not isinstance(chunk, AIMessageChunk):
+            # 响应缓存命中时直接得到完整消息
+            return chunk
+        if not chunks:
+            _stats["first_token_seconds"] += time.perf_counter() - started
+        chunks.append(chunk)
+
+        for call in chunk.tool_call_chunks:
+            index = call.get("index") or 0
+            if call.get("name"):
+                names[index] = call["name"]
+            if call.get("args"):
+                arguments[index] = arguments.get(index, "") + call["args"]
+                if names.get(index) == target.tool:
+                    pending = index
+
+        now = time.monotonic()
+        if pending is None or now - last_emit < STREAM_STATE_INTERVAL:
+            continue
+        text, pending, last_emit = arguments[pending], None, now
+        try:
+            partial = _settled(parser.parse(text).get(target.tool_argument))
+            if not isinstance(partial, dict) or partial == last_value:
+                continue
+            if target.preview is not None:
+                value = target.preview(state, partial)
+            else:
+                value = _overwrite_preview(state, partial, target.state_key)
+        except Exception as e:
+            _stats["preview_errors"] += 1
+            logger.debug("跳过无法解析的工具参数片段: %s", e)
+            continue
+        last_value = partial
+        _stats["previews"] += 1
+        await emit_state(config, {**state, target.state_key: value})
+
+    _stats["chunks"] += len(chunks)
+    return aggregate_chunks(chunks) if chunks else AIMessage(content="")
+
+
+async def invoke_model(
+    model: Any,
+    messages: Sequence[BaseMessage],
+    config: RunnableConfig,
+    state: Dict[str, Any],
+    target: StreamTarget,
+) -> BaseMessage:
+    """按STREAM_RESPONSES选择流式或一次性调用模型"""
+    if STREAM_RESPONSES:
+        return await stream_response(model, messages, config, state, target)
+    return await model.ainvoke(messages, config)
+
+
+def stream_stats() -> Dict[str, Any]:
+    """返回流式调用的统计：调用次数、分片数、推送的状态预览数、平均首个分片耗时"""
+    return {
+        **_stats,
+        "avg_first_token_seconds": _stats["first_token_seconds"] / _stats["streams"] if _stats["streams"] else 0.0,
+    }
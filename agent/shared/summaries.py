@@ -0,0 +1,110 @@
+"""
+领域摘要 - 各领域Agent写入数据时发布的固定体量摘要，供健康洞察跨领域分析
+单一职责：定义摘要提供者接口（领域数据 -> 评分、趋势、最近几条关键记录），
+给摘要打上数据版本，读取时版本不符就现场重建；摘要大小与历史记录条数无关
+"""
+
+import os
+from importlib import import_module
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from shared.versioning import data_version
+
+# 领域数据中存放摘要的字段
+SUMMARY_FIELD = "summary"
+# 摘要结构变化时加1，旧摘要会被重建
+SUMMARY_SCHEMA_VERSION = 2
+# 每类记录在摘要中保留的最近条数
+SUMMARY_RECENT_EVENTS = int(os.getenv("SUMMARY_RECENT_EVENTS", "3"))
+# 单条事件描述的最大字符数
+_EVENT_MAX_CHARS = 60
+
+# 各领域的摘要提供者：状态字段 -> 定义SUMMARY_PROVIDER的模块（用到时才导入）
+SUMMARY_PROVIDER_MODULES = {
+    "cycle_data": "cycle_tracker_agent.agent",
+    "symptom_mood_data": "symptom_mood_agent.agent",
+    "fertility_data": "fertility_agent.agent",
+    "nutrition_data": "nutrition_agent.agent",
+    "exercise_data": "exercise_agent.agent",
+    "lifestyle_data": "lifestyle_agent.agent",
+}
+
+
+def event(*parts: Any) -> str:
+    """一条关键记录的紧凑描述，例如 "2024-03-01 Cramps 6"，过长时截断"""
+    text = " ".join(str(part) for part in parts if part not in (None, ""))
+    return text if len(text) <= _EVENT_MAX_CHARS else text[:_EVENT_MAX_CHARS - 1] + "…"
+
+
+def recent_events(
+    records: Optional[Sequence[Mapping[str, Any]]],
+    fields: Sequence[str],
+    limit: int = SUMMARY_RECENT_EVENTS,
+) -> List[str]:
+    """最近limit条记录的描述，按时间顺序"""
+    if not records or limit <= 0:
+        return []
+    return [event(*(record.get(field) for field in fields)) for record in records[-limit:]]
+
+
+class SummaryProvider(NamedTuple):
+    """
+    一个领域的摘要提供者。
+
+    build只读取洞察结果和列表末尾的几条记录，返回体量固定的字典；
+    collections和ignored决定数据版本（见 shared.versioning.data_version）。
+    """
+    collections: Tuple[str, ...]
+    build: Callable[[Mapping[str, Any]], Dict[str, Any]]
+    ignored: Tuple[str, ...] = ()
+
+    def version(self, data: Mapping[str, Any]) -> str:
+        return data_version(data, self.collections, (SUMMARY_FIELD, *self.ignored))
+
+    def publish(self, data: Mapping[str, Any]) -> Dict[str, Any]:
+        """生成带版本的摘要，由领域Agent在写入数据时调用"""
+        return {
+            "schema_version": SUMMARY_SCHEMA_VERSION,
+            "version": self.version(data),
+            **self.build(data),
+        }
+
+    def read(self, data: Mapping[str, Any]) -> Dict[str, Any]:
+        """读取已发布的摘要；缺失或与数据版本不符（旧数据、离线重算过洞察）时现场重建"""
+        summary = data.get(SUMMARY_FIELD)
+        if (
+            isinstance(summary, Mapping)
+            and summary.get("schema_version") == SUMMARY_SCHEMA_VERSION
+            and summary.get("version") == self.version(data)
+        ):
+            return dict(summary)
+        return self.publish(data)
+
+
+_providers: Dict[str, SummaryProvider] = {}
+
+
+def get_summary_provider(state_key: str) -> SummaryProvider:
+    """按状态字段取摘要提供者，第一次使用时导入对应的领域Agent模块"""
+    provider = _providers.get(state_key)
+    if provider is None:
+        provider = import_module(SUMMARY_PROVIDER_MODULES[state_key]).SUMMARY_PROVIDER
+        _providers[state_key] = provider
+    return provider
+
+
+def _no_data(data: Optional[Mapping[str, Any]]) -> bool:
+    """没有数据或只有主协调器写入的未初始化占位"""
+    return not data or data == {"initialized": False}
+
+
+def domain_summaries(
+    state: Mapping[str, Any],
+    state_keys: Sequence[str] = tuple(SUMMARY_PROVIDER_MODULES),
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """各领域的摘要；没有数据的领域为None"""
+    summaries: Dict[str, Optional[Dict[str, Any]]] = {}
+    for state_key in state_keys:
+        data = state.get(state_key)
+        summaries[state_key] = None if _no_data(data) else get_summary_provider(state_key).read(data)
+    return summaries
@@ -0,0 +1,71 @@
+"""
+每日记录序列 - 分析函数共用的读取辅助
+单一职责：从 [{date, 数值, 类别, ...}] 形式的记录列表中按类别统计、读取最近几条的数值和类别，
+统一处理字段缺失和非数值取值
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Records = Sequence[Dict[str, Any]]
+
+
+def _numeric(record: Dict[str, Any], field: str, default: Optional[float]) -> Optional[float]:
+    value = record.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return default
+    return value
+
+
+def _category(record: Dict[str, Any], field: str, default: Optional[str]) -> Optional[str]:
+    category = record.get(field)
+    return category if isinstance(category, str) else default
+
+
+def category_stats(
+    data: Optional[Records],
+    value_field: str,
+    category_field: str,
+    default: float = 0,
+) -> Dict[str, Tuple[int, float]]:
+    """按类别统计 (条数, 数值合计)，按类别首次出现的顺序返回"""
+    counts: Dict[str, int] = {}
+    totals: Dict[str, float] = {}
+    for record in data or []:
+        category = record.get(category_field)
+        if type(category) is not str and not isinstance(category, str):
+            continue
+        value = record.get(value_field, default)
+        if type(value) is not int and type(value) is not float:
+            value = _numeric(record, value_field, default)
+        counts[category] = counts.get(category, 0) + 1
+        totals[category] = totals.get(category, 0) + value
+    return {category: (count, totals[category]) for category, count in counts.items()}
+
+
+def tail_values(
+    data: Optional[Records],
+    value_field: str,
+    count: int,
+    default: Optional[float] = None,
+) -> List[Optional[float]]:
+    """最近count条记录的数值"""
+    if count <= 0 or not data:
+        return []
+    return [_numeric(record, value_field, default) for record in data[-count:]]
+
+
+def tail_items(
+    data: Optional[Records],
+    value_field: str,
+    category_field: str,
+    count: int,
+    default_value: Optional[float] = None,
+    default_category: Optional[str] = None,
+) -> List[Tuple[Optional[str], Optional[float]]]:
+    """最近count条记录的 (类别, 数值)"""
+    if count <= 0 or not data:
+        return []
+    return [
+        (_category(record, category_field, default_category), _numeric(record, value_field, default_value))
+        for record in data[-count:]
+    ]
@@ -0,0 +1,58 @@
+"""
+Token计数工具 - 统一估算提示词各部分的token开销
+单一职责：优先使用tiktoken精确计数，离线或缺少编码表时退回到字符级估算
+"""
+
+import math
+from typing import Any, Optional
+
+# gpt-4o系列使用的编码
+DEFAULT_ENCODING = "o200k_base"
+
+_encoding: Any = None
+_encoding_loaded = False
+
+
+def get_encoding() -> Optional[Any]:
+    """加载tiktoken编码，失败时返回None（只尝试一次）"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+        except Exception:
+            # 未安装tiktoken或无法下载编码表
+            _encoding = None
+    return _encoding
+
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF      # 中日韩统一表意文字
+        or 0x3400 <= code <= 0x4DBF   # 扩展A
+        or 0x3000 <= code <= 0x303F   # 中文标点
+        or 0xFF00 <= code <= 0xFFEF   # 全角字符
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """估算token数：中文约每字一个token，其余约每4个字符一个token"""
+    if not text:
+        return 0
+    cjk = sum(1 for char in text if _is_cjk(char))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数"""
+    encoding = get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def is_exact() -> bool:
+    """当前计数是否来自tiktoken"""
+    return get_encoding() is not None
@@ -0,0 +1,110 @@
+"""
+工具Schema缓存 - 工具定义只规范化和序列化一次
+单一职责：缓存每个工具的OpenAI格式定义、紧凑JSON、指纹和token开销，供模型注册表和报表复用
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from shared.tokens import count_tokens, is_exact
+
+
+class ToolSchema(NamedTuple):
+    """已规范化的工具定义"""
+    name: str
+    definition: Dict[str, Any]
+    serialized: str
+    fingerprint: str
+    tokens: int
+
+
+# 以对象id为键，同时保存原对象引用，避免id被回收后复用
+# 工具定义都是模块级常量，约定注册后不再修改
+_schemas: Dict[int, Tuple[Any, ToolSchema]] = {}
+
+
+def serialize_definition(definition: Any) -> str:
+    """紧凑且稳定的JSON序列化"""
+    return json.dumps(definition, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _build_schema(tool: Any) -> ToolSchema:
+    definition = convert_to_openai_tool(tool)
+    function = definition.get("function", {})
+    name = function.get("name") or definition.get("name") or repr(tool)
+    serialized = serialize_definition(definition)
+    return ToolSchema(
+        name=name,
+        definition=definition,
+        serialized=serialized,
+        fingerprint=hashlib.sha1(serialized.encode("utf-8")).hexdigest(),
+        tokens=count_tokens(serialized),
+    )
+
+
+def get_tool_schema(tool: Any) -> ToolSchema:
+    """返回工具的缓存Schema，首次访问时构建"""
+    cached = _schemas.get(id(tool))
+    if cached is not None and cached[0] is tool:
+        return cached[1]
+    schema = _build_schema(tool)
+    _schemas[id(tool)] = (tool, schema)
+    return schema
+
+
+def get_tool_definitions(tools: Sequence[Any]) -> List[Dict[str, Any]]:
+    """返回可直接传给bind_tools的OpenAI格式定义"""
+    return [get_tool_schema(tool).definition for tool in tools]
+
+
+def schema_tokens(tools: Sequence[Any]) -> int:
+    """一组工具定义的token开销"""
+    return sum(get_tool_schema(tool).tokens for tool in tools)
+
+
+def tool_schema_report(tools: Optional[Sequence[Any]] = None) -> List[Dict[str, Any]]:
+    """工具Schema开销报表，默认列出已缓存的全部工具"""
+    if tools is None:
+        schemas = [schema for _, schema in _schemas.values()]
+    else:
+        schemas = [get_tool_schema(tool) for tool in tools]
+    return [
+        {
+            "name": schema.name,
+            "bytes": len(schema.serialized.encode("utf-8")),
+            "tokens": schema.tokens,
+            "fingerprint": schema.fingerprint[:12],
+        }
+        for schema in sorted(schemas, key=lambda s: s.tokens, reverse=True)
+    ]
+
+
+def main():
+    """打印各Agent工具定义的token开销"""
+    from cycle_tracker_agent.agent import CYCLE_TRACKER_TOOL
+    from exercise_agent.agent import EXERCISE_TOOL
+    from fertility_agent.agent import FERTILITY_TOOL
+    from health_insights_agent.agent import HEALTH_INSIGHTS_TOOL
+    from lifestyle_agent.agent import LIFESTYLE_TOOL
+    from main_coordinator.agent import ROUTER_TOOL
+    from menstrual_agent.agent import UPDATE_CYCLE_TOOL
+    from nutrition_agent.agent import NUTRITION_TOOL
+    from recipe_agent.agent import GENERATE_RECIPE_TOOL
+    from symptom_mood_agent.agent import SYMPTOM_MOOD_TOOL
+
+    report = tool_schema_report([
+        UPDATE_CYCLE_TOOL, CYCLE_TRACKER_TOOL, SYMPTOM_MOOD_TOOL, FERTILITY_TOOL,
+        NUTRITION_TOOL, EXERCISE_TOOL, LIFESTYLE_TOOL, HEALTH_INSIGHTS_TOOL,
+        GENERATE_RECIPE_TOOL, ROUTER_TOOL,
+    ])
+    print(f"{'tool':<32}{'bytes':>8}{'tokens':>8}  fingerprint")
+    for row in report:
+        print(f"{row['name']:<32}{row['bytes']:>8}{row['tokens']:>8}  {row['fingerprint']}")
+    print(f"token计数方式: {'tiktoken' if is_exact() else '估算'}")
+
+
+if __name__ == "__main__":
+    main()
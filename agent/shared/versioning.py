@@ -0,0 +1,49 @@
+"""
+领域数据版本 - 不遍历历史记录就能判断一份领域数据是否变化
+单一职责：由体量固定的字段（包括写入计数）、各记录列表的条数和最后一条记录计算短指纹，用来判断派生数据（摘要、评分）是否过期
+"""
+
+import hashlib
+import json
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+# 指纹长度（十六进制字符数）
+VERSION_LENGTH = 16
+# 领域数据中的写入计数：每次合并写入记录（包括改动较早的记录）时加1
+REVISION_FIELD = "revision"
+
+
+def next_revision(data: Optional[Mapping[str, Any]], changed: bool = True) -> int:
+    """本次写入后的写入计数；没有任何记录变化时保持不变"""
+    revision = (data or {}).get(REVISION_FIELD) or 0
+    return revision + 1 if changed else revision
+
+
+def data_version(
+    data: Optional[Mapping[str, Any]],
+    collections: Sequence[str],
+    ignored: Sequence[str] = (),
+) -> str:
+    """
+    领域数据的版本指纹。
+
+    记录列表只取条数和最后一条记录，其余字段（洞察、目标、当前周期、写入计数等）整体参与计算，
+    ignored中的字段（派生数据本身、会随历史增长的辅助字段）不参与。
+    新增记录、修改任意一条记录（合并时递增REVISION_FIELD）或重新计算洞察都会改变版本。
+    """
+    data = data or {}
+    payload = {
+        key: value for key, value in data.items()
+        if key not in collections and key not in ignored
+    }
+    for key in collections:
+        records = data.get(key) or []
+        payload[key] = [len(records), records[-1] if records else None]
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:VERSION_LENGTH]
+
+
+def combine_versions(versions: Iterable[Optional[str]]) -> str:
+    """多个领域的版本合成一个状态版本（没有数据的领域记为-）"""
+    joined = "|".join(version or "-" for version in versions)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()[:VERSION_LENGTH]
@@ -5,7 +5,7 @@
 
 import json
 from enum import Enum
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import date
 
 # LangGraph imports
@@ -15,13 +15,33 @@ from langgraph.types import Command
 
 # CopilotKit imports
 from copilotkit import CopilotKitState
-from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_state
 
 # OpenAI imports
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, ToolMessage
+from langchain_core.messages import ToolMessage
 from copilotkit.langgraph import copilotkit_exit
 
+from shared.history import window_history
+from shared.merge import KEEP_FIRST, LAST_WRITE_WINS, collection, merge_collection_results, summarize
+from shared.model_registry import get_model_with_tools
+from shared.prompt_context import CONTEXT_NOTE, build_prompt_context, get_last_user_message
+from shared.prompt_layout import context_block, layout_messages
+from shared.quick_log import (
+    QUICK_LOG_ENABLED,
+    QuickLogParser,
+    alias_vocabulary,
+    log_date,
+    quick_log_response,
+    render_aliases,
+)
+from shared.response_cache import CacheScope
+from shared.scores import ScoreProvider
+from shared.state_emitter import emit_state
+from shared.streaming import StreamTarget, customize_config, invoke_model, merge_preview
+from shared.summaries import SUMMARY_FIELD, SummaryProvider, recent_events
+from shared.timeseries import Records, category_stats
+from shared.versioning import REVISION_FIELD, next_revision
+from symptom_mood_agent.aggregates import aggregates_current, top_types, type_stats, update_aggregates
+
 class SymptomType(str, Enum):
     """常见月经症状类型"""
     CRAMPS = "Cramps"
@@ -46,6 +66,30 @@ class MoodType(str, Enum):
     TIRED = "Tired"
     EMOTIONAL = "Emotional"
 
+# 中文说法对照：提示词中的中文翻译和本地快速记录共用（"疲倦"两边都有，快速记录遇到时交给模型判断）
+SYMPTOM_ALIASES = {
+    SymptomType.CRAMPS: ("痉挛", "抽筋", "痛经"),
+    SymptomType.HEADACHE: ("头痛",),
+    SymptomType.BLOATING: ("腹胀", "胀气"),
+    SymptomType.BREAST_TENDERNESS: ("乳房胀痛",),
+    SymptomType.BACK_PAIN: ("背痛", "腰痛"),
+    SymptomType.NAUSEA: ("恶心",),
+    SymptomType.ACNE: ("痤疮", "痘痘"),
+    SymptomType.FATIGUE: ("疲劳", "疲倦"),
+    SymptomType.MOOD_SWINGS: ("情绪波动",),
+    SymptomType.FOOD_CRAVINGS: ("食物渴望",),
+}
+MOOD_ALIASES = {
+    MoodType.HAPPY: ("开心", "高兴"),
+    MoodType.SAD: ("悲伤", "难过"),
+    MoodType.ANXIOUS: ("焦虑", "紧张"),
+    MoodType.IRRITABLE: ("易怒", "烦躁"),
+    MoodType.CALM: ("平静", "冷静"),
+    MoodType.ENERGETIC: ("精力充沛", "有活力"),
+    MoodType.TIRED: ("疲倦", "累"),
+    MoodType.EMOTIONAL: ("情绪化",),
+}
+
 SYMPTOM_MOOD_TOOL = {
     "type": "function",
     "function": {
@@ -120,33 +164,42 @@ SYMPTOM_MOOD_TOOL = {
     }
 }
 
+# 会随时间增长的记录列表，提示词中只展示计数、最近和相关条目
+SYMPTOM_MOOD_COLLECTIONS = ("symptoms", "moods", "daily_notes")
+
+# 各记录列表的自然键和冲突策略：同日同类症状/情绪以最新描述为准，备注原文相同才视为重复
+SYMPTOM_MOOD_MERGE_SPECS = {
+    "symptoms": collection("date", "symptom_type", policy=LAST_WRITE_WINS),
+    "moods": collection("date", "mood_type", policy=LAST_WRITE_WINS),
+    "daily_notes": collection("date", "note", policy=KEEP_FIRST),
+}
+
+# 快速记录中的程度说法 -> 1-10分（消息里没有给出分数时使用）
+SEVERITY_WORDS = {
+    "轻微": 3, "有点": 3, "有些": 3, "一点": 3, "比较": 5, "挺": 5, "很": 7, "厉害": 8, "严重": 8, "非常": 8, "特别": 8,
+    "mild": 3, "slight": 3, "moderate": 5, "very": 7, "bad": 7, "severe": 8,
+}
+# 只提到症状/情绪、没有程度时的默认分数
+DEFAULT_QUICK_LOG_SEVERITY = 5
+
+SYMPTOM_MOOD_QUICK_LOG = QuickLogParser(
+    {
+        "symptom": alias_vocabulary(SYMPTOM_ALIASES),
+        "mood": alias_vocabulary(MOOD_ALIASES),
+        "degree": SEVERITY_WORDS,
+        "unit": {"分": "score", "级": "score", "/10": "score", "out of 10": "score"},
+    },
+    fillers=("心情", "情绪", "程度", "强度", "严重程度", "得", "也", "和", "还", "又", "and", "severity", "intensity"),
+)
+
 class SymptomMoodState(CopilotKitState):
     """症状情绪追踪状态"""
     tracking_data: Optional[Dict[str, Any]] = None
 
-def analyze_symptom_patterns(symptoms: List[Dict]) -> Dict[str, Any]:
-    """分析症状模式"""
-    if not symptoms:
-        return {"common_symptoms": [], "severity_analysis": "暂无数据"}
-    
-    # 统计症状频次
-    symptom_counts = {}
-    total_severity = {}
-    
-    for symptom in symptoms:
-        s_type = symptom.get("symptom_type")
-        if s_type:
-            symptom_counts[s_type] = symptom_counts.get(s_type, 0) + 1
-            total_severity[s_type] = total_severity.get(s_type, 0) + symptom.get("severity", 0)
-    
-    # 找出最常见的症状
-    common_symptoms = sorted(symptom_counts.items(), key=lambda x: x[1], reverse=True)[:3]
-    common_list = [symptom[0] for symptom in common_symptoms]
-    
+def _format_symptom_patterns(stats: Dict[str, Tuple[int, float]], common_list: List[str]) -> Dict[str, Any]:
+    """由 {症状: (次数, 严重程度合计)} 和最常见的症状生成分析结果"""
     # 分析严重程度
-    avg_severity = {}
-    for s_type, total in total_severity.items():
-        avg_severity[s_type] = total / symptom_counts[s_type]
+    avg_severity = {s_type: total / count for s_type, (count, total) in stats.items()}
     
     severity_analysis = f"平均症状严重程度: {', '.join([f'{k}: {v:.1f}' for k, v in avg_severity.items()])}"
     
@@ -155,27 +208,158 @@ def analyze_symptom_patterns(symptoms: List[Dict]) -> Dict[str, Any]:
         "severity_analysis": severity_analysis
     }
 
-def analyze_mood_trends(moods: List[Dict]) -> str:
+def _format_mood_trends(stats: Dict[str, Tuple[int, float]], dominant_mood: str) -> str:
+    """由 {情绪: (次数, 强度合计)} 和主要情绪生成趋势描述"""
+    # 计算平均强度
+    avg_intensity = {m_type: total / count for m_type, (count, total) in stats.items()}
+    
+    return f"主要情绪: {dominant_mood}, 平均情绪强度: {', '.join([f'{k}: {v:.1f}' for k, v in avg_intensity.items()])}"
+
+def analyze_symptom_patterns(symptoms: Records) -> Dict[str, Any]:
+    """分析症状模式"""
+    if not symptoms:
+        return {"common_symptoms": [], "severity_analysis": "暂无数据"}
+    
+    # 统计症状频次和严重程度（按症状首次出现的顺序）
+    stats = {
+        s_type: counted
+        for s_type, counted in category_stats(symptoms, "severity", "symptom_type", 0).items()
+        if s_type
+    }
+    
+    # 找出最常见的症状
+    common_symptoms = sorted(stats.items(), key=lambda x: x[1][0], reverse=True)[:3]
+    return _format_symptom_patterns(stats, [symptom[0] for symptom in common_symptoms])
+
+def analyze_mood_trends(moods: Records) -> str:
     """分析情绪趋势"""
     if not moods:
         return "暂无情绪数据"
     
-    mood_counts = {}
-    total_intensity = {}
-    
-    for mood in moods:
-        m_type = mood.get("mood_type")
-        if m_type:
-            mood_counts[m_type] = mood_counts.get(m_type, 0) + 1
-            total_intensity[m_type] = total_intensity.get(m_type, 0) + mood.get("intensity", 0)
+    stats = {
+        m_type: counted
+        for m_type, counted in category_stats(moods, "intensity", "mood_type", 0).items()
+        if m_type
+    }
     
-    # 计算平均强度
-    avg_intensity = {}
-    for m_type, total in total_intensity.items():
-        avg_intensity[m_type] = total / mood_counts[m_type]
+    dominant_mood = max(stats.items(), key=lambda x: x[1][0])[0]
+    return _format_mood_trends(stats, dominant_mood)
+
+def build_symptom_mood_patterns(tracking_data: Dict) -> Dict[str, Any]:
+    """根据症状和情绪记录重新分析模式；有对应当前记录的累计统计时直接读取，否则逐条统计"""
+    aggregates = tracking_data.get("aggregates")
+    if not aggregates_current(aggregates, tracking_data):
+        symptom_patterns = analyze_symptom_patterns(tracking_data.get("symptoms") or [])
+        mood_trends = analyze_mood_trends(tracking_data.get("moods") or [])
+    else:
+        symptoms, moods = aggregates["symptoms"], aggregates["moods"]
+        if symptoms["records"]:
+            symptom_patterns = _format_symptom_patterns(type_stats(symptoms), top_types(symptoms, 3))
+        else:
+            symptom_patterns = analyze_symptom_patterns([])
+        if moods["top"]:
+            mood_trends = _format_mood_trends(type_stats(moods), top_types(moods, 1)[0])
+        else:
+            # 没有记录或记录都没有情绪类型，与逐条统计的结果保持一致
+            mood_trends = analyze_mood_trends(tracking_data.get("moods") or [])
     
-    dominant_mood = max(mood_counts.items(), key=lambda x: x[1])[0]
-    return f"主要情绪: {dominant_mood}, 平均情绪强度: {', '.join([f'{k}: {v:.1f}' for k, v in avg_intensity.items()])}"
+    return {
+        "common_symptoms": symptom_patterns["common_symptoms"],
+        "mood_trends": mood_trends,
+        "severity_analysis": symptom_patterns["severity_analysis"]
+    }
+
+def average_symptom_severity(tracking_data: Dict) -> Optional[float]:
+    """全部症状记录的平均严重程度，没有症状记录时为None"""
+    aggregates = tracking_data.get("aggregates")
+    if aggregates_current(aggregates, tracking_data):
+        stats = type_stats(aggregates["symptoms"]).values()
+    else:
+        stats = [
+            counted
+            for s_type, counted in category_stats(tracking_data.get("symptoms") or [], "severity", "symptom_type", 0).items()
+            if s_type
+        ]
+    count = sum(counted for counted, _ in stats)
+    return round(sum(total for _, total in stats) / count, 2) if count else None
+
+def score_symptom_summary(summary: Dict[str, Any]) -> Optional[float]:
+    """症状评分：平均严重程度越高分数越低（1分对应92分，10分对应20分）"""
+    severity = summary.get("average_severity")
+    return round(100 - severity * 8) if severity is not None else None
+
+def build_symptom_mood_summary(tracking_data: Dict) -> Dict[str, Any]:
+    """症状情绪摘要：常见症状、情绪趋势、严重程度和最近几条症状与情绪"""
+    patterns = tracking_data.get("patterns") or {}
+    return {
+        "common_symptoms": patterns.get("common_symptoms", []),
+        "mood_trends": patterns.get("mood_trends"),
+        "severity_analysis": patterns.get("severity_analysis"),
+        "average_severity": average_symptom_severity(tracking_data),
+        "counts": {name: len(tracking_data.get(name) or []) for name in SYMPTOM_MOOD_COLLECTIONS},
+        "recent_symptoms": recent_events(tracking_data.get("symptoms"), ("date", "symptom_type", "severity")),
+        "recent_moods": recent_events(tracking_data.get("moods"), ("date", "mood_type", "intensity")),
+    }
+
+# 供健康洞察读取的症状情绪摘要；累计统计由记录决定，不参与版本计算
+SUMMARY_PROVIDER = SummaryProvider(SYMPTOM_MOOD_COLLECTIONS, build_symptom_mood_summary, ignored=("aggregates",))
+SCORE_PROVIDER = ScoreProvider("symptom", "症状管理", score_symptom_summary)
+
+# 生成中的症状/情绪记录按合并规则并入已有数据后推送给前端
+SYMPTOM_MOOD_STREAM = StreamTarget(
+    "tracking_data",
+    "update_symptom_mood_data",
+    "tracking_data",
+    merge_preview("tracking_data", SYMPTOM_MOOD_MERGE_SPECS),
+)
+
+# 固定指令：每次调用逐字节相同，数据和日期放在对话末尾的当前上下文中
+SYMPTOM_MOOD_INSTRUCTIONS = f"""你是专业的症状情绪追踪助手，专门负责记录和分析身体症状与情绪状态。
+
+你的核心功能：
+1. 🩹 记录身体症状（痉挛、头痛、腹胀等）
+2. 😊 跟踪情绪状态（开心、焦虑、疲倦等）
+3. 📝 记录每日观察和备注
+4. 📊 分析症状和情绪模式
+5. 🔍 识别触发因素和趋势
+
+症状类型：Cramps(痉挛), Headache(头痛), Bloating(腹胀), Breast Tenderness(乳房胀痛), Back Pain(背痛), Nausea(恶心), Acne(痤疮), Fatigue(疲劳), Mood Swings(情绪波动), Food Cravings(食物渴望)
+
+情绪类型：Happy(开心), Sad(悲伤), Anxious(焦虑), Irritable(易怒), Calm(平静), Energetic(精力充沛), Tired(疲倦), Emotional(情绪化)
+
+中文翻译：
+症状：
+{render_aliases(SYMPTOM_ALIASES)}
+
+情绪：
+{render_aliases(MOOD_ALIASES)}
+
+重要指导原则：
+- 专注于症状和情绪记录，不涉及经期、运动、营养等其他方面
+- 支持中英文输入，准确理解用户描述
+- 当用户提供症状或情绪信息时，必须调用update_symptom_mood_data工具
+- 使用1-10的严重程度/强度评分系统
+- 日期格式使用YYYY-MM-DD
+- 今日日期见对话末尾的当前数据
+
+使用示例：
+用户说："今天头痛得厉害，程度8分" → 记录今日Headache症状，严重程度8
+用户说："心情很焦虑，强度7分" → 记录今日Anxious情绪，强度7
+"""
+
+def build_symptom_mood_context(state: Dict[str, Any]) -> str:
+    """症状情绪追踪提示词中每轮变化的部分：当前数据摘要和今日日期"""
+    try:
+        # 累计统计只供模式分析使用，不放进提示词
+        tracking_json = build_prompt_context(
+            {key: value for key, value in state["tracking_data"].items() if key != "aggregates"},
+            SYMPTOM_MOOD_COLLECTIONS,
+            get_last_user_message(state.get("messages", [])),
+        )
+    except Exception as e:
+        tracking_json = f"数据序列化错误: {str(e)}"
+
+    return context_block(f"当前追踪数据: {tracking_json}\n{CONTEXT_NOTE}")
 
 async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     """症状情绪追踪流程入口点"""
@@ -191,7 +375,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
                 "severity_analysis": "暂无数据"
             }
         }
-        await copilotkit_emit_state(config, state)
+        await emit_state(config, state, final=True)
     
     return Command(
         goto="chat_node",
@@ -216,88 +400,33 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             }
         }
 
-    try:
-        tracking_json = json.dumps(state["tracking_data"], indent=2)
-    except Exception as e:
-        tracking_json = f"数据序列化错误: {str(e)}"
-    
-    system_prompt = f"""你是专业的症状情绪追踪助手，专门负责记录和分析身体症状与情绪状态。
-
-当前追踪数据: {tracking_json}
-
-你的核心功能：
-1. 🩹 记录身体症状（痉挛、头痛、腹胀等）
-2. 😊 跟踪情绪状态（开心、焦虑、疲倦等）
-3. 📝 记录每日观察和备注
-4. 📊 分析症状和情绪模式
-5. 🔍 识别触发因素和趋势
-
-症状类型：Cramps(痉挛), Headache(头痛), Bloating(腹胀), Breast Tenderness(乳房胀痛), Back Pain(背痛), Nausea(恶心), Acne(痤疮), Fatigue(疲劳), Mood Swings(情绪波动), Food Cravings(食物渴望)
-
-情绪类型：Happy(开心), Sad(悲伤), Anxious(焦虑), Irritable(易怒), Calm(平静), Energetic(精力充沛), Tired(疲倦), Emotional(情绪化)
-
-中文翻译：
-症状：
-- 痉挛/抽筋/痛经 → Cramps
-- 头痛 → Headache
-- 腹胀/胀气 → Bloating
-- 乳房胀痛 → Breast Tenderness
-- 背痛/腰痛 → Back Pain
-- 恶心 → Nausea
-- 痤疮/痘痘 → Acne
-- 疲劳/疲倦 → Fatigue
-- 情绪波动 → Mood Swings
-- 食物渴望 → Food Cravings
-
-情绪：
-- 开心/高兴 → Happy
-- 悲伤/难过 → Sad
-- 焦虑/紧张 → Anxious
-- 易怒/烦躁 → Irritable
-- 平静/冷静 → Calm
-- 精力充沛/有活力 → Energetic
-- 疲倦/累 → Tired
-- 情绪化 → Emotional
-
-重要指导原则：
-- 专注于症状和情绪记录，不涉及经期、运动、营养等其他方面
-- 支持中英文输入，准确理解用户描述
-- 当用户提供症状或情绪信息时，必须调用update_symptom_mood_data工具
-- 使用1-10的严重程度/强度评分系统
-- 日期格式使用YYYY-MM-DD
-- 今日日期：{date.today().isoformat()}
-
-使用示例：
-用户说："今天头痛得厉害，程度8分" → 记录今日Headache症状，严重程度8
-用户说："心情很焦虑，强度7分" → 记录今日Anxious情绪，强度7
-"""
-
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
     if config is None:
         config = RunnableConfig(recursion_limit=25)
     
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "tracking_data",
-            "tool": "update_symptom_mood_data",
-            "tool_argument": "tracking_data"
-        }],
-    )
+    config = customize_config(config, SYMPTOM_MOOD_STREAM)
 
-    model_with_tools = model.bind_tools(
-        [
-            *state.get("copilotkit", {}).get("actions", []),
-            SYMPTOM_MOOD_TOOL
-        ],
-        parallel_tool_calls=False,
-    )
+    # 结构化的快速记录在本地解析成同样的工具调用，不调用模型
+    response = None
+    if QUICK_LOG_ENABLED:
+        response = quick_log_response(
+            "update_symptom_mood_data",
+            extract_symptom_mood_log(get_last_user_message(state.get("messages", []))),
+        )
+
+    if response is None:
+        model_with_tools = get_model_with_tools(
+            [SYMPTOM_MOOD_TOOL],
+            actions=state.get("copilotkit", {}).get("actions", []),
+            response_cache=CacheScope("symptom_mood", SUMMARY_PROVIDER.version(state["tracking_data"])),
+            parallel_tool_calls=False,
+        )
 
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state.get("messages", []),
-    ], config)
+        response = await invoke_model(model_with_tools, layout_messages(
+            "symptom_mood",
+            SYMPTOM_MOOD_INSTRUCTIONS,
+            build_symptom_mood_context(state),
+            window_history(state.get("messages", []), config),
+        ), config, state, SYMPTOM_MOOD_STREAM)
 
     messages = state.get("messages", []) + [response]
     
@@ -317,67 +446,29 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             new_tracking_data = tool_call_args["tracking_data"]
             existing_data = state.get("tracking_data", {})
             
-            # 更新追踪数据
+            # 按自然键合并记录，并把新增/更新的记录计入累计统计
+            merge_results = merge_collection_results(existing_data, new_tracking_data, SYMPTOM_MOOD_MERGE_SPECS)
+            merge_summary = summarize(merge_results)
             tracking_data = {
-                "symptoms": existing_data.get("symptoms", []).copy(),
-                "moods": existing_data.get("moods", []).copy(),
-                "daily_notes": existing_data.get("daily_notes", []).copy(),
-                "patterns": existing_data.get("patterns", {})
+                **{name: result.records for name, result in merge_results.items()},
+                "patterns": existing_data.get("patterns", {}),
+                "aggregates": update_aggregates(existing_data, merge_results),
+                REVISION_FIELD: next_revision(existing_data, merge_summary.changed)
             }
             
-            # 添加新症状（去重）
-            if "symptoms" in new_tracking_data:
-                for new_symptom in new_tracking_data["symptoms"]:
-                    # 简单去重：同日期同症状类型
-                    is_duplicate = any(
-                        s.get("date") == new_symptom.get("date") and 
-                        s.get("symptom_type") == new_symptom.get("symptom_type")
-                        for s in tracking_data["symptoms"]
-                    )
-                    if not is_duplicate:
-                        tracking_data["symptoms"].append(new_symptom)
-            
-            # 添加新情绪（去重）
-            if "moods" in new_tracking_data:
-                for new_mood in new_tracking_data["moods"]:
-                    is_duplicate = any(
-                        m.get("date") == new_mood.get("date") and 
-                        m.get("mood_type") == new_mood.get("mood_type")
-                        for m in tracking_data["moods"]
-                    )
-                    if not is_duplicate:
-                        tracking_data["moods"].append(new_mood)
-            
-            # 添加新的每日备注
-            if "daily_notes" in new_tracking_data:
-                for new_note in new_tracking_data["daily_notes"]:
-                    is_duplicate = any(
-                        n.get("date") == new_note.get("date") and 
-                        n.get("note") == new_note.get("note")
-                        for n in tracking_data["daily_notes"]
-                    )
-                    if not is_duplicate:
-                        tracking_data["daily_notes"].append(new_note)
-            
             # 重新分析模式
-            symptom_patterns = analyze_symptom_patterns(tracking_data["symptoms"])
-            mood_trends = analyze_mood_trends(tracking_data["moods"])
-            
-            tracking_data["patterns"] = {
-                "common_symptoms": symptom_patterns["common_symptoms"],
-                "mood_trends": mood_trends,
-                "severity_analysis": symptom_patterns["severity_analysis"]
-            }
+            tracking_data["patterns"] = build_symptom_mood_patterns(tracking_data)
+            tracking_data[SUMMARY_FIELD] = SUMMARY_PROVIDER.publish(tracking_data)
         
             tool_response = ToolMessage(
-                content="症状情绪数据更新成功",
+                content=f"症状情绪数据更新成功（{merge_summary.describe()}）",
                 tool_call_id=tool_call_id
             )
             
             messages = messages + [tool_response]
             
             updated_state = {**state, "tracking_data": tracking_data, "messages": messages}
-            await copilotkit_emit_state(config, updated_state)
+            await emit_state(config, updated_state, final=True)
             
             return Command(
                 goto=END,
@@ -396,6 +487,56 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
         }
     )
 
+def extract_symptom_mood_log(message: str, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    "头痛7分"、"今天很焦虑"、"headache 6/10" 一类的快速记录解析成update_symptom_mood_data的参数。
+
+    分数写在症状/情绪之后，带分数单位或单独出现，程度说法就近归属；同一消息重复提到同一类型、
+    分数超出1-10或有无法归属的数字时返回None，交给模型处理。
+    """
+    tokens = SYMPTOM_MOOD_QUICK_LOG.parse(message)
+    record_date = log_date(tokens, today) if tokens else None
+    if record_date is None:
+        return None
+
+    items: List[Dict[str, Any]] = []
+    pending_degree = None
+    for index, token in enumerate(tokens):
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if token.kind in ("symptom", "mood"):
+            if any(item["kind"] == token.kind and item["type"] == token.value for item in items):
+                return None
+            items.append({"kind": token.kind, "type": token.value, "score": None, "degree": pending_degree})
+            pending_degree = None
+        elif token.kind == "number":
+            # 数字只有带分数单位（"7分"、"6/10"）或单独写在症状/情绪之后时才是分数，"3天"、"2次"不是
+            standalone = following is None or following.kind in ("unit", "symptom", "mood", "day", "date")
+            if not items or items[-1]["score"] is not None or not standalone or not 1 <= token.value <= 10:
+                return None
+            items[-1]["score"] = token.value
+        elif token.kind == "unit":
+            if index == 0 or tokens[index - 1].kind != "number":
+                return None
+        elif token.kind == "degree":
+            # 紧挨着症状/情绪之前的程度说法属于后者（"很焦虑"），否则属于前一个（"头痛得厉害"）
+            if following is not None and following.kind in ("symptom", "mood"):
+                pending_degree = max(pending_degree or 0, token.value)
+            elif items:
+                items[-1]["degree"] = max(items[-1]["degree"] or 0, token.value)
+            else:
+                return None
+    if not items or pending_degree is not None:
+        return None
+
+    tracking_data: Dict[str, List[Dict[str, Any]]] = {"symptoms": [], "moods": []}
+    for item in items:
+        score = item["score"] or item["degree"] or DEFAULT_QUICK_LOG_SEVERITY
+        if item["kind"] == "symptom":
+            tracking_data["symptoms"].append({"date": record_date, "symptom_type": item["type"], "severity": score})
+        else:
+            tracking_data["moods"].append({"date": record_date, "mood_type": item["type"], "intensity": score})
+    return {"tracking_data": {name: records for name, records in tracking_data.items() if records}}
+
 # 定义图形
 workflow = StateGraph(SymptomMoodState)
 
@@ -0,0 +1,250 @@
+"""
+症状情绪累计统计 - 合并记录时增量维护每种症状/情绪的统计
+单一职责：保存每种类型的 条数/合计/最小/最大/最近日期 和前TOP_K名的小顶堆，
+新增记录O(1)更新，模式分析直接读取，结果与逐条重新统计完全一致
+"""
+
+import heapq
+from itertools import islice
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from shared.merge import MergeResult
+
+# 统计结构变化时加1，旧版本的统计会被整体重建
+AGGREGATES_SCHEMA_VERSION = 1
+# 堆中保留的类型数（常见症状取前3，主要情绪取第1）
+TOP_K = 3
+
+# 各记录列表的 (类型字段, 数值字段)
+AGGREGATE_FIELDS = {
+    "symptoms": ("symptom_type", "severity"),
+    "moods": ("mood_type", "intensity"),
+}
+
+# 合计在此范围内且全是整数时，更新记录可以直接做减法，不会有舍入误差
+_EXACT_LIMIT = 2 ** 53
+
+
+def _type_of(record: Dict[str, Any], type_field: str) -> Optional[str]:
+    record_type = record.get(type_field)
+    return record_type if isinstance(record_type, str) and record_type else None
+
+
+def _value_of(record: Dict[str, Any], value_field: str) -> float:
+    value = record.get(value_field, 0)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    return value
+
+
+def _integral(value: float) -> bool:
+    return isinstance(value, int) or value.is_integer()
+
+
+def _tail(records: Sequence[Dict[str, Any]], type_field: str) -> Optional[List[Any]]:
+    """最后一条记录的 [日期, 类型]，和条数一起用来O(1)判断统计是否对应当前记录"""
+    if not records:
+        return None
+    return [records[-1].get("date"), records[-1].get(type_field)]
+
+
+def _empty_kind() -> Dict[str, Any]:
+    return {"records": 0, "tail": None, "next_order": 0, "types": {}, "top": []}
+
+
+def _add(kind: Dict[str, Any], record_type: str, value: float, record_date: Any) -> Dict[str, Any]:
+    """把一条记录计入统计，返回该类型的统计"""
+    stats = kind["types"].get(record_type)
+    if stats is None:
+        stats = {
+            "count": 0, "sum": 0, "min": value, "max": value,
+            "last_seen": None, "order": kind["next_order"], "exact": True,
+        }
+        kind["types"][record_type] = stats
+        kind["next_order"] += 1
+    stats["count"] += 1
+    # 与逐条统计相同的顺序累加，浮点合计逐位一致
+    stats["sum"] += value
+    if value < stats["min"]:
+        stats["min"] = value
+    if value > stats["max"]:
+        stats["max"] = value
+    if stats["exact"] and not (_integral(value) and abs(stats["sum"]) < _EXACT_LIMIT):
+        stats["exact"] = False
+    if isinstance(record_date, str) and (stats["last_seen"] is None or record_date > stats["last_seen"]):
+        stats["last_seen"] = record_date
+    return stats
+
+
+def _push_top(kind: Dict[str, Any], record_type: str, stats: Dict[str, Any]) -> None:
+    """
+    维护前TOP_K名的小顶堆，项为 [条数, -首次出现序号, 类型]。
+
+    条数只增不减，堆外类型只有自己的条数增加时才可能超过堆顶，所以每次只需比较一次。
+    """
+    top = kind["top"]
+    for entry in top:
+        if entry[2] == record_type:
+            entry[0] = stats["count"]
+            heapq.heapify(top)
+            return
+    entry = [stats["count"], -stats["order"], record_type]
+    if len(top) < TOP_K:
+        heapq.heappush(top, entry)
+    elif entry > top[0]:
+        heapq.heapreplace(top, entry)
+
+
+def _rescan(
+    kind: Dict[str, Any],
+    records: Sequence[Dict[str, Any]],
+    count: int,
+    type_field: str,
+    value_field: str,
+    record_type: str,
+) -> None:
+    """按记录顺序重新计算一种类型在前count条记录中的合计和最值（更新了浮点数值或最值记录时使用）"""
+    stats = kind["types"][record_type]
+    total, exact = 0, True
+    low = high = None
+    for record in islice(records, count):
+        if _type_of(record, type_field) != record_type:
+            continue
+        value = _value_of(record, value_field)
+        total += value
+        low = value if low is None or value < low else low
+        high = value if high is None or value > high else high
+        exact = exact and _integral(value) and abs(total) < _EXACT_LIMIT
+    stats.update({"sum": total, "min": low, "max": high, "exact": exact})
+
+
+def _update(
+    kind: Dict[str, Any],
+    type_field: str,
+    value_field: str,
+    old: Dict[str, Any],
+    new: Dict[str, Any],
+    rescan: Set[str],
+) -> bool:
+    """
+    把一条记录从old改为new。条数和顺序不变；整数合计直接加减，
+    其余情况把类型加入rescan，由调用方在所有更新之后重新扫描。
+
+    类型发生变化时返回False，由调用方整体重建。
+    """
+    record_type = _type_of(new, type_field)
+    if record_type != _type_of(old, type_field):
+        return False
+    if record_type is None or record_type in rescan:
+        return True
+
+    old_value, new_value = _value_of(old, value_field), _value_of(new, value_field)
+    if old_value == new_value:
+        return True
+
+    stats = kind["types"][record_type]
+    total = stats["sum"] - old_value + new_value
+    leaves_extreme = (old_value == stats["min"] and new_value > old_value) or (
+        old_value == stats["max"] and new_value < old_value
+    )
+    if not stats["exact"] or not _integral(new_value) or abs(total) >= _EXACT_LIMIT or leaves_extreme:
+        rescan.add(record_type)
+        return True
+
+    stats["sum"] = total
+    stats["min"] = min(stats["min"], new_value)
+    stats["max"] = max(stats["max"], new_value)
+    return True
+
+
+def _build_kind(records: Sequence[Dict[str, Any]], type_field: str, value_field: str) -> Dict[str, Any]:
+    kind = _empty_kind()
+    for record in records:
+        record_type = _type_of(record, type_field)
+        if record_type is not None:
+            _add(kind, record_type, _value_of(record, value_field), record.get("date"))
+    kind["records"] = len(records)
+    kind["tail"] = _tail(records, type_field)
+    kind["top"] = heapq.nlargest(
+        TOP_K,
+        ([stats["count"], -stats["order"], record_type] for record_type, stats in kind["types"].items()),
+    )
+    heapq.heapify(kind["top"])
+    return kind
+
+
+def build_aggregates(tracking_data: Mapping[str, Any]) -> Dict[str, Any]:
+    """由全部记录重建统计"""
+    aggregates: Dict[str, Any] = {"schema_version": AGGREGATES_SCHEMA_VERSION}
+    for name, (type_field, value_field) in AGGREGATE_FIELDS.items():
+        aggregates[name] = _build_kind(tracking_data.get(name) or [], type_field, value_field)
+    return aggregates
+
+
+def aggregates_current(aggregates: Optional[Mapping[str, Any]], tracking_data: Mapping[str, Any]) -> bool:
+    """统计是否为当前版本且与记录列表对应（只比较条数和最后一条记录）"""
+    if not isinstance(aggregates, Mapping) or aggregates.get("schema_version") != AGGREGATES_SCHEMA_VERSION:
+        return False
+    for name, (type_field, _) in AGGREGATE_FIELDS.items():
+        kind = aggregates.get(name)
+        records = tracking_data.get(name) or []
+        if not isinstance(kind, Mapping) or kind.get("records") != len(records) or kind.get("tail") != _tail(records, type_field):
+            return False
+    return True
+
+
+def _copy_kind(kind: Mapping[str, Any]) -> Dict[str, Any]:
+    return {
+        **kind,
+        "types": {record_type: dict(stats) for record_type, stats in kind["types"].items()},
+        "top": [list(entry) for entry in kind["top"]],
+    }
+
+
+def update_aggregates(existing_data: Mapping[str, Any], results: Mapping[str, MergeResult]) -> Dict[str, Any]:
+    """
+    按合并结果更新统计，返回新的统计（不修改已有统计）。
+
+    新增记录每条O(1)；已有统计缺失、版本不符或与合并前的记录对不上时整体重建。
+    """
+    merged = {name: result.records for name, result in results.items()}
+    previous = existing_data.get("aggregates")
+    if not aggregates_current(previous, existing_data):
+        return build_aggregates(merged)
+
+    aggregates: Dict[str, Any] = {"schema_version": AGGREGATES_SCHEMA_VERSION}
+    for name, (type_field, value_field) in AGGREGATE_FIELDS.items():
+        result = results.get(name)
+        if result is None or not (result.inserted_records or result.updated_records):
+            aggregates[name] = previous[name]
+            continue
+
+        kind = _copy_kind(previous[name])
+        rescan: Set[str] = set()
+        for old, new in result.updated_records:
+            if not _update(kind, type_field, value_field, old, new, rescan):
+                return build_aggregates(merged)
+        # 重新扫描时只看合并前已有的记录（已是更新后的值），新增记录随后再计入
+        existing_count = len(result.records) - len(result.inserted_records)
+        for record_type in rescan:
+            _rescan(kind, result.records, existing_count, type_field, value_field, record_type)
+        for record in result.inserted_records:
+            record_type = _type_of(record, type_field)
+            if record_type is not None:
+                stats = _add(kind, record_type, _value_of(record, value_field), record.get("date"))
+                _push_top(kind, record_type, stats)
+        kind["records"] = len(result.records)
+        kind["tail"] = _tail(result.records, type_field)
+        aggregates[name] = kind
+    return aggregates
+
+
+def type_stats(kind: Mapping[str, Any]) -> Dict[str, Tuple[int, float]]:
+    """{类型: (条数, 合计)}，按类型首次出现的顺序"""
+    ordered = sorted(kind["types"].items(), key=lambda item: item[1]["order"])
+    return {record_type: (stats["count"], stats["sum"]) for record_type, stats in ordered}
+
+
+def top_types(kind: Mapping[str, Any], count: int = TOP_K) -> List[str]:
+    """条数最多的count种类型，条数相同时先出现的在前"""
+    return [entry[2] for entry in sorted(kind["top"], reverse=True)[:count]]
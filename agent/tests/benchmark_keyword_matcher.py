@@ -0,0 +1,56 @@
+"""
+关键词匹配微基准 - 对比原先逐个 `kw in message` 的路由分类和 KeywordMatcher
+用法：python tests/benchmark_keyword_matcher.py（在 agent/ 目录下运行）
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main_coordinator.agent import ROUTE_KEYWORDS, ROUTE_MATCHER as MATCHER  # noqa: E402
+
+
+
+def baseline_scores(message):
+    """原先的分类：每次调用逐个关键词做 `in` 判断，不记录位置，共享关键词重复计数"""
+    message_lower = message.lower()
+    return {route: sum(1 for kw in keywords if kw in message_lower) for route, keywords in ROUTE_KEYWORDS.items()}
+
+
+def matcher_scores(message):
+    return MATCHER.match(message).scores
+
+
+def journal(length, keyword_ratio, seed=0):
+    """拼接出的日记文本：keyword_ratio 为关键词片段所占比例"""
+    rng = random.Random(seed)
+    keywords = [kw for words in ROUTE_KEYWORDS.values() for kw in words]
+    fillers = ["今天上班有点忙，", "晚上和朋友吃了饭。", "天气不错，", "went to the office, ", "看了一部电影，"]
+    parts, size = [], 0
+    while size < length:
+        part = rng.choice(keywords) if rng.random() < keyword_ratio else rng.choice(fillers)
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)
+
+
+def main():
+    cases = [
+        ("short message", "最近月经推迟了，压力很大，睡眠也不好"),
+        ("3.7k-char keyword-dense journal", journal(3700, 0.5)),
+        ("12.5k-char typical journal", journal(12500, 0.05, seed=1)),
+    ]
+    for name, text in cases:
+        rows = []
+        for label, func in (("baseline", baseline_scores), ("matcher", matcher_scores)):
+            number = 200
+            best = min(timeit.repeat(lambda: func(text), number=number, repeat=5)) / number
+            rows.append(f"{label} {best * 1000:.3f} ms")
+        print(f"{name:34s} " + "  ".join(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 各Agent以 agent/ 为根目录导入（from shared.xxx import ...）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,174 @@
+import math
+import random
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from shared import analytics_numpy  # noqa: E402
+from fertility_agent.agent import analyze_bbt_pattern  # noqa: E402
+from lifestyle_agent.agent import analyze_sleep_trend, calculate_lifestyle_score  # noqa: E402
+from nutrition_agent.agent import analyze_hydration_status, calculate_nutrition_score  # noqa: E402
+from symptom_mood_agent.agent import analyze_mood_trends, analyze_symptom_patterns  # noqa: E402
+
+START = date(2026, 1, 1)
+SLEEP_QUALITIES = ["Excellent", "Good", "Fair", "Poor", "Very Poor", "Unknown"]
+STRESS_LEVELS = ["Low", "Moderate", "High", "Very High", "Unknown"]
+SYMPTOMS = ["Cramps", "Headache", "Bloating", "Fatigue", ""]
+MOODS = ["Happy", "Anxious", "Irritable", "Calm"]
+
+
+def days(rng, count, steps=(1, 1, 1, 2, 5)):
+    day = START + timedelta(days=rng.randint(0, 30))
+    for _ in range(count):
+        yield day.isoformat()
+        day += timedelta(days=rng.choice(steps))
+
+
+def maybe(rng, value, missing=0.1):
+    """以一定概率去掉字段或换成非数值，覆盖缺失值和原样保存的取值"""
+    roll = rng.random()
+    if roll < missing / 2:
+        return None
+    if roll < missing:
+        return "n/a"
+    return value
+
+
+def record(**fields):
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+def random_user(rng):
+    water = [
+        record(date=day, water_intake_ml=maybe(rng, rng.choice((rng.randint(0, 3000), rng.uniform(0, 3000.0)))))
+        for day in days(rng, rng.randint(0, 12))
+    ]
+    supplements = [{"date": day, "supplement_type": "Iron"} for day in days(rng, rng.randint(0, 9))]
+    sleep = [
+        record(
+            date=day,
+            sleep_duration_hours=maybe(rng, round(rng.uniform(3, 12), 1)),
+            sleep_quality=rng.choice(SLEEP_QUALITIES) if rng.random() > 0.1 else None,
+        )
+        for day in days(rng, rng.randint(0, 12))
+    ]
+    stress = [
+        record(date=day, stress_level=rng.choice(STRESS_LEVELS) if rng.random() > 0.1 else None)
+        for day in days(rng, rng.randint(0, 10))
+    ]
+    shift = rng.randint(5, 20)
+    bbt = [
+        record(
+            date=day,
+            temperature=maybe(rng, round(36.3 + (0.35 if index >= shift else 0) + rng.uniform(-0.1, 0.1), 2), 0.05),
+        )
+        for index, day in enumerate(days(rng, rng.randint(0, 40), (1,) * 12 + (2, 5)))
+    ]
+    symptoms = [
+        record(date=day, symptom_type=rng.choice(SYMPTOMS), severity=maybe(rng, rng.randint(1, 10)))
+        for day in days(rng, rng.randint(0, 15))
+    ]
+    moods = [
+        record(date=day, mood_type=rng.choice(MOODS), intensity=maybe(rng, rng.uniform(1, 10)))
+        for day in days(rng, rng.randint(0, 15))
+    ]
+    return {
+        "nutrition_data": {"daily_nutrition": water, "supplements": supplements},
+        "lifestyle_data": {"sleep_records": sleep, "stress_tracking": stress},
+        "fertility_data": {"basal_body_temperature": bbt},
+        "symptom_mood_data": {"symptoms": symptoms, "moods": moods},
+    }
+
+
+def python_scores(user):
+    nutrition, lifestyle = user["nutrition_data"], user["lifestyle_data"]
+    fertility, symptom_mood = user["fertility_data"], user["symptom_mood_data"]
+    return {
+        "nutrition_score": calculate_nutrition_score(nutrition),
+        "hydration_status": analyze_hydration_status(nutrition),
+        "lifestyle_score": calculate_lifestyle_score(lifestyle),
+        "sleep_quality_trend": analyze_sleep_trend(lifestyle.get("sleep_records") or []),
+        "bbt_analysis": analyze_bbt_pattern(fertility.get("basal_body_temperature") or []),
+        "symptom_patterns": analyze_symptom_patterns(symptom_mood.get("symptoms") or []),
+        "mood_trends": analyze_mood_trends(symptom_mood.get("moods") or []),
+    }
+
+
+def assert_same(numpy_result, python_result):
+    """逐位一致，包括数值类型；NaN与NaN视为相同"""
+    assert type(numpy_result) is type(python_result)
+    if isinstance(python_result, dict):
+        assert list(numpy_result) == list(python_result)
+        for key in python_result:
+            assert_same(numpy_result[key], python_result[key])
+    elif isinstance(python_result, float) and math.isnan(python_result):
+        assert math.isnan(numpy_result)
+    else:
+        assert numpy_result == python_result
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_scores_match_python_helpers(seed):
+    rng = random.Random(seed)
+    users = [random_user(rng) for _ in range(60)]
+
+    for user, scored in zip(users, analytics_numpy.score_users(users)):
+        assert_same(scored, python_scores(user))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_single_user_wrappers_match_python_helpers(seed):
+    rng = random.Random(100 + seed)
+    for _ in range(20):
+        user = random_user(rng)
+        nutrition, lifestyle = user["nutrition_data"], user["lifestyle_data"]
+        fertility, symptom_mood = user["fertility_data"], user["symptom_mood_data"]
+        assert_same(analytics_numpy.calculate_nutrition_score(nutrition), calculate_nutrition_score(nutrition))
+        assert_same(analytics_numpy.analyze_hydration_status(nutrition), analyze_hydration_status(nutrition))
+        assert_same(analytics_numpy.calculate_lifestyle_score(lifestyle), calculate_lifestyle_score(lifestyle))
+        assert_same(analytics_numpy.analyze_sleep_trend(lifestyle["sleep_records"]), analyze_sleep_trend(lifestyle["sleep_records"]))
+        assert_same(
+            analytics_numpy.analyze_bbt_pattern(fertility["basal_body_temperature"]),
+            analyze_bbt_pattern(fertility["basal_body_temperature"]),
+        )
+        assert_same(
+            analytics_numpy.analyze_symptom_patterns(symptom_mood["symptoms"]),
+            analyze_symptom_patterns(symptom_mood["symptoms"]),
+        )
+        assert_same(analytics_numpy.analyze_mood_trends(symptom_mood["moods"]), analyze_mood_trends(symptom_mood["moods"]))
+
+
+def test_empty_inputs():
+    empty = {"nutrition_data": {}, "lifestyle_data": {}, "fertility_data": {}, "symptom_mood_data": {}}
+    assert analytics_numpy.score_users([]) == []
+    empty_lists = {
+        "nutrition_data": {"daily_nutrition": [], "supplements": []},
+        "lifestyle_data": {"sleep_records": [], "stress_tracking": []},
+        "fertility_data": {"basal_body_temperature": []},
+        "symptom_mood_data": {"symptoms": [], "moods": []},
+    }
+    for user in (empty, {}, empty_lists):
+        (scored,) = analytics_numpy.score_users([user])
+        assert_same(scored, python_scores({key: user.get(key) or {} for key in empty}))
+
+
+def test_nan_values():
+    nan = float("nan")
+    user = {
+        "nutrition_data": {"daily_nutrition": [{"date": "2026-01-01", "water_intake_ml": nan}, {"date": "2026-01-02", "water_intake_ml": 2500}]},
+        "lifestyle_data": {"sleep_records": [
+            {"date": f"2026-01-0{day}", "sleep_duration_hours": nan if day == 2 else 8, "sleep_quality": "Good"}
+            for day in range(1, 5)
+        ]},
+        "fertility_data": {"basal_body_temperature": [
+            {"date": (START + timedelta(days=day)).isoformat(), "temperature": nan if day == 4 else 36.3 + (0.4 if day >= 8 else 0)}
+            for day in range(14)
+        ]},
+        "symptom_mood_data": {
+            "symptoms": [{"date": "2026-01-01", "symptom_type": "Cramps", "severity": nan}, {"date": "2026-01-02", "symptom_type": "Cramps", "severity": 4}],
+            "moods": [{"date": "2026-01-01", "mood_type": "Calm", "intensity": nan}],
+        },
+    }
+    assert_same(analytics_numpy.score_users([user])[0], python_scores(user))
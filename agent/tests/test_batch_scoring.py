@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("copilotkit")
+
+import json  # noqa: E402
+import sqlite3  # noqa: E402
+
+from shared.batch_scoring import changed_blocks, refresh_state, score_sqlite  # noqa: E402
+from shared.summaries import SUMMARY_FIELD, get_summary_provider  # noqa: E402
+
+
+def sample_state():
+    return {
+        "nutrition_data": {
+            "daily_nutrition": [{"date": "2026-10-01", "water_intake_ml": 1800}],
+            "supplements": [{"date": "2026-10-01", "supplement_type": "Iron"}],
+        },
+        "lifestyle_data": {
+            "sleep_records": [{"date": "2026-10-01", "sleep_duration_hours": 7.5, "sleep_quality": "Good"}],
+            "stress_tracking": [],
+        },
+    }
+
+
+def test_refresh_keeps_analyzed_version_and_is_stable():
+    state = refresh_state(sample_state())
+    # 模拟一次模型分析：洞察记下分析时的数据版本
+    state["insights_data"]["analyzed_version"] = state["insights_data"]["state_version"]
+
+    refreshed = refresh_state(state)
+
+    assert refreshed["insights_data"]["analyzed_version"] == state["insights_data"]["state_version"]
+    assert changed_blocks(state, refreshed) == []
+
+
+def stale_state():
+    """洞察由旧的评分规则算出，摘要是按旧洞察发布的"""
+    state = refresh_state(sample_state())
+    nutrition = {**state["nutrition_data"], "nutrition_insights": {"nutrition_score": 10, "hydration_status": "无数据"}}
+    nutrition[SUMMARY_FIELD] = get_summary_provider("nutrition_data").publish(nutrition)
+    return {**state, "nutrition_data": nutrition}
+
+
+def test_refresh_republishes_stale_summaries():
+    state = stale_state()
+    refreshed = refresh_state(state)
+
+    nutrition = refreshed["nutrition_data"]
+    assert nutrition[SUMMARY_FIELD] == get_summary_provider("nutrition_data").publish(nutrition)
+    assert nutrition[SUMMARY_FIELD]["nutrition_score"] == nutrition["nutrition_insights"]["nutrition_score"]
+    paths = [path for path, _ in changed_blocks(state, refreshed)]
+    assert ("nutrition_data", "nutrition_insights") in paths
+    assert ("nutrition_data", SUMMARY_FIELD) in paths
+    # 没有变化的领域摘要不重写
+    assert ("lifestyle_data", SUMMARY_FIELD) not in paths
+
+
+def test_sqlite_writes_back_refreshed_summaries(tmp_path):
+    db_path = str(tmp_path / "users.db")
+    connection = sqlite3.connect(db_path)
+    connection.execute("CREATE TABLE user_states (state TEXT)")
+    connection.execute("INSERT INTO user_states (state) VALUES (?)", (json.dumps(stale_state(), ensure_ascii=False),))
+    connection.commit()
+    connection.close()
+
+    stats = score_sqlite(db_path, workers=1)
+
+    connection = sqlite3.connect(db_path)
+    (stored,) = connection.execute("SELECT state FROM user_states").fetchone()
+    connection.close()
+    nutrition = json.loads(stored)["nutrition_data"]
+    assert stats.changed == 1
+    assert nutrition[SUMMARY_FIELD] == get_summary_provider("nutrition_data").read(nutrition)
+    assert nutrition[SUMMARY_FIELD]["nutrition_score"] == nutrition["nutrition_insights"]["nutrition_score"]
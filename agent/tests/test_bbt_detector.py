@@ -0,0 +1,74 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from fertility_agent import bbt
+from fertility_agent.bbt import analyze_bbt, build_detector_state, detect_bbt_shift, update_detector_state
+from shared.merge import LAST_WRITE_WINS, collection, merge_collection_results
+
+START = date(2026, 1, 1)
+SPECS = {"basal_body_temperature": collection("date", policy=LAST_WRITE_WINS)}
+
+
+def temperature(rng, day):
+    """28天周期：第15天起进入高温相，偶尔有无效读数"""
+    if rng.random() < 0.03:
+        return rng.choice((None, "n/a", 42.0))
+    return round(36.3 + (0.4 if day % 28 >= 14 else 0) + rng.uniform(-0.08, 0.08), 2)
+
+
+def batches(rng, days=150):
+    """按日期写入的批次；偶尔漏测几天、补录更早的日期或改写已有体温"""
+    day = 0
+    while day < days:
+        records = []
+        for _ in range(rng.randint(1, 4)):
+            day += rng.choice((1,) * 12 + (2, 5))
+            records.append({"date": (START + timedelta(days=day)).isoformat(), "temperature": temperature(rng, day)})
+        if rng.random() < 0.1:
+            earlier = rng.randint(0, day)
+            records.append({"date": (START + timedelta(days=earlier)).isoformat(), "temperature": temperature(rng, earlier)})
+        yield records
+
+
+@pytest.mark.parametrize("seed", range(15))
+def test_incremental_state_matches_full_rebuild(seed):
+    rng = random.Random(seed)
+    data = {"basal_body_temperature": []}
+    state = build_detector_state([])
+    detected = False
+
+    for records in batches(rng):
+        results = merge_collection_results(data, {"basal_body_temperature": records}, SPECS)
+        state = update_detector_state(state, data["basal_body_temperature"], results["basal_body_temperature"])
+        data = {"basal_body_temperature": results["basal_body_temperature"].records}
+
+        merged = data["basal_body_temperature"]
+        assert state == build_detector_state(merged)
+        analysis = analyze_bbt(merged, state)
+        assert analysis == detect_bbt_shift(merged)
+        detected = detected or analysis["ovulation_detected"]
+
+    assert detected
+
+
+def test_appending_later_readings_does_not_rebuild(monkeypatch):
+    rng = random.Random(0)
+    records = [
+        {"date": (START + timedelta(days=day)).isoformat(), "temperature": temperature(rng, day)}
+        for day in range(40)
+    ]
+    data = {"basal_body_temperature": records[:20]}
+    state = build_detector_state(data["basal_body_temperature"])
+    expected = build_detector_state(records)
+
+    def rebuild(_records):
+        raise AssertionError("只追加了更晚的体温，不应整体重建")
+
+    monkeypatch.setattr(bbt, "build_detector_state", rebuild)
+    results = merge_collection_results(data, {"basal_body_temperature": records[20:]}, SPECS)
+    state = update_detector_state(state, data["basal_body_temperature"], results["basal_body_temperature"])
+
+    assert state == expected
+    assert analyze_bbt(records, state)["ovulation_detected"]
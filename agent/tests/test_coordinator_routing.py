@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("copilotkit")
+
+from main_coordinator.agent import AgentRoute, select_fan_out_routes  # noqa: E402
+
+
+def test_fans_out_on_exclusive_hits_in_several_record_domains():
+    assert select_fan_out_routes("今天跑步30分钟，喝水1500ml") == [AgentRoute.NUTRITION, AgentRoute.EXERCISE]
+
+
+@pytest.mark.parametrize("message", [
+    "给我一个补铁的食谱，最近月经量大",
+    "分析一下我最近的睡眠和运动情况",
+    "我压力很大",
+    "帮我做个html页面",
+])
+def test_does_not_fan_out(message):
+    assert select_fan_out_routes(message) == []
+
+
+def test_llm_router_sees_last_user_message(monkeypatch):
+    import asyncio
+
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+    import main_coordinator.agent as coordinator
+
+    seen = []
+
+    class FakeModel:
+        async def ainvoke(self, messages, config=None):
+            seen.extend(messages)
+            return AIMessage(content="你好")
+
+    async def no_exit(config):
+        return True
+
+    monkeypatch.setattr(coordinator, "get_model_with_tools", lambda *args, **kwargs: FakeModel())
+    monkeypatch.setattr(coordinator, "copilotkit_exit", no_exit)
+    messages = [
+        HumanMessage(content="你好"),
+        AIMessage(content="", tool_calls=[{"id": "call-1", "name": "route_to_agent", "args": {}}]),
+        ToolMessage(content="正在为您连接到专门助手...", tool_call_id="call-1"),
+    ]
+    asyncio.run(coordinator.chat_node({"messages": messages}, {}))
+
+    assert "用户最新消息：\"你好\"" in seen[-1].content
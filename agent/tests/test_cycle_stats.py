@@ -0,0 +1,156 @@
+import random
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import pytest
+
+from cycle_tracker_agent import cycle_stats
+from cycle_tracker_agent.cycle_stats import (
+    cycle_statistics, derive_cycles, forecast_cycle, predict, prediction_cache_stats, refresh_cycle_data,
+)
+
+START = date(2025, 1, 1)
+FLOWS = ["Heavy", "Medium", "Light"]
+
+
+def period_days(rng, cycles=10):
+    """连续若干个周期的经期记录，按日期排序；部分周期第一天只有点滴出血"""
+    days, start = [], 0
+    for _ in range(cycles):
+        length = rng.randint(4, 6)
+        for offset in range(length):
+            flow = "Spotting" if offset == 0 and rng.random() < 0.2 else FLOWS[min(offset // 2, 2)]
+            days.append({"date": (START + timedelta(days=start + offset)).isoformat(), "flow_intensity": flow})
+        start += rng.randint(24, 34) + (40 if rng.random() < 0.05 else 0)
+    return days
+
+
+def turns(rng, days):
+    """每轮记录1-3天；偶尔补录更早的日期、改写已有的流量或补录一个月经开始日期"""
+    position = 0
+    while position < len(days):
+        count = rng.randint(1, 3)
+        incoming = [dict(day) for day in days[position:position + count]]
+        position += count
+        roll = rng.random()
+        if roll < 0.08 and position > count:
+            incoming.append(dict(rng.choice(days[:position - count])))
+        elif roll < 0.16 and position > count:
+            overwritten = dict(rng.choice(days[:position]))
+            overwritten["flow_intensity"] = rng.choice(FLOWS)
+            incoming.append(overwritten)
+        new_cycle_data = {"current_cycle": {"period_days": incoming}}
+        if rng.random() < 0.05:
+            recorded = START - timedelta(days=rng.randint(20, 60))
+            new_cycle_data["cycle_history"] = [{"start_date": recorded.isoformat()}]
+        yield new_cycle_data
+
+
+@pytest.mark.parametrize("seed", range(15))
+def test_incremental_refresh_matches_full_rebuild(seed):
+    rng = random.Random(seed)
+    cycle_data = {}
+    for new_cycle_data in turns(rng, period_days(rng)):
+        # 去掉缓存后由全部经期记录重建
+        rebuilt, _ = refresh_cycle_data({k: v for k, v in cycle_data.items() if k != "cycle_cache"}, new_cycle_data)
+        cycle_data, _ = refresh_cycle_data(cycle_data, new_cycle_data)
+
+        assert cycle_data == rebuilt
+        cycles = derive_cycles(cycle_data["period_log"], cycle_data["recorded_starts"])
+        assert cycle_data["cycle_history"] == cycles[:-1]
+        assert cycle_data["current_cycle"].get("start_date") == (cycles[-1]["start_date"] if cycles else None)
+
+
+def test_days_in_current_cycle_only_rederive_the_current_cycle(monkeypatch):
+    rng = random.Random(0)
+    days = period_days(rng, cycles=4)
+    cycle_data, _ = refresh_cycle_data({}, {"current_cycle": {"period_days": days[:-1]}})
+
+    derived_since = []
+    derive = cycle_stats.derive_cycles
+
+    def tracking_derive(period_log, recorded_starts=(), since=None):
+        derived_since.append(since)
+        return derive(period_log, recorded_starts, since)
+
+    monkeypatch.setattr(cycle_stats, "derive_cycles", tracking_derive)
+    refreshed, summary = refresh_cycle_data(cycle_data, {"current_cycle": {"period_days": days[-1:]}})
+
+    assert derived_since == [cycle_data["current_cycle"]["start_date"]]
+    assert summary.inserted == 1
+    assert refreshed["cycle_history"] == cycle_data["cycle_history"]
+
+
+@pytest.fixture
+def prediction_cache(monkeypatch):
+    """每个用例使用空的预测缓存"""
+    monkeypatch.setattr(cycle_stats, "_predictions", OrderedDict())
+    monkeypatch.setattr(cycle_stats, "_prediction_stats", {"hits": 0, "misses": 0, "evictions": 0})
+
+
+def history(*lengths):
+    cycles, start = [], START
+    for length in lengths:
+        cycles.append({"start_date": start.isoformat(), "cycle_length": length})
+        start += timedelta(days=length)
+    return cycles, start.isoformat()
+
+
+def test_forecast_cache_hit_and_miss(prediction_cache):
+    cycles, current_start = history(28, 30, 27)
+
+    stats, predictions = forecast_cycle(current_start, cycles)
+    assert prediction_cache_stats()["misses"] == 1
+    assert (stats, predictions) == (cycle_statistics(cycles), predict(current_start, cycle_statistics(cycles)))
+
+    # 返回的是新字典，调用方修改不影响缓存
+    stats["regularity"] = "已修改"
+    predictions["next_period_date"] = None
+    # 只有周期长度参与缓存键，其余字段不同也命中
+    assert forecast_cycle(current_start, [{**cycle, "average_flow": "Heavy"} for cycle in cycles]) == (
+        cycle_statistics(cycles), predict(current_start, cycle_statistics(cycles)),
+    )
+    assert prediction_cache_stats()["hits"] == 1
+
+
+def test_forecast_cache_is_invalidated_by_new_cycles(prediction_cache):
+    def period(offset, length=5):
+        return [{"date": (START + timedelta(days=offset + day)).isoformat(), "flow_intensity": "Medium"} for day in range(length)]
+
+    cycle_data, _ = refresh_cycle_data({}, {"current_cycle": {"period_days": period(0) + period(28)}})
+    assert prediction_cache_stats() == {"hits": 0, "misses": 1, "evictions": 0, "size": 1, "hit_rate": 0.0}
+
+    # 当前周期内的经期记录不改变开始日期和周期长度：命中
+    same_cycle, _ = refresh_cycle_data(cycle_data, {"current_cycle": {"period_days": period(33, 1)}})
+    assert prediction_cache_stats()["hits"] == 1
+    assert same_cycle["predictions"] == cycle_data["predictions"]
+
+    # 新的月经开始：上一个周期结束，缓存键变化，重新计算
+    new_cycle, _ = refresh_cycle_data(same_cycle, {"current_cycle": {"period_days": period(58)}})
+    assert prediction_cache_stats()["misses"] == 2
+    current_start = (START + timedelta(days=58)).isoformat()
+    assert new_cycle["current_cycle"]["start_date"] == current_start
+    assert new_cycle["predictions"] == predict(current_start, cycle_statistics(new_cycle["cycle_history"]))
+    assert new_cycle["predictions"] != same_cycle["predictions"]
+
+    # 补录更早的开始日期改变周期长度，同样不会命中旧的预测
+    backfilled, _ = refresh_cycle_data(new_cycle, {"current_cycle": {"period_days": period(-30)}})
+    assert prediction_cache_stats()["misses"] == 3
+    assert backfilled["predictions"] == predict(current_start, cycle_statistics(backfilled["cycle_history"]))
+
+
+def test_forecast_cache_evicts_least_recently_used(prediction_cache, monkeypatch):
+    monkeypatch.setattr(cycle_stats, "PREDICTION_CACHE_SIZE", 2)
+    first, second, third = (history(*lengths) for lengths in ((28,), (30,), (32,)))
+
+    forecast_cycle(first[1], first[0])
+    forecast_cycle(second[1], second[0])
+    forecast_cycle(first[1], first[0])     # first变为最近使用
+    forecast_cycle(third[1], third[0])     # 淘汰second
+    assert prediction_cache_stats()["evictions"] == 1
+
+    forecast_cycle(first[1], first[0])
+    assert prediction_cache_stats()["hits"] == 2
+    forecast_cycle(second[1], second[0])
+    assert prediction_cache_stats()["misses"] == 4
+    assert prediction_cache_stats()["size"] == 2
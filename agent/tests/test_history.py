@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel  # noqa: E402
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langgraph.graph import END, START, MessagesState, StateGraph  # noqa: E402
+
+from shared import history, model_registry  # noqa: E402
+
+
+def conversation(turns):
+    messages = []
+    for turn in range(turns):
+        messages += [HumanMessage(content=f"第{turn}天记录：喝水1500ml"), AIMessage(content=f"已记录第{turn}天")]
+    return messages
+
+
+def test_background_summary_emits_no_stream_events(monkeypatch):
+    summary_model = GenericFakeChatModel(messages=iter([AIMessage(content="用户每天喝水1500ml")]))
+    monkeypatch.setattr(model_registry, "get_model", lambda *args, **kwargs: summary_model)
+    monkeypatch.setattr(history, "HISTORY_SUMMARY_ENABLED", True)
+
+    async def node(state, config):
+        history.window_history(state["messages"], config)
+        # 在节点内部等后台摘要完成，它若继承了节点的回调，事件会出现在这次运行的事件流里
+        await asyncio.gather(*history._pending.values())
+        return {"messages": [AIMessage(content="好的")]}
+
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("chat_node", node)
+    workflow.add_edge(START, "chat_node")
+    workflow.add_edge("chat_node", END)
+    graph = workflow.compile()
+
+    async def run():
+        config = {"configurable": {"thread_id": "summary-stream-test"}}
+        return [
+            event async for event in graph.astream_events(
+                {"messages": conversation(history.HISTORY_KEEP_TURNS + 3)}, config, version="v2"
+            )
+        ]
+
+    events = asyncio.run(run())
+
+    assert not [event for event in events if event["event"].startswith("on_chat_model")]
+    covered, summary = history._cached_summary("summary-stream-test")
+    assert summary == "用户每天喝水1500ml"
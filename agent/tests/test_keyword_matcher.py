@@ -0,0 +1,31 @@
+from shared.keyword_matcher import KeywordMatcher
+
+
+def make_matcher():
+    return KeywordMatcher({
+        "nutrition": ["饮食", "健康饮食", "ml", "water"],
+        "symptom_mood": ["压力", "cramp"],
+        "lifestyle": ["压力", "睡眠"],
+    })
+
+
+def test_reports_offsets_and_overlapping_hits():
+    hits = list(make_matcher().iter_matches("注意健康饮食和睡眠"))
+    assert [(hit.offset, hit.keyword) for hit in hits] == [(2, "健康饮食"), (4, "饮食"), (7, "睡眠")]
+
+
+def test_shared_keyword_is_split_between_groups():
+    result = make_matcher().match("压力很大，压力")
+    assert result.counts == {"nutrition": 0, "symptom_mood": 1, "lifestyle": 1}
+    assert result.scores["symptom_mood"] == result.scores["lifestyle"] == 0.5
+    assert result.hits["lifestyle"] == ["压力"]
+
+
+def test_ascii_keywords_match_on_word_boundaries_only():
+    matcher = make_matcher()
+    assert matcher.match("帮我做个html页面").counts["nutrition"] == 0
+    assert matcher.match("Watermelon").counts["nutrition"] == 0
+    assert matcher.match("喝了2000ml水").hits["nutrition"] == ["ml"]
+    assert [hit.offset for hit in matcher.iter_matches("html, 2000ml")] == [10]
+    assert matcher.match("Water, 500ml").counts["nutrition"] == 2
+    assert matcher.match("bad cramp today").counts["symptom_mood"] == 1
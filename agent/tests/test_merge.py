@@ -0,0 +1,21 @@
+from shared.merge import LAST_WRITE_WINS, appended, collection, merge_collections
+
+
+def test_appended_keeps_several_entries_per_day_and_drops_exact_repeats():
+    specs = {"nutrition": appended()}
+    existing = {"nutrition": [{"date": "2026-10-01", "meal_notes": "早餐：燕麦"}]}
+    incoming = {"nutrition": [
+        {"date": "2026-10-01", "meal_notes": "午餐：牛肉"},
+        {"date": "2026-10-01", "meal_notes": "早餐：燕麦"},
+    ]}
+    merged, summary = merge_collections(existing, incoming, specs)
+    assert [entry["meal_notes"] for entry in merged["nutrition"]] == ["早餐：燕麦", "午餐：牛肉"]
+    assert (summary.inserted, summary.updated, summary.skipped) == (1, 0, 1)
+
+
+def test_last_write_wins_overwrites_fields_of_the_same_key():
+    specs = {"log": collection("date", policy=LAST_WRITE_WINS)}
+    existing = {"log": [{"date": "2026-10-01", "water_intake_ml": 1500, "note": "a"}]}
+    merged, summary = merge_collections(existing, {"log": [{"date": "2026-10-01", "water_intake_ml": 2000}]}, specs)
+    assert merged["log"] == [{"date": "2026-10-01", "water_intake_ml": 2000, "note": "a"}]
+    assert summary.updated == 1
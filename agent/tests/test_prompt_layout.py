@@ -0,0 +1,77 @@
+import json
+from datetime import date
+from importlib import import_module
+
+import pytest
+
+pytest.importorskip("copilotkit")
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+
+from shared.history import window_history  # noqa: E402
+from shared.prompt_layout import layout_messages, prompt_layout_stats  # noqa: E402
+from shared.tool_schemas import get_tool_definitions  # noqa: E402
+
+# (布局名, 模块, 固定指令, 每轮上下文, 工具, 状态字段, 第一轮数据, 第二轮数据)
+AGENTS = [
+    ("coordinator", "main_coordinator.agent", "ROUTER_INSTRUCTIONS", "build_router_context", "ROUTER_TOOL",
+     "nutrition_data", None, {"daily_nutrition": []}),
+    ("cycle_tracker", "cycle_tracker_agent.agent", "CYCLE_TRACKER_INSTRUCTIONS", "build_cycle_context", "CYCLE_TRACKER_TOOL",
+     "cycle_data", {"period_log": []}, {"period_log": [{"date": "2026-10-01", "flow_intensity": "Medium"}]}),
+    ("menstrual", "menstrual_agent.agent", "MENSTRUAL_INSTRUCTIONS", "build_cycle_context", "UPDATE_CYCLE_TOOL",
+     "cycle_data", {"symptoms": []}, {"symptoms": [{"date": "2026-10-01", "symptom_type": "Cramps", "severity": 6}]}),
+    ("symptom_mood", "symptom_mood_agent.agent", "SYMPTOM_MOOD_INSTRUCTIONS", "build_symptom_mood_context", "SYMPTOM_MOOD_TOOL",
+     "tracking_data", {"symptoms": [], "moods": []}, {"symptoms": [{"date": "2026-10-01", "symptom_type": "Headache", "severity": 7}], "moods": []}),
+    ("fertility", "fertility_agent.agent", "FERTILITY_INSTRUCTIONS", "build_fertility_context", "FERTILITY_TOOL",
+     "fertility_data", {"basal_body_temperature": []}, {"basal_body_temperature": [{"date": "2026-10-01", "temperature": 36.4}]}),
+    ("nutrition", "nutrition_agent.agent", "NUTRITION_INSTRUCTIONS", "build_nutrition_context", "NUTRITION_TOOL",
+     "nutrition_data", {"daily_nutrition": []}, {"daily_nutrition": [{"date": "2026-10-01", "water_intake_ml": 1500}]}),
+    ("exercise", "exercise_agent.agent", "EXERCISE_INSTRUCTIONS", "build_exercise_context", "EXERCISE_TOOL",
+     "exercise_data", {"daily_activities": []}, {"daily_activities": [{"date": "2026-10-01", "exercise_type": "Yoga", "duration_minutes": 30}]}),
+    ("lifestyle", "lifestyle_agent.agent", "LIFESTYLE_INSTRUCTIONS", "build_lifestyle_context", "LIFESTYLE_TOOL",
+     "lifestyle_data", {"sleep_records": []}, {"sleep_records": [{"date": "2026-10-01", "sleep_duration_hours": 7, "sleep_quality": "Good"}]}),
+    ("health_insights", "health_insights_agent.agent", "HEALTH_INSIGHTS_INSTRUCTIONS", "build_health_insights_context", "HEALTH_INSIGHTS_TOOL",
+     "insights_data", {"overall_health_score": 50}, {"overall_health_score": 72, "pattern_insights": ["经前头痛"]}),
+    ("recipe", "recipe_agent.agent", "RECIPE_INSTRUCTIONS", "build_recipe_context", "GENERATE_RECIPE_TOOL",
+     "recipe", None, {"title": "红枣枸杞粥", "ingredients": [{"name": "红枣", "quantity": "5颗"}]}),
+]
+
+
+def turn(module, context_name, state_key, data, messages):
+    state = {state_key: data, "messages": messages}
+    build_context = getattr(module, context_name)
+    if context_name == "build_router_context":
+        return build_context(state, messages[-1].content)
+    return build_context(state)
+
+
+@pytest.mark.parametrize("agent", AGENTS, ids=[agent[0] for agent in AGENTS])
+def test_prefix_is_byte_identical_across_turns(agent):
+    layout_name, module_name, instructions_name, context_name, tool_name, state_key, first_data, second_data = agent
+    module = import_module(module_name)
+    first_messages = [HumanMessage(content="第一条消息：最近记录一下")]
+    second_messages = first_messages + [AIMessage(content="好的"), HumanMessage(content="第二条消息：换个问题")]
+    changes_before = prompt_layout_stats()["prefix_changes"]
+
+    turns = []
+    for data, messages in ((first_data, first_messages), (second_data, second_messages)):
+        context = turn(module, context_name, state_key, data, messages)
+        layout = layout_messages(layout_name, getattr(module, instructions_name), context, window_history(messages))
+        tools = json.dumps(get_tool_definitions([getattr(module, tool_name)]), ensure_ascii=False, sort_keys=True)
+        turns.append((tools, layout))
+
+    (first_tools, first_layout), (second_tools, second_layout) = turns
+    # 工具定义和第一条系统消息（固定指令）逐字节相同
+    assert first_tools.encode("utf-8") == second_tools.encode("utf-8")
+    assert first_layout[0].content.encode("utf-8") == second_layout[0].content.encode("utf-8")
+    # 对话历史接在固定指令之后，上一轮的消息在下一轮中原样保留
+    assert [message.content for message in second_layout[1:len(first_messages) + 1]] == [m.content for m in first_messages]
+    # 每轮变化的数据和用户消息只出现在最后一条上下文消息里
+    assert first_layout[-1].content != second_layout[-1].content
+    assert "第二条消息" not in second_layout[0].content
+    if layout_name == "coordinator":
+        # 主协调器把用户最新消息放在当前上下文中
+        assert "第二条消息" in second_layout[-1].content
+    assert date.today().isoformat() not in second_layout[0].content
+    assert date.today().isoformat() in second_layout[-1].content
+    assert prompt_layout_stats()["prefix_changes"] == changes_before
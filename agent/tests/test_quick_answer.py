@@ -0,0 +1,26 @@
+import pytest
+
+from health_insights_agent.quick_answer import is_overview_request
+
+
+@pytest.mark.parametrize("message", [
+    "分析一下我的健康状况",
+    "帮我分析一下",
+    "我最近的健康状况怎么样？",
+    "给我一份健康报告吧",
+    "How is my health?",
+])
+def test_overview_requests(message):
+    assert is_overview_request(message)
+
+
+@pytest.mark.parametrize("message", [
+    "分析一下我的睡眠",
+    "分析一下头痛",
+    "分析一下体重",
+    "健康状况和经期有关系吗",
+    "analyze my health and sleep",
+    "",
+])
+def test_specific_questions_are_not_overview_requests(message):
+    assert not is_overview_request(message)
@@ -0,0 +1,47 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip("copilotkit")
+
+from lifestyle_agent.agent import extract_lifestyle_log  # noqa: E402
+from nutrition_agent.agent import extract_nutrition_log  # noqa: E402
+from symptom_mood_agent.agent import extract_symptom_mood_log  # noqa: E402
+
+TODAY = date(2026, 10, 17)
+
+
+@pytest.mark.parametrize("message, severity", [
+    ("头痛7分", 7),
+    ("头痛7", 7),
+    ("headache 6/10", 6),
+    ("有点头痛", 3),
+    ("头痛得厉害", 8),
+])
+def test_symptom_logs(message, severity):
+    assert extract_symptom_mood_log(message, TODAY) == {
+        "tracking_data": {"symptoms": [{"date": "2026-10-17", "symptom_type": "Headache", "severity": severity}]}
+    }
+
+
+def test_lifestyle_and_nutrition_logs():
+    assert extract_lifestyle_log("昨晚睡了6小时质量一般", TODAY) == {
+        "lifestyle_data": {"sleep_records": [{"date": "2026-10-16", "sleep_duration_hours": 6, "sleep_quality": "Fair"}]}
+    }
+    assert extract_nutrition_log("喝了2000ml水", TODAY) == {
+        "nutrition_data": {"daily_nutrition": [{"date": "2026-10-17", "water_intake_ml": 2000}]}
+    }
+
+
+@pytest.mark.parametrize("extract, message", [
+    (extract_symptom_mood_log, "头痛3天了"),
+    (extract_symptom_mood_log, "头痛30分钟"),
+    (extract_symptom_mood_log, "痛经好了"),
+    (extract_symptom_mood_log, "头痛减轻了"),
+    (extract_nutrition_log, "今天要喝2000ml水"),
+    (extract_nutrition_log, "计划喝2000ml水"),
+    (extract_lifestyle_log, "想睡8小时"),
+    (extract_lifestyle_log, "要睡8小时"),
+])
+def test_non_logs_fall_back_to_the_model(extract, message):
+    assert extract(message, TODAY) is None
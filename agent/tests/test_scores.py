@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+import pytest
+
+from shared import scores
+from shared.scores import ScoreProvider, field_score, score_cache_stats, score_summaries
+
+PROVIDERS = {
+    "nutrition_data": ScoreProvider("nutrition", "营养健康", field_score("score")),
+    "exercise_data": ScoreProvider("exercise", "运动健康", field_score("score")),
+}
+WEIGHTS = {"nutrition": 0.5, "exercise": 0.5}
+
+
+@pytest.fixture(autouse=True)
+def score_cache(monkeypatch):
+    """每个用例使用空的评分缓存和测试用的评分提供者"""
+    monkeypatch.setattr(scores, "_providers", dict(PROVIDERS))
+    monkeypatch.setattr(scores, "_scores", OrderedDict())
+    monkeypatch.setattr(scores, "_stats", {"hits": 0, "misses": 0, "evictions": 0})
+
+
+def summary(version, score):
+    return {"schema_version": 2, "version": version, "score": score}
+
+
+def test_same_versions_hit_the_cache():
+    result = score_summaries({"nutrition_data": summary("n1", 80), "exercise_data": summary("e1", 60)}, WEIGHTS)
+    assert (result.overall, result.domains) == (70, {"nutrition": 80, "exercise": 60})
+
+    # 版本相同即命中，不再读取摘要内容
+    again = score_summaries({"nutrition_data": summary("n1", 0), "exercise_data": summary("e1", 0)}, WEIGHTS)
+    assert again is result
+    assert score_cache_stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1, "hit_rate": 0.5}
+
+
+def test_new_versions_and_weights_miss_the_cache():
+    first = score_summaries({"nutrition_data": summary("n1", 80), "exercise_data": summary("e1", 60)}, WEIGHTS)
+
+    updated = score_summaries({"nutrition_data": summary("n2", 40), "exercise_data": summary("e1", 60)}, WEIGHTS)
+    assert updated.overall == 50
+    assert updated.state_version != first.state_version
+
+    reweighted = score_summaries(
+        {"nutrition_data": summary("n1", 80), "exercise_data": summary("e1", 60)},
+        {"nutrition": 1.0, "exercise": 0.0},
+    )
+    assert reweighted.overall == 80
+    assert reweighted.state_version == first.state_version
+    assert score_cache_stats()["misses"] == 3
+
+
+def test_missing_domains_are_part_of_the_key():
+    partial = score_summaries({"nutrition_data": summary("n1", 80), "exercise_data": None}, WEIGHTS)
+    assert (partial.overall, partial.domains["exercise"]) == (80, None)
+
+    full = score_summaries({"nutrition_data": summary("n1", 80), "exercise_data": summary("e1", 60)}, WEIGHTS)
+    assert full.overall == 70
+    assert score_cache_stats()["misses"] == 2
+
+
+def test_least_recently_used_scores_are_evicted(monkeypatch):
+    monkeypatch.setattr(scores, "HEALTH_SCORE_CACHE_SIZE", 2)
+    states = [{"nutrition_data": summary(f"n{index}", 50 + index), "exercise_data": None} for index in range(3)]
+
+    score_summaries(states[0], WEIGHTS)
+    score_summaries(states[1], WEIGHTS)
+    score_summaries(states[0], WEIGHTS)     # states[0]变为最近使用
+    score_summaries(states[2], WEIGHTS)     # 淘汰states[1]
+    assert score_cache_stats()["evictions"] == 1
+
+    score_summaries(states[0], WEIGHTS)
+    assert score_cache_stats()["hits"] == 2
+    score_summaries(states[1], WEIGHTS)
+    assert score_cache_stats()["misses"] == 4
+    assert score_cache_stats()["size"] == 2
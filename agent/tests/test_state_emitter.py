@@ -0,0 +1,89 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+pytest.importorskip("copilotkit")
+
+from shared import state_emitter  # noqa: E402
+from shared.state_emitter import emit_state, state_emitter_stats  # noqa: E402
+
+WINDOW = 0.05
+CONFIG = {"configurable": {"thread_id": "thread-1", "checkpoint_ns": "cycle_tracker:task-1"}}
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """记录实际推送给CopilotKit的状态，每个用例使用新的节点记录和统计"""
+    states = []
+
+    async def copilotkit_emit_state(config, state):
+        states.append(state)
+        return True
+
+    monkeypatch.setattr(state_emitter, "copilotkit_emit_state", copilotkit_emit_state)
+    monkeypatch.setattr(state_emitter, "STATE_EMIT_DEBOUNCE", WINDOW)
+    monkeypatch.setattr(state_emitter, "_sessions", OrderedDict())
+    monkeypatch.setattr(state_emitter, "_stats", dict.fromkeys(state_emitter._stats, 0))
+    return states
+
+
+def state(count):
+    return {"messages": ["很长的对话"], "cycle_data": {"period_days": list(range(count))}}
+
+
+def test_messages_are_not_emitted_and_unchanged_state_is_skipped(sent):
+    async def run():
+        assert await emit_state(CONFIG, state(1))
+        await asyncio.sleep(WINDOW)
+        return await emit_state(CONFIG, {**state(1), "messages": ["新消息"]})
+
+    assert asyncio.run(run()) is False
+    assert sent == [{"cycle_data": {"period_days": [0]}}]
+    assert state_emitter_stats()["unchanged"] == 1
+
+
+def test_debounced_states_flush_the_latest_one(sent):
+    async def run():
+        results = [await emit_state(CONFIG, state(count)) for count in (1, 2, 3)]
+        assert sent == [{"cycle_data": {"period_days": [0]}}]
+        await asyncio.sleep(WINDOW * 2)
+        return results
+
+    assert asyncio.run(run()) == [True, False, False]
+    # 窗口结束时只补发最新的状态，中间状态被合并
+    assert sent == [{"cycle_data": {"period_days": [0]}}, {"cycle_data": {"period_days": [0, 1, 2]}}]
+    stats = state_emitter_stats()
+    assert (stats["coalesced"], stats["flushed"], stats["sent"]) == (2, 1, 2)
+
+
+def test_pending_state_is_dropped_when_the_latest_matches_what_was_sent(sent):
+    async def run():
+        await emit_state(CONFIG, state(1))
+        await emit_state(CONFIG, state(2))
+        await emit_state(CONFIG, state(1))
+        await asyncio.sleep(WINDOW * 2)
+
+    asyncio.run(run())
+    assert sent == [{"cycle_data": {"period_days": [0]}}]
+
+
+def test_final_emit_is_immediate_and_cancels_the_pending_flush(sent):
+    async def run():
+        await emit_state(CONFIG, state(1))
+        await emit_state(CONFIG, state(2))
+        assert await emit_state(CONFIG, state(3), final=True)
+        await asyncio.sleep(WINDOW * 2)
+
+    asyncio.run(run())
+    assert sent == [{"cycle_data": {"period_days": [0]}}, {"cycle_data": {"period_days": [0, 1, 2]}}]
+    assert state_emitter_stats()["flushed"] == 0
+    assert state_emitter_stats()["sessions"] == 0
+
+
+def test_emits_without_a_node_namespace_are_always_sent(sent):
+    async def run():
+        return [await emit_state({}, state(1)) for _ in range(2)]
+
+    assert asyncio.run(run()) == [True, True]
+    assert len(sent) == 2
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from collections import OrderedDict
+
+import pytest
+
+pytest.importorskip("copilotkit")
+
+from langchain_core.messages import AIMessageChunk  # noqa: E402
+
+from cycle_tracker_agent import cycle_stats  # noqa: E402
+from cycle_tracker_agent.agent import CYCLE_TRACKER_STREAM  # noqa: E402
+from cycle_tracker_agent.cycle_stats import prediction_cache_stats, refresh_cycle_data  # noqa: E402
+from shared import streaming  # noqa: E402
+from shared.merge import LAST_WRITE_WINS, collection  # noqa: E402
+from shared.streaming import StreamTarget, merge_preview, stream_response  # noqa: E402
+
+SPECS = {"sleep_records": collection("date", policy=LAST_WRITE_WINS)}
+SLEEP_STREAM = StreamTarget("lifestyle_data", "update_lifestyle_data", "lifestyle_data", merge_preview("lifestyle_data", SPECS))
+
+
+class FakeModel:
+    """把工具参数JSON按固定长度切成分片流式返回"""
+
+    def __init__(self, tool, arguments, size=12):
+        self.text = json.dumps(arguments)
+        self.tool = tool
+        self.size = size
+
+    async def astream(self, messages, config):
+        for index in range(0, len(self.text), self.size):
+            call = {"index": 0, "args": self.text[index:index + self.size]}
+            if index == 0:
+                call.update(name=self.tool, id="call_1")
+            yield AIMessageChunk(content="", tool_call_chunks=[call])
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    """记录推送的状态预览，每个分片都解析"""
+    states = []
+
+    async def emit_state(config, state, final=False):
+        states.append(state)
+        return True
+
+    monkeypatch.setattr(streaming, "emit_state", emit_state)
+    monkeypatch.setattr(streaming, "STREAM_STATE_INTERVAL", 0.0)
+    return states
+
+
+def test_merge_preview_matches_the_final_merge():
+    existing = {"sleep_records": [{"date": "2026-10-01", "hours": 7}], "goals": {"hours": 8}}
+    preview = merge_preview("lifestyle_data", SPECS)(
+        {"lifestyle_data": existing},
+        {"sleep_records": [{"date": "2026-10-01", "hours": 6}, {"date": "2026-10-02", "hours": 8}]},
+    )
+
+    assert preview == {
+        "sleep_records": [{"date": "2026-10-01", "hours": 6}, {"date": "2026-10-02", "hours": 8}],
+        "goals": {"hours": 8},
+    }
+    assert existing["sleep_records"] == [{"date": "2026-10-01", "hours": 7}]
+
+
+def test_stream_response_pushes_merged_previews(emitted):
+    arguments = {"lifestyle_data": {"sleep_records": [
+        {"date": "2026-10-02", "hours": 8},
+        {"date": "2026-10-03", "hours": 6},
+    ]}}
+    state = {"lifestyle_data": {"sleep_records": [{"date": "2026-10-01", "hours": 7}]}}
+
+    response = asyncio.run(stream_response(FakeModel("update_lifestyle_data", arguments), [], {}, state, SLEEP_STREAM))
+
+    assert response.tool_calls[0]["args"] == arguments
+    assert emitted
+    # 仍在生成的最后一条记录不推送，预览保留已有记录
+    for preview in emitted:
+        records = preview["lifestyle_data"]["sleep_records"]
+        assert records[0] == {"date": "2026-10-01", "hours": 7}
+        assert {"date": "2026-10-03", "hours": 6} not in records
+    assert emitted[-1]["lifestyle_data"]["sleep_records"][-1] == {"date": "2026-10-02", "hours": 8}
+
+
+def test_other_tools_are_not_previewed(emitted):
+    arguments = {"lifestyle_data": {"sleep_records": [{"date": "2026-10-02"}, {"date": "2026-10-03"}]}}
+
+    asyncio.run(stream_response(FakeModel("update_nutrition_data", arguments), [], {}, {}, SLEEP_STREAM))
+
+    assert emitted == []
+
+
+def test_cycle_preview_does_not_touch_the_prediction_cache(emitted, monkeypatch):
+    monkeypatch.setattr(cycle_stats, "_predictions", OrderedDict())
+    monkeypatch.setattr(cycle_stats, "_prediction_stats", {"hits": 0, "misses": 0, "evictions": 0})
+    days = [{"date": f"2026-09-{day:02d}", "flow_intensity": "Medium"} for day in (1, 2, 3, 29, 30)]
+    cycle_data, _ = refresh_cycle_data({}, {"current_cycle": {"period_days": days[:3]}})
+    before = prediction_cache_stats()
+
+    arguments = {"cycle_data": {"current_cycle": {"period_days": days[3:]}}}
+    asyncio.run(stream_response(
+        FakeModel("update_cycle_data", arguments, size=8), [], {}, {"cycle_data": cycle_data}, CYCLE_TRACKER_STREAM,
+    ))
+
+    assert emitted
+    assert emitted[-1]["cycle_data"]["current_cycle"]["start_date"] == "2026-09-29"
+    assert prediction_cache_stats() == before
@@ -0,0 +1,79 @@
+from shared import summaries
+from shared.summaries import SUMMARY_FIELD, SUMMARY_SCHEMA_VERSION, SummaryProvider, domain_summaries
+
+
+def build(data):
+    build.calls += 1
+    records = data.get("sleep_records") or []
+    return {"count": len(records), "insights": data.get("insights")}
+
+
+build.calls = 0
+PROVIDER = SummaryProvider(("sleep_records",), build, ignored=("aggregates",))
+
+DATA = {
+    "sleep_records": [{"date": "2026-10-01", "hours": 7}, {"date": "2026-10-02", "hours": 8}],
+    "insights": {"average_hours": 7.5},
+}
+
+
+def test_version_tracks_collections_and_insights():
+    version = PROVIDER.version(DATA)
+
+    appended = {**DATA, "sleep_records": DATA["sleep_records"] + [{"date": "2026-10-03", "hours": 6}]}
+    assert PROVIDER.version(appended) != version
+    assert PROVIDER.version({**DATA, "insights": {"average_hours": 7}}) != version
+    # 摘要本身和ignored中的辅助字段不影响版本
+    assert PROVIDER.version({**DATA, SUMMARY_FIELD: {"count": 99}, "aggregates": {"total": 2}}) == version
+
+
+def test_publish_stamps_schema_and_version():
+    summary = PROVIDER.publish(DATA)
+
+    assert summary == {
+        "schema_version": SUMMARY_SCHEMA_VERSION,
+        "version": PROVIDER.version(DATA),
+        "count": 2,
+        "insights": {"average_hours": 7.5},
+    }
+
+
+def test_read_returns_the_current_summary_without_rebuilding():
+    data = {**DATA, SUMMARY_FIELD: PROVIDER.publish(DATA)}
+    calls = build.calls
+
+    summary = PROVIDER.read(data)
+    assert summary == data[SUMMARY_FIELD]
+    assert summary is not data[SUMMARY_FIELD]
+    assert build.calls == calls
+
+
+def test_read_rebuilds_stale_summaries():
+    published = PROVIDER.publish(DATA)
+    # 发布后数据又变化（离线重算洞察），摘要版本过期
+    recomputed = {**DATA, "insights": {"average_hours": 8}, SUMMARY_FIELD: published}
+    assert PROVIDER.read(recomputed) == PROVIDER.publish(recomputed)
+    assert PROVIDER.read(recomputed)["insights"] == {"average_hours": 8}
+
+    # 旧结构的摘要即使版本相同也重建
+    old_schema = {**DATA, SUMMARY_FIELD: {**published, "schema_version": SUMMARY_SCHEMA_VERSION - 1, "count": 0}}
+    assert PROVIDER.read(old_schema) == published
+
+    assert PROVIDER.read({**DATA, SUMMARY_FIELD: "旧文本摘要"}) == published
+    assert PROVIDER.read(DATA) == published
+
+
+def test_domain_summaries_skip_domains_without_data(monkeypatch):
+    monkeypatch.setattr(summaries, "_providers", {"sleep_data": PROVIDER})
+
+    result = domain_summaries(
+        {"sleep_data": DATA, "empty_data": {}, "placeholder_data": {"initialized": False}},
+        ("sleep_data", "empty_data", "placeholder_data", "missing_data"),
+    )
+
+    assert result == {
+        "sleep_data": PROVIDER.publish(DATA),
+        "empty_data": None,
+        "placeholder_data": None,
+        "missing_data": None,
+    }
@@ -0,0 +1,82 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("copilotkit")
+
+from shared.merge import merge_collection_results  # noqa: E402
+from symptom_mood_agent.agent import (  # noqa: E402
+    SYMPTOM_MOOD_MERGE_SPECS, analyze_mood_trends, analyze_symptom_patterns, build_symptom_mood_patterns,
+)
+from symptom_mood_agent.aggregates import build_aggregates, top_types, type_stats, update_aggregates  # noqa: E402
+
+START = date(2026, 1, 1)
+SYMPTOMS = ["Cramps", "Headache", "Bloating", "Fatigue", "Acne", ""]
+MOODS = ["Happy", "Anxious", "Irritable", "Calm"]
+
+
+def batch(rng):
+    """一次写入：新日期的记录，以及对已有日期的改写（同日同类型按最新描述覆盖）"""
+    def day():
+        return (START + timedelta(days=rng.randint(0, 40))).isoformat()
+
+    def value(low, high):
+        return rng.choice((rng.randint(low, high), round(rng.uniform(low, high), 1), None, "n/a"))
+
+    return {
+        "symptoms": [
+            {"date": day(), "symptom_type": rng.choice(SYMPTOMS), "severity": value(1, 10)}
+            for _ in range(rng.randint(0, 6))
+        ],
+        "moods": [
+            {"date": day(), "mood_type": rng.choice(MOODS), "intensity": value(1, 10)}
+            for _ in range(rng.randint(0, 4))
+        ],
+    }
+
+
+def assert_same_aggregates(incremental, rebuilt):
+    assert incremental["schema_version"] == rebuilt["schema_version"]
+    for name in ("symptoms", "moods"):
+        kind, expected = incremental[name], rebuilt[name]
+        assert kind["records"] == expected["records"]
+        assert kind["tail"] == expected["tail"]
+        assert type_stats(kind) == type_stats(expected)
+        assert top_types(kind) == top_types(expected)
+        for record_type, stats in expected["types"].items():
+            for field in ("count", "sum", "min", "max", "last_seen", "order"):
+                assert kind["types"][record_type][field] == stats[field], (name, record_type, field)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_updates_match_full_rebuild(seed):
+    rng = random.Random(seed)
+    tracking_data = {"symptoms": [], "moods": [], "aggregates": build_aggregates({})}
+
+    for _ in range(15):
+        results = merge_collection_results(tracking_data, batch(rng), SYMPTOM_MOOD_MERGE_SPECS)
+        merged = {name: result.records for name, result in results.items()}
+        aggregates = update_aggregates(tracking_data, results)
+        tracking_data = {**merged, "aggregates": aggregates}
+
+        assert_same_aggregates(aggregates, build_aggregates(merged))
+        # 读取累计统计得到的模式分析与逐条统计一致
+        patterns = build_symptom_mood_patterns(tracking_data)
+        expected = analyze_symptom_patterns(merged["symptoms"])
+        assert patterns["common_symptoms"] == expected["common_symptoms"]
+        assert patterns["severity_analysis"] == expected["severity_analysis"]
+        assert patterns["mood_trends"] == analyze_mood_trends(merged["moods"])
+
+
+def test_stale_aggregates_are_rebuilt():
+    tracking_data = {"symptoms": [{"date": "2026-01-01", "symptom_type": "Cramps", "severity": 6}], "moods": []}
+    # 记录被外部改动过，统计对应的是更早的记录
+    stale = {**tracking_data, "aggregates": build_aggregates({"symptoms": [], "moods": []})}
+    incoming = {"symptoms": [{"date": "2026-01-02", "symptom_type": "Cramps", "severity": 4}]}
+
+    results = merge_collection_results(stale, incoming, SYMPTOM_MOOD_MERGE_SPECS)
+    aggregates = update_aggregates(stale, results)
+
+    assert type_stats(aggregates["symptoms"]) == {"Cramps": (2, 10)}
+    assert_same_aggregates(aggregates, build_aggregates({name: result.records for name, result in results.items()}))
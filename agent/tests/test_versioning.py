@@ -0,0 +1,28 @@
+from shared.merge import LAST_WRITE_WINS, collection, merge_collections
+from shared.versioning import REVISION_FIELD, data_version, next_revision
+
+SPECS = {"sleep_records": collection("date", policy=LAST_WRITE_WINS)}
+
+
+def write(data, incoming):
+    merged, summary = merge_collections(data, incoming, SPECS)
+    return {**data, **merged, REVISION_FIELD: next_revision(data, summary.changed)}
+
+
+def test_editing_an_older_record_changes_the_version():
+    data = write({}, {"sleep_records": [
+        {"date": "2026-10-01", "sleep_duration_hours": 7},
+        {"date": "2026-10-02", "sleep_duration_hours": 8},
+    ]})
+    edited = write(data, {"sleep_records": [{"date": "2026-10-01", "sleep_duration_hours": 5}]})
+
+    assert edited["sleep_records"][-1] == data["sleep_records"][-1]
+    assert data_version(edited, tuple(SPECS)) != data_version(data, tuple(SPECS))
+
+
+def test_repeated_write_keeps_the_version():
+    data = write({}, {"sleep_records": [{"date": "2026-10-01", "sleep_duration_hours": 7}]})
+    repeated = write(data, {"sleep_records": [{"date": "2026-10-01", "sleep_duration_hours": 7}]})
+
+    assert repeated[REVISION_FIELD] == data[REVISION_FIELD] == 1
+    assert data_version(repeated, tuple(SPECS)) == data_version(data, tuple(SPECS))